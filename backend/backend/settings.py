@@ -139,3 +139,47 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Listing price table (services/price_resolver.py)
+# Max age in seconds before the cached CropPrices table is reloaded
+
+PRICE_RESOLVER_TTL = 300
+
+
+# Buffered CustomerAction writer (services/action_log.py)
+# ACTION_LOG_SYNC writes in the request instead of the background thread
+
+ACTION_LOG_SYNC = False
+ACTION_LOG_BATCH_SIZE = 200
+ACTION_LOG_FLUSH_INTERVAL = 1.0
+ACTION_LOG_MAX_QUEUE = 10000
+ACTION_LOG_MAX_RETRIES = 5
+ACTION_LOG_RETRY_BACKOFF = 0.5
+ACTION_LOG_MAX_RETRY_ROWS = 10000
+
+
+# CustomerAction retention (services/action_partitions.py)
+# Months kept live (current month included); older months are moved to
+# ACTION_LOG_ARCHIVE_DIR by `manage.py archive_customer_actions`
+
+ACTION_LOG_RETENTION_MONTHS = 12
+ACTION_LOG_ARCHIVE_DIR = BASE_DIR / 'archive' / 'customer_actions'
+
+
+# In-process background tasks (services/background.py)
+# BACKGROUND_TASKS_SYNC runs tasks inline instead of on worker threads
+
+BACKGROUND_TASKS_SYNC = False
+BACKGROUND_WORKERS = 2
+BACKGROUND_RETRY_BACKOFF = 30
+BACKGROUND_MAX_BACKOFF = 3600
+
+
+# Weather refresh (services/weather_refresh.py)
+# Data older than WEATHER_REFRESH_INTERVAL seconds is served as-is while one
+# background refresh runs; `manage.py refresh_weather --interval` keeps it fresh
+
+WEATHER_REFRESH_INTERVAL = 3600
+WEATHER_RETRY_AFTER = 60
+WEATHER_REFRESH_LEASE = 600
@@ -5,6 +5,7 @@ from .models import *
 admin.site.register(Users)
 admin.site.register(Farmer)
 admin.site.register(Customer)
+admin.site.register(WeatherLocation)
 #user1
 #user1@gmail.com
 #testuser1
\ No newline at end of file
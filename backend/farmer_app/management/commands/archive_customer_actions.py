@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from services.action_partitions import (
+    archive_month, ensure_partitions, is_partitioned, months_to_archive, retention_start,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move CustomerAction months older than the retention window into gzipped "
+        "JSON-lines archives, and create the upcoming monthly partitions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months',
+            type=int,
+            default=getattr(settings, "ACTION_LOG_RETENTION_MONTHS", 12),
+            help='Months to keep live, current month included'
+        )
+        parser.add_argument(
+            '--dir',
+            default=str(getattr(settings, "ACTION_LOG_ARCHIVE_DIR", "archive/customer_actions")),
+            help='Directory for the archive files'
+        )
+        parser.add_argument(
+            '--ahead',
+            type=int,
+            default=3,
+            help='Future monthly partitions to create (PostgreSQL)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List the months that would be archived and stop'
+        )
+
+    def handle(self, *args, **options):
+        months = max(options["months"], 1)
+        directory = options["dir"]
+
+        mode = "partitioned (PostgreSQL)" if is_partitioned() else "single table"
+        self.stdout.write(f"CustomerAction log: {mode}; keeping actions since {retention_start(months):%Y-%m-%d}")
+
+        if not options["dry_run"]:
+            for name in ensure_partitions(options["ahead"]):
+                self.stdout.write(f"  -> Created partition {name}")
+
+        targets = months_to_archive(months, dry_run=options["dry_run"])
+        if not targets:
+            self.stdout.write(self.style.SUCCESS("Nothing to archive."))
+            return
+
+        if options["dry_run"]:
+            for month in targets:
+                self.stdout.write(f"  -> Would archive {month:%Y-%m}")
+            return
+
+        for month in targets:
+            count, path = archive_month(month, directory)
+            if path:
+                self.stdout.write(self.style.SUCCESS(f"  -> {month:%Y-%m}: {count} actions -> {path}"))
+            else:
+                self.stdout.write(f"  -> {month:%Y-%m}: empty, removed")
+
+        self.stdout.write(self.style.SUCCESS("Archive completed."))
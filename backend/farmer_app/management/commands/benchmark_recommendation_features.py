@@ -0,0 +1,119 @@
+import datetime
+import random
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from farmer_app.models import Crop, Customer, CustomerAction, Users
+from services.action_stats import ACTION_SCORES, INTEREST_DECAY_PER_DAY, rebuild_stats
+from services.recommendations import action_feature_matrix, serving_features
+
+
+def pandas_features(actions, now):
+    """The old path: every action row into a DataFrame, grouped with lambdas."""
+    df = pd.DataFrame(list(actions.values("crop_id", "action", "price_at_action", "discount_at_action",
+                                          "stock_at_action", "timestamp")))
+    df["score"] = df["action"].map(ACTION_SCORES)
+    recency = (now - pd.to_datetime(df["timestamp"], utc=True)).dt.total_seconds() / (60*60*24)
+    df["weighted_score"] = df["score"] * np.exp(-INTEREST_DECAY_PER_DAY * recency)
+    for column in ["price_at_action", "discount_at_action", "stock_at_action"]:
+        df[column] = df[column].astype(float)
+    return df.groupby("crop_id").agg(
+        total_weighted_score=("weighted_score", "sum"),
+        add_count=("score", lambda x: (x == 1).sum()),
+        remove_count=("score", lambda x: (x == -1).sum()),
+        purchase_count=("score", lambda x: (x == 3).sum()),
+        avg_price=("price_at_action", "mean"),
+        avg_discount=("discount_at_action", "mean"),
+        avg_stock=("stock_at_action", "mean"),
+    ).to_numpy()
+
+
+class Command(BaseCommand):
+    help = (
+        "Time per-customer feature aggregation: raw rows + pandas groupby, SQL aggregate, "
+        "and the CustomerCropStats rollup. Test data is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--actions',
+            type=int,
+            action='append',
+            help='Actions of the test customer (repeatable, default 10000 and 100000)'
+        )
+        parser.add_argument(
+            '--crops',
+            type=int,
+            default=30,
+            help='Distinct crops the actions are spread over'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Runs per method; the best time is reported'
+        )
+
+    def best_of(self, repeat, fn):
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - started)
+        return min(times), result
+
+    def handle(self, *args, **options):
+        sizes = options.get('actions') or [10000, 100000]
+        crop_ids = list(Crop.objects.order_by("pk").values_list("pk", flat=True)[:options['crops']])
+        if not crop_ids:
+            raise CommandError("No crops in the database")
+
+        for size in sizes:
+            with transaction.atomic():
+                self.benchmark(size, crop_ids, options['repeat'])
+                transaction.set_rollback(True)
+
+    def benchmark(self, size, crop_ids, repeat):
+        user = Users.objects.create(
+            name="benchmark", email=f"benchmark-{time.time_ns()}@example.com", password="!", role="customer"
+        )
+        customer = Customer.objects.get(user=user)
+
+        now = timezone.now()
+        rng = random.Random(42)
+        CustomerAction.objects.bulk_create([
+            CustomerAction(
+                customer_id=customer,
+                crop_id=rng.choice(crop_ids),
+                action=rng.choice(list(ACTION_SCORES)),
+                price_at_action=rng.randint(100, 10000) / 100,
+                discount_at_action=rng.randint(0, 3000) / 100,
+                stock_at_action=rng.randint(1, 200),
+                timestamp=now - datetime.timedelta(seconds=rng.randint(0, 180 * 24 * 60 * 60)),
+            )
+            for _ in range(size)
+        ], batch_size=5000)
+        rebuild_stats([customer.pk])
+
+        actions = CustomerAction.objects.filter(customer_id=customer)
+        pandas_time, baseline = self.best_of(repeat, lambda: pandas_features(actions, now))
+        sql_time, (_, X) = self.best_of(repeat, lambda: action_feature_matrix(actions, now))
+        rollup_time, _ = self.best_of(repeat, lambda: serving_features([customer]))
+
+        if not np.allclose(baseline, X):
+            raise CommandError("SQL aggregate does not match the pandas features")
+
+        self.stdout.write(self.style.SUCCESS(f"{size} actions, {len(X)} crops (best of {repeat}):"))
+        self.stdout.write(f"  raw rows + pandas groupby: {pandas_time * 1000:9.1f} ms ({size} rows fetched)")
+        self.stdout.write(
+            f"  SQL aggregate:             {sql_time * 1000:9.1f} ms ({len(X)} rows fetched, "
+            f"{pandas_time / sql_time:.1f}x)"
+        )
+        self.stdout.write(
+            f"  CustomerCropStats rollup:  {rollup_time * 1000:9.1f} ms ({len(X)} rows fetched, "
+            f"{pandas_time / rollup_time:.1f}x)"
+        )
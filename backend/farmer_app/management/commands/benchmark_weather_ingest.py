@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from farmer_app.models import WeatherLocation
+from services.weather_ingest import ingest_weather
+from services.weather_stub import StubWeatherServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark weather ingestion offline against the local stub server "
+        "(services/weather_stub.py). Test locations are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--locations',
+            type=int,
+            default=500,
+            help='Test locations to ingest'
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.05,
+            help='Stub response delay in seconds'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            action='append',
+            help='Concurrency to try (repeatable, default 1, 10, 20 and 50)'
+        )
+
+    def handle(self, *args, **options):
+        count = options['locations']
+        with StubWeatherServer(latency=options['latency']) as stub, transaction.atomic():
+            WeatherLocation.objects.bulk_create([
+                # Spread over India's bounding box
+                WeatherLocation(
+                    name=f"benchmark-{i}",
+                    latitude=8 + (i * 7919 % 2900) / 100,
+                    longitude=68 + (i * 104729 % 2900) / 100,
+                )
+                for i in range(count)
+            ])
+            locations = list(WeatherLocation.objects.filter(name__startswith="benchmark-").order_by("pk"))
+
+            self.stdout.write(f"{count} locations, stub latency {options['latency'] * 1000:.0f} ms")
+            for concurrency in options.get('concurrency') or [1, 10, 20, 50]:
+                result = ingest_weather(locations, url=stub.url, concurrency=concurrency, timeout=30)
+                self.stdout.write(
+                    f"  concurrency {concurrency:>4}: {result['elapsed']:7.2f}s  "
+                    f"{result['locations_per_sec']:8.1f} locations/sec  "
+                    f"({result['saved']} saved, {len(result['failed'])} failed)"
+                )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from services.crop_neighbors import DEFAULT_NEIGHBORS, build_crop_neighbors
+
+
+class Command(BaseCommand):
+    help = "Nightly: rebuild the crop co-purchase neighbours (CropNeighbor) and crop purchaser counts."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--k',
+            type=int,
+            default=DEFAULT_NEIGHBORS,
+            help='Neighbours kept per crop'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Purchased (customer, crop) pairs read per query'
+        )
+        parser.add_argument(
+            '--min-co-purchases',
+            type=int,
+            default=1,
+            help='Ignore crop pairs bought together by fewer customers'
+        )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        self.stdout.write(self.style.WARNING(f"[{started.strftime('%Y-%m-%d %H:%M:%S')}] === BUILDING CROP NEIGHBOURS ==="))
+
+        stats = build_crop_neighbors(
+            k=options['k'], chunk_size=options['chunk_size'], min_co_purchases=options['min_co_purchases']
+        )
+
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['customers']} purchasing customers, {stats['pairs']} crop pairs, "
+            f"{stats['neighbors']} neighbour rows written in {elapsed:.1f}s."
+        ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from services.weather_ingest import ingest_weather
+
+
+class Command(BaseCommand):
+    help = "Fetch today's weather for every active WeatherLocation concurrently and upsert it."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Requests in flight (default WEATHER_CONCURRENCY)'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            help='Seconds per request (default WEATHER_TIMEOUT)'
+        )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        self.stdout.write(self.style.WARNING(f"[{started.strftime('%Y-%m-%d %H:%M:%S')}] === INGESTING WEATHER ==="))
+
+        result = ingest_weather(concurrency=options.get('concurrency'), timeout=options.get('timeout'))
+
+        for name, error in result['failed']:
+            self.stdout.write(self.style.ERROR(f"  -> {name}: {error}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved {result['saved']} of {result['locations']} locations in {result['elapsed']:.1f}s "
+            f"({result['locations_per_sec']:.1f} locations/sec)."
+        ))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from services.action_stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the CustomerCropStats rollup from the CustomerAction log (backfills, repairs)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--customer_id',
+            type=int,
+            action='append',
+            help='Rebuild only this customer (repeatable)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rollup rows per bulk insert'
+        )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        customer_ids = options.get('customer_id')
+
+        scope = f"customers {customer_ids}" if customer_ids else "all customers"
+        self.stdout.write(f"Rebuilding CustomerCropStats for {scope}...")
+
+        written = rebuild_stats(customer_ids, batch_size=options['batch_size'])
+
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} rollup rows in {elapsed:.1f}s."))
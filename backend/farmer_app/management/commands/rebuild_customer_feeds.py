@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from farmer_app.models import CustomerFeed, CustomerRecommendation
+from services.customer_feed import refresh_feeds
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized CustomerFeed (preferred market items) from recommendations and live listings."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--customer_id',
+            type=int,
+            action='append',
+            help='Rebuild only this customer (repeatable)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Customers per ranking query'
+        )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        customer_ids = options.get('customer_id')
+        if not customer_ids:
+            # Customers with recommendations, plus stale feeds to clear
+            customer_ids = set(CustomerRecommendation.objects.values_list('customer_id', flat=True).distinct())
+            customer_ids.update(CustomerFeed.objects.values_list('customer_id', flat=True).distinct())
+
+        written = refresh_feeds(customer_ids, chunk_size=options['chunk_size'])
+
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} feed rows in {elapsed:.1f}s."))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from services.weather_refresh import refresh_weather
+
+
+class Command(BaseCommand):
+    help = "Fetch today's weather and re-run the 7-day prediction, once (cron) or every --interval seconds."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            help='Keep running and refresh every N seconds'
+        )
+
+    def handle(self, *args, **options):
+        interval = options.get('interval')
+
+        while True:
+            started = timezone.now()
+            self.stdout.write(self.style.WARNING(f"[{started.strftime('%Y-%m-%d %H:%M:%S')}] === REFRESHING WEATHER ==="))
+            try:
+                if refresh_weather():
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Weather refreshed in {(timezone.now() - started).total_seconds():.1f}s."
+                    ))
+                else:
+                    self.stdout.write("Another process is refreshing; skipped.")
+            except Exception as e:
+                if not interval:
+                    raise
+                # Keep the loop alive; the endpoints keep serving the last data
+                self.stdout.write(self.style.ERROR(f"Refresh failed: {type(e).__name__}: {e}"))
+
+            if not interval:
+                return
+            close_old_connections()
+            time.sleep(interval)
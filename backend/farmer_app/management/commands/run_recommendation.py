@@ -2,11 +2,15 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 # Assuming Customer and services are available in the project context
 from farmer_app.models import Customer
-from services.recommendations import get_customer_recommendations
+from services.recommendations import refresh_recommendations_batch
 from services.profile_updater import update_customer_profile # <-- NEW IMPORT
+from services.recommendation_runner import MAX_CHUNK_ATTEMPTS, STAGES, run_chunks, start_or_resume_run
 
 class Command(BaseCommand):
-    help = "Run recommendation pipeline for customers directly. Updates profile first."
+    help = (
+        "Run recommendation pipeline for customers directly. Updates profile first. "
+        "Full runs are checkpointed per chunk and resume after an interruption."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -14,6 +18,29 @@ class Command(BaseCommand):
             type=int,
             help='Run for a specific customer ID'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Worker processes (each with its own DB connection)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Customers per chunk (one model call and one checkpoint each)'
+        )
+        parser.add_argument(
+            '--fresh',
+            action='store_true',
+            help='Start a new run even if the last one was interrupted'
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=MAX_CHUNK_ATTEMPTS,
+            help='Attempts per chunk before the run gives up on it'
+        )
 
     def handle(self, *args, **options):
         customer_id = options.get('customer_id')
@@ -21,51 +48,60 @@ class Command(BaseCommand):
         self.stdout.write(self.style.WARNING(f"[{timezone.now().strftime('%Y-%m-%d %H:%M:%S')}] === STARTING RECOMMENDATION ENGINE ==="))
 
         if customer_id:
-            customers = Customer.objects.filter(pk=customer_id)
-            if not customers.exists():
-                self.stdout.write(self.style.ERROR(f"No customer found with ID {customer_id}"))
-                return
+            self.run_single(customer_id)
+            return
+
+        run, resumed = start_or_resume_run(options['chunk_size'], fresh=options['fresh'])
+        remaining = run.chunks.exclude(status='done').count()
+        if resumed:
+            self.stdout.write(f"Resuming run {run.pk}: {remaining} of {run.chunks.count()} chunks left.")
         else:
-            customers = Customer.objects.all()
+            self.stdout.write(f"Run {run.pk}: {run.total_customers} customers in {remaining} chunks.")
+        self.stdout.write(f"Workers: {options['workers']}\n")
 
-        self.stdout.write(f"Found {customers.count()} customers to process.\n")
+        def report(result):
+            line = f"  -> Customers {result['first']}..{result['last']}: {result['customers']} in {sum(result[s] for s in STAGES):.2f}s"
+            if result['status'] == 'failed':
+                self.stdout.write(self.style.ERROR(
+                    f"{line} FAILED, attempt {result['attempts']} of {options['max_attempts']} ({result['error']})"
+                ))
+            else:
+                self.stdout.write(line)
 
-        for customer in customers:
-            # FIX: robustness for User name display (kept your existing logic)
-            user_name = f"Customer {customer.pk}" # Default
-            if hasattr(customer, 'user'):
-                u = customer.user
-                user_name = getattr(u, 'name', getattr(u, 'username', getattr(u, 'email', str(u))))
+        summary = run_chunks(
+            run, workers=options['workers'], on_result=report, max_attempts=max(options['max_attempts'], 1)
+        )
 
-            self.stdout.write(f"Processing: {user_name} (ID: {customer.pk})...")
+        # ---------------- Summary ----------------
+        self.stdout.write("-" * 30)
+        self.stdout.write(
+            f"Processed {summary['customers']} customers in {summary['chunks']} chunks "
+            f"({summary['retries']} retries), {summary['elapsed']:.1f}s ({summary['throughput']:.1f} customers/sec)"
+        )
+        busy = sum(summary[stage] for stage in STAGES) or 1.0
+        for stage in STAGES:
+            self.stdout.write(f"  {stage:<8} {summary[stage]:8.2f}s  ({summary[stage] / busy:.0%})")
 
-            try:
-                # --- STEP 1: UPDATE CUSTOMER PROFILE ---
-                # This calculates and saves the new features (discount_sensitivity, etc.)
-                self.stdout.write("  -> 1. Recalculating customer profile...")
-                disc, price_elasticity, urgency = update_customer_profile(customer.pk)
-                self.stdout.write(self.style.SUCCESS(
-                    f"  -> Profile updated. Disc: {disc:.2f}, PriceElast: {price_elasticity:.2f}, Urgency: {urgency:.2f}"
-                ))
-                
-                # --- STEP 2: GENERATE RECOMMENDATIONS ---
-                # This uses the new features saved in Step 1 to generate predictions
-                self.stdout.write("  -> 2. Generating recommendations...")
-                recommendations = get_customer_recommendations(customer)
+        if summary['failed']:
+            self.stdout.write(self.style.ERROR(
+                f"\n{summary['failed']} chunks failed {options['max_attempts']} times; "
+                f"run {run.pk} is closed as failed and the next run starts fresh."
+            ))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"\n[{timezone.now().strftime('%Y-%m-%d %H:%M:%S')}] === COMPLETED SUCCESSFULLY ==="))
 
-                if recommendations:
-                    self.stdout.write(self.style.SUCCESS(f"  -> Success! Saved {len(recommendations)} recs."))
-                    for rec in recommendations[:3]:
-                        self.stdout.write(f"      * {rec['crop']}: {rec['purchase_prob']:.2f}")
-                else:
-                    self.stdout.write(self.style.WARNING("  -> No recommendations generated."))
-                
-                self.stdout.write("-" * 30)
+    def run_single(self, customer_id):
+        if not Customer.objects.filter(pk=customer_id).exists():
+            self.stdout.write(self.style.ERROR(f"No customer found with ID {customer_id}"))
+            return
 
-            except Exception as e:
-                # Print the full error but keep the loop going for other customers
-                import traceback
-                self.stdout.write(self.style.ERROR(f"  -> CRASH on Customer {customer.pk}: {str(e)}"))
-                self.stdout.write(traceback.format_exc())
+        disc, price_elasticity, urgency = update_customer_profile(customer_id)
+        self.stdout.write(self.style.SUCCESS(
+            f"  -> Profile updated. Disc: {disc:.2f}, PriceElast: {price_elasticity:.2f}, Urgency: {urgency:.2f}"
+        ))
 
-        self.stdout.write(self.style.SUCCESS(f"\n[{timezone.now().strftime('%Y-%m-%d %H:%M:%S')}] === COMPLETED SUCCESSFULLY ==="))
+        recommendations = refresh_recommendations_batch([customer_id]).get(customer_id, [])
+        self.stdout.write(self.style.SUCCESS(f"  -> Success! Saved {len(recommendations)} recs."))
+        for rec in recommendations[:3]:
+            self.stdout.write(f"      * {rec['crop']}: {rec['purchase_prob']:.2f}")
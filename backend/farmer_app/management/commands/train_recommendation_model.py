@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from services.recommendations import train_global_model
+
+
+class Command(BaseCommand):
+    help = "Train the global purchase-propensity model on all customers and save it as a new version."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--label-days',
+            type=int,
+            default=30,
+            help='Label = purchased the crop within the last N days; features use the actions before that'
+        )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        self.stdout.write(self.style.WARNING(f"[{started.strftime('%Y-%m-%d %H:%M:%S')}] === TRAINING RECOMMENDATION MODEL ==="))
+
+        try:
+            artifact = train_global_model(label_days=options['label_days'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved model v{artifact['version']} in {elapsed:.1f}s. Metrics: {artifact['metrics']}"
+        ))
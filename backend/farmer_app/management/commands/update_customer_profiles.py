@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from services.profile_updater import update_customer_profiles
+
+
+class Command(BaseCommand):
+    help = "Recompute customer profiles (discount sensitivity, price elasticity, stock urgency) in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--customer_id',
+            type=int,
+            action='append',
+            help='Update only this customer (repeatable)'
+        )
+        parser.add_argument(
+            '--only-changed',
+            action='store_true',
+            help='Only customers with actions written since their last profile update'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Customers per bulk update'
+        )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        updated = update_customer_profiles(
+            options.get('customer_id'), only_changed=options['only_changed'], batch_size=options['batch_size']
+        )
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} customer profiles in {elapsed:.1f}s."))
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0019_dailycropforecast'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(fields=['-date_added', '-id'], name='market_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(fields=['price', 'id'], name='market_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(fields=['-discount', '-id'], name='market_discount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(fields=['product_name', '-date_added', '-id'], name='market_name_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(fields=['product_name', 'price', 'id'], name='market_name_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(fields=['farmer', '-date_added', '-id'], name='market_farmer_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['-date_added', '-id'], name='market_instock_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['product_name', '-date_added', '-id'], name='market_instock_name_idx'),
+        ),
+    ]
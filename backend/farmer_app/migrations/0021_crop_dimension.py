@@ -0,0 +1,61 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0020_market_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Crop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CropAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=100, unique=True)),
+                ('crop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='farmer_app.crop')),
+            ],
+        ),
+
+        # Nullable FK columns next to the text columns, filled in by 0022
+        migrations.AddField(
+            model_name='product',
+            name='crop',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='farmer_app.crop'),
+        ),
+        migrations.AddField(
+            model_name='market',
+            name='crop',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='farmer_app.crop'),
+        ),
+        migrations.AddField(
+            model_name='customeraction',
+            name='crop_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='farmer_app.crop'),
+        ),
+        migrations.AddField(
+            model_name='customerrecommendation',
+            name='crop_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='farmer_app.crop'),
+        ),
+        migrations.AddField(
+            model_name='cropprices',
+            name='crop_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='farmer_app.crop'),
+        ),
+        migrations.AddField(
+            model_name='dailycropforecast',
+            name='crop_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='farmer_app.crop'),
+        ),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:31
+
+from django.db import migrations
+from django.db.models import Count
+
+
+# Canonical crop -> aliases, from CROP_MAPPING in ml_model/crop_predict.py
+# plus the FAOSTAT item names and the local (crop_data.csv / frontend) names.
+SEED_CROPS = {
+    'Areca nuts': ['Arecanut'],
+    'Barley': ['Barley-India'],
+    'Castor oil seeds': ['Castor seed'],
+    'Coconuts': ['Coconut', 'Coconuts, in shell'],
+    'Cotton': ['Cotton(lint)', 'Cotton-India', 'Cotton lint, ginned'],
+    'Groundnuts': ['Groundnut', 'Groundnuts-India', 'Groundnuts, excluding shelled'],
+    'Maize': ['Maize-India', 'Maize (corn)', 'Corn'],
+    'Pigeon peas': ['Arhar/Tur', 'Pigeon peas, dry'],
+    'Rice': ['Rice-India'],
+    'Soybeans': ['Soyabean', 'Soybeans-India', 'Soya beans'],
+    'Wheat': ['Wheat-India'],
+    'Bananas': ['Banana'],
+    'Onions': ['Onion', 'Onions and shallots, dry (excluding dehydrated)'],
+    'Potatoes': ['Potato'],
+    'Sugar cane': ['Sugarcane'],
+}
+
+# (model, old text column, new FK field)
+CROP_COLUMNS = [
+    ('product', 'name', 'crop'),
+    ('market', 'product_name', 'crop'),
+    ('customeraction', 'crop', 'crop_ref'),
+    ('customerrecommendation', 'crop', 'crop_ref'),
+    ('cropprices', 'crop', 'crop_ref'),
+    ('dailycropforecast', 'crop', 'crop_ref'),
+]
+
+
+def normalize(name):
+    return (name or '').strip().lower()
+
+
+def populate_crops(apps, schema_editor):
+    Crop = apps.get_model('farmer_app', 'Crop')
+    CropAlias = apps.get_model('farmer_app', 'CropAlias')
+    alias_map = {}
+
+    def add_alias(alias, crop_id):
+        key = normalize(alias)
+        if key not in alias_map:
+            CropAlias.objects.create(alias=key, crop_id=crop_id)
+            alias_map[key] = crop_id
+
+    def resolve(name):
+        key = normalize(name)
+        if key not in alias_map:
+            crop = Crop.objects.create(name=(name or '').strip() or 'Unknown')
+            add_alias(crop.name, crop.id)
+            alias_map[key] = crop.id
+        return alias_map[key]
+
+    for canonical, aliases in SEED_CROPS.items():
+        crop_id = resolve(canonical)
+        for alias in aliases:
+            add_alias(alias, crop_id)
+
+    for model_name, source, target in CROP_COLUMNS:
+        Model = apps.get_model('farmer_app', model_name)
+        for value in Model.objects.values_list(source, flat=True).distinct():
+            Model.objects.filter(**{source: value}).update(**{f'{target}_id': resolve(value)})
+
+
+def dedupe_recommendations(apps, schema_editor):
+    """
+    Aliases of one crop (e.g. 'Wheat' and 'Wheat-India') now share a crop id,
+    so a customer may have several recommendations for it. Keep the most
+    likely one, so 0023 can restore unique (customer, crop).
+    """
+    CustomerRecommendation = apps.get_model('farmer_app', 'CustomerRecommendation')
+    duplicates = (
+        CustomerRecommendation.objects.values('customer_id', 'crop_ref_id')
+        .annotate(rows=Count('id')).filter(rows__gt=1).order_by()
+    )
+    for group in duplicates:
+        rows = CustomerRecommendation.objects.filter(
+            customer_id=group['customer_id'], crop_ref_id=group['crop_ref_id']
+        ).order_by('-purchase_prob', '-id')
+        keep = rows.values_list('id', flat=True).first()
+        rows.exclude(pk=keep).delete()
+
+
+def restore_crop_names(apps, schema_editor):
+    Crop = apps.get_model('farmer_app', 'Crop')
+    names = dict(Crop.objects.values_list('id', 'name'))
+
+    for model_name, source, target in CROP_COLUMNS:
+        if source == target or source in ('name', 'product_name'):
+            continue
+        Model = apps.get_model('farmer_app', model_name)
+        for crop_id in Model.objects.values_list(f'{target}_id', flat=True).distinct():
+            Model.objects.filter(**{f'{target}_id': crop_id}).update(**{source: names.get(crop_id, '')})
+
+
+class Migration(migrations.Migration):
+    # Kept separate from the schema changes: PostgreSQL refuses ALTER TABLE
+    # while deferred FK checks from these updates are pending.
+
+    dependencies = [
+        ('farmer_app', '0021_crop_dimension'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_crops, restore_crop_names),
+        migrations.RunPython(dedupe_recommendations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0022_populate_crops'),
+    ]
+
+    operations = [
+        # Drop the text columns and take over their names
+        migrations.AlterUniqueTogether(
+            name='customerrecommendation',
+            unique_together=set(),
+        ),
+        # A default lets the text columns be re-added when reversing
+        migrations.AlterField(
+            model_name='customeraction',
+            name='crop',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='customerrecommendation',
+            name='crop',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='cropprices',
+            name='crop',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='dailycropforecast',
+            name='crop',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.RemoveField(model_name='customeraction', name='crop'),
+        migrations.RemoveField(model_name='customerrecommendation', name='crop'),
+        migrations.RemoveField(model_name='cropprices', name='crop'),
+        migrations.RemoveField(model_name='dailycropforecast', name='crop'),
+        migrations.RenameField(model_name='customeraction', old_name='crop_ref', new_name='crop'),
+        migrations.RenameField(model_name='customerrecommendation', old_name='crop_ref', new_name='crop'),
+        migrations.RenameField(model_name='cropprices', old_name='crop_ref', new_name='crop'),
+        migrations.RenameField(model_name='dailycropforecast', old_name='crop_ref', new_name='crop'),
+        migrations.AlterField(
+            model_name='product',
+            name='crop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='farmer_app.crop'),
+        ),
+        migrations.AlterField(
+            model_name='market',
+            name='crop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='farmer_app.crop'),
+        ),
+        migrations.AlterField(
+            model_name='customeraction',
+            name='crop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='farmer_app.crop'),
+        ),
+        migrations.AlterField(
+            model_name='customerrecommendation',
+            name='crop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='farmer_app.crop'),
+        ),
+        migrations.AlterField(
+            model_name='cropprices',
+            name='crop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='farmer_app.crop'),
+        ),
+        migrations.AlterField(
+            model_name='dailycropforecast',
+            name='crop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='farmer_app.crop'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='customerrecommendation',
+            unique_together={('customer', 'crop')},
+        ),
+
+        # Market indexes on the integer crop key instead of product_name
+        migrations.RemoveIndex(model_name='market', name='market_name_date_idx'),
+        migrations.RemoveIndex(model_name='market', name='market_name_price_idx'),
+        migrations.RemoveIndex(model_name='market', name='market_instock_name_idx'),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(fields=['crop', '-date_added', '-id'], name='market_crop_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(fields=['crop', 'price', 'id'], name='market_crop_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['crop', '-date_added', '-id'], name='market_instock_crop_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0024_changecounter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customeraction',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
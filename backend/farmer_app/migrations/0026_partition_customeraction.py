@@ -0,0 +1,145 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:40
+
+import datetime
+
+from django.db import migrations, models
+
+# Monthly partitions created up front, counted from the current month;
+# `manage.py archive_customer_actions` keeps creating them after that
+MONTHS_AHEAD = 3
+
+FK_FIELDS = ("customer_id", "crop")
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _bound(month):
+    return datetime.datetime(month.year, month.month, 1, tzinfo=datetime.timezone.utc).isoformat()
+
+
+def _fetch(schema_editor, sql, params=None):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _next_id(schema_editor, table):
+    """Next id to hand out: past both MAX(id) and the current sequence value."""
+    qn = schema_editor.quote_name
+    (sequence,), = _fetch(schema_editor, "SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    (max_id,), = _fetch(schema_editor, f"SELECT COALESCE(MAX(id), 0) FROM {qn(table)}")
+    last_value = 0
+    if sequence:
+        (last_value,), = _fetch(schema_editor, f"SELECT last_value FROM {sequence}")
+    return max(max_id, last_value) + 1
+
+
+def _rename_primary_key(schema_editor, table, new_name):
+    qn = schema_editor.quote_name
+    (name,), = _fetch(
+        schema_editor,
+        "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'",
+        [table],
+    )
+    schema_editor.execute(f"ALTER TABLE {qn(table)} RENAME CONSTRAINT {qn(name)} TO {qn(new_name)}")
+
+
+def _add_foreign_keys(schema_editor, model):
+    # Same index/constraint names Django gave the original table
+    for field_name in FK_FIELDS:
+        field = model._meta.get_field(field_name)
+        schema_editor.execute(schema_editor._create_index_sql(model, fields=[field]))
+        schema_editor.execute(schema_editor._create_fk_sql(model, field, "_fk_%(to_table)s_%(to_column)s"))
+
+
+def partition_customer_actions(apps, schema_editor):
+    """
+    Rebuilds farmer_app_customeraction as a table partitioned by month on
+    timestamp (PostgreSQL only). The primary key becomes (id, timestamp),
+    as PostgreSQL requires the partition key in every unique constraint;
+    id keeps coming from a sequence, so the ORM still treats it as the pk.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    qn = schema_editor.quote_name
+    model = apps.get_model("farmer_app", "CustomerAction")
+    table = model._meta.db_table
+    old = f"{table}_unpartitioned"
+
+    next_id = _next_id(schema_editor, table)
+    schema_editor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(old)}")
+    _rename_primary_key(schema_editor, old, f"{old}_pkey")
+
+    schema_editor.execute(
+        f"CREATE TABLE {qn(table)} (LIKE {qn(old)} INCLUDING CONSTRAINTS, "
+        f"PRIMARY KEY (id, \"timestamp\")) PARTITION BY RANGE (\"timestamp\")"
+    )
+
+    # One partition per month with data, the current month and MONTHS_AHEAD more
+    current = datetime.date.today().replace(day=1)
+    months = {_add_months(current, i) for i in range(MONTHS_AHEAD + 1)}
+    rows = _fetch(schema_editor, f"SELECT DISTINCT date_trunc('month', \"timestamp\" AT TIME ZONE 'UTC') FROM {qn(old)}")
+    months.update(row[0].date() for row in rows)
+
+    for month in sorted(months):
+        schema_editor.execute(
+            f"CREATE TABLE {qn(f'{table}_p{month.year:04d}_{month.month:02d}')} PARTITION OF {qn(table)} "
+            f"FOR VALUES FROM ('{_bound(month)}') TO ('{_bound(_add_months(month, 1))}')"
+        )
+    schema_editor.execute(f"CREATE TABLE {qn(f'{table}_default')} PARTITION OF {qn(table)} DEFAULT")
+
+    schema_editor.execute(f"INSERT INTO {qn(table)} SELECT * FROM {qn(old)}")
+    schema_editor.execute(f"DROP TABLE {qn(old)}")
+
+    sequence = f"{table}_id_seq"
+    schema_editor.execute(f"CREATE SEQUENCE {qn(sequence)} START WITH {next_id} OWNED BY {qn(table)}.id")
+    schema_editor.execute(f"ALTER TABLE {qn(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+
+    # Foreign keys go on after the copy so no deferred FK checks are pending
+    _add_foreign_keys(schema_editor, model)
+
+
+def unpartition_customer_actions(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    qn = schema_editor.quote_name
+    model = apps.get_model("farmer_app", "CustomerAction")
+    table = model._meta.db_table
+    old = f"{table}_partitioned"
+
+    next_id = _next_id(schema_editor, table)
+    schema_editor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(old)}")
+    _rename_primary_key(schema_editor, old, f"{old}_pkey")
+
+    schema_editor.execute(f"CREATE TABLE {qn(table)} (LIKE {qn(old)} INCLUDING CONSTRAINTS, PRIMARY KEY (id))")
+    schema_editor.execute(f"INSERT INTO {qn(table)} SELECT * FROM {qn(old)}")
+    schema_editor.execute(f"DROP TABLE {qn(old)}")  # drops the partitions and the sequence
+
+    schema_editor.execute(
+        f"ALTER TABLE {qn(table)} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (START WITH {next_id})"
+    )
+    _add_foreign_keys(schema_editor, model)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0025_customeraction_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_customer_actions, unpartition_customer_actions),
+        migrations.AddIndex(
+            model_name='customeraction',
+            index=models.Index(fields=['customer_id', 'action', 'timestamp'], name='action_cust_act_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customeraction',
+            index=models.Index(fields=['timestamp'], name='action_ts_idx'),
+        ),
+    ]
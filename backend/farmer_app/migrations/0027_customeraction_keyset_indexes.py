@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0026_partition_customeraction'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='customeraction',
+            name='action_ts_idx',
+        ),
+        migrations.AddIndex(
+            model_name='customeraction',
+            index=models.Index(fields=['timestamp', 'id'], name='action_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customeraction',
+            index=models.Index(fields=['customer_id', 'timestamp', 'id'], name='action_cust_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customeraction',
+            index=models.Index(fields=['crop', 'timestamp', 'id'], name='action_crop_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customeraction',
+            index=models.Index(fields=['action', 'timestamp', 'id'], name='action_act_ts_idx'),
+        ),
+    ]
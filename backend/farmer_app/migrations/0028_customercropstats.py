@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0027_customeraction_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerCropStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('add_count', models.IntegerField(default=0)),
+                ('remove_count', models.IntegerField(default=0)),
+                ('purchase_count', models.IntegerField(default=0)),
+                ('price_sum', models.FloatField(default=0.0)),
+                ('discount_sum', models.FloatField(default=0.0)),
+                ('stock_sum', models.FloatField(default=0.0)),
+                ('purchase_price_sum', models.FloatField(default=0.0)),
+                ('purchase_discount_sum', models.FloatField(default=0.0)),
+                ('purchase_stock_sum', models.FloatField(default=0.0)),
+                ('last_action_at', models.DateTimeField(blank=True, null=True)),
+                ('crop', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='farmer_app.crop')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='crop_stats', to='farmer_app.customer')),
+            ],
+            options={
+                'unique_together': {('customer', 'crop')},
+            },
+        ),
+    ]
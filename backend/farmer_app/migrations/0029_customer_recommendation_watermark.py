@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 21:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0028_customercropstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='action_watermark',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='recommendations_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='recommendations_watermark',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
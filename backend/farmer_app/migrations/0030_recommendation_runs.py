@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-18 22:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0029_customer_recommendation_watermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='running', max_length=10)),
+                ('chunk_size', models.IntegerField()),
+                ('total_customers', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecommendationRunChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_customer_id', models.IntegerField()),
+                ('last_customer_id', models.IntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('customers', models.IntegerField(default=0)),
+                ('profile_seconds', models.FloatField(default=0.0)),
+                ('scoring_seconds', models.FloatField(default=0.0)),
+                ('saving_seconds', models.FloatField(default=0.0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='farmer_app.recommendationrun')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['run', 'status'], name='run_chunk_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 22:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0030_recommendation_runs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customercropstats',
+            name='interest_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customercropstats',
+            name='interest_score',
+            field=models.FloatField(default=0.0),
+        ),
+    ]
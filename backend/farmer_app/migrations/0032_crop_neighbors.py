@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0031_customercropstats_interest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crop',
+            name='purchasers',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='CropNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('co_purchases', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('crop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='farmer_app.crop')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='farmer_app.crop')),
+            ],
+            options={
+                'ordering': ['crop', 'rank'],
+                'indexes': [models.Index(fields=['crop', 'rank'], name='crop_neighbor_rank_idx')],
+                'unique_together': {('crop', 'neighbor')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0032_crop_neighbors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerFeed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed', to='farmer_app.customer')),
+                ('market', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='farmer_app.market')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['customer', 'rank'], name='customer_feed_rank_idx')],
+                'unique_together': {('customer', 'market')},
+            },
+        ),
+    ]
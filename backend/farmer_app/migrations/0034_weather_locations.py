@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# The location services/fetch_weather.py has always fetched
+SEED_LOCATIONS = [
+    ('Bengaluru Urban', 'Karnataka', 12.97, 77.59),
+]
+
+
+def seed_locations(apps, schema_editor):
+    WeatherLocation = apps.get_model('farmer_app', 'WeatherLocation')
+    for name, state, latitude, longitude in SEED_LOCATIONS:
+        WeatherLocation.objects.get_or_create(
+            name=name, defaults={'state': state, 'latitude': latitude, 'longitude': longitude}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0033_customerfeed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('state', models.CharField(blank=True, default='', max_length=100)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('active', models.BooleanField(default=True)),
+                ('last_fetched_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LocationWeather',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('temperature', models.FloatField()),
+                ('cloudcover', models.FloatField()),
+                ('precipitation', models.FloatField()),
+                ('fetched_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weather', to='farmer_app.weatherlocation')),
+            ],
+            options={
+                'unique_together': {('location', 'date')},
+            },
+        ),
+        migrations.RunPython(seed_locations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0034_weather_locations'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(fields=['crop', '-discount', '-id'], name='market_crop_discount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(fields=['farmer', 'price', 'id'], name='market_farmer_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(fields=['farmer', '-discount', '-id'], name='market_farmer_discount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['price', 'id'], name='market_instock_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['-discount', '-id'], name='market_instock_discount_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0035_market_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendationrunchunk',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+    ]
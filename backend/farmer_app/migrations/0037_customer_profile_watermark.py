@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0036_recommendationrunchunk_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='profile_watermark',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
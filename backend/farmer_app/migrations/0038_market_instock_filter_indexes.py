@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmer_app', '0037_customer_profile_watermark'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['crop', 'price', 'id'], name='market_instock_crop_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['crop', '-discount', '-id'], name='market_instock_crop_disc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['farmer', '-date_added', '-id'], name='market_instock_farmer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['farmer', 'price', 'id'], name='market_instock_farm_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['farmer', '-discount', '-id'], name='market_instock_farm_disc_idx'),
+        ),
+    ]
@@ -1,7 +1,7 @@
 from django.utils import timezone
 from django.db import models
 from rest_framework.exceptions import ValidationError
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 
@@ -42,6 +42,14 @@ class Customer(models.Model):
     stock_urgency = models.FloatField(default=0.0)        # E.g., Purchases when stock is low
     
     last_profiled = models.DateTimeField(null=True, blank=True)
+
+    # Staleness of stored recommendations: action_watermark is bumped on every
+    # action write; recommendations_watermark is its value when they were computed
+    action_watermark = models.BigIntegerField(default=0)
+    recommendations_watermark = models.BigIntegerField(null=True, blank=True)
+    recommendations_at = models.DateTimeField(null=True, blank=True)
+    # ...and profile_watermark its value when the profile was computed
+    profile_watermark = models.BigIntegerField(null=True, blank=True)
     # Optional extra fields specific to customers
     #address = models.CharField(max_length=200, blank=True, null=True)
     #phone_number = models.CharField(max_length=15, blank=True, null=True)
@@ -49,9 +57,38 @@ class Customer(models.Model):
     def __str__(self):
         return f"Customer: {self.user.name}"
     
+# === Crop dimension ===
+class CropManager(models.Manager):
+    def get_by_natural_key(self, name):
+        return self.get(name=name)
+
+
+class Crop(models.Model):
+    name = models.CharField(max_length=100, unique=True)  # canonical (FAOSTAT-style) name
+    # Customers who purchased it; set nightly by build_crop_neighbors (cold start)
+    purchasers = models.PositiveIntegerField(default=0)
+
+    objects = CropManager()
+
+    def __str__(self):
+        return self.name
+
+    def natural_key(self):
+        return (self.name,)
+
+
+class CropAlias(models.Model):
+    crop = models.ForeignKey(Crop, related_name="aliases", on_delete=models.CASCADE)
+    alias = models.CharField(max_length=100, unique=True)  # normalized: stripped, lowercase
+
+    def __str__(self):
+        return f"{self.alias} -> {self.crop.name}"
+
+
 class Product(models.Model):
     farmer = models.ForeignKey("Farmer", on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
+    crop = models.ForeignKey(Crop, on_delete=models.PROTECT)  # resolved from name
     quantity = models.FloatField()
     reap_date = models.DateField()
 
@@ -64,12 +101,77 @@ class Market(models.Model):
     farmer = models.ForeignKey("Farmer", on_delete=models.CASCADE)
     product = models.ForeignKey("Product", on_delete=models.CASCADE)
     product_name = models.CharField(max_length=100)
+    crop = models.ForeignKey(Crop, on_delete=models.PROTECT)  # resolved from product_name
     weight = models.FloatField()
     stock = models.IntegerField()
     discount = models.FloatField(default=0)
     price = models.FloatField()  # calculated in ViewSet
     date_added = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        # MarketViewSet.list: one index per ordering, alone and behind each
+        # equality filter (crop, farmer, in_stock, and in_stock with crop or
+        # farmer; partial indexes on stock > 0), so every cursor page is
+        # an index range scan. min/max_price and min_discount narrow that
+        # range when ordering by the same column and are applied as filters
+        # on the scan otherwise.
+        indexes = [
+            models.Index(fields=["-date_added", "-id"], name="market_date_idx"),
+            models.Index(fields=["price", "id"], name="market_price_idx"),
+            models.Index(fields=["-discount", "-id"], name="market_discount_idx"),
+            models.Index(fields=["crop", "-date_added", "-id"], name="market_crop_date_idx"),
+            models.Index(fields=["crop", "price", "id"], name="market_crop_price_idx"),
+            models.Index(fields=["crop", "-discount", "-id"], name="market_crop_discount_idx"),
+            models.Index(fields=["farmer", "-date_added", "-id"], name="market_farmer_date_idx"),
+            models.Index(fields=["farmer", "price", "id"], name="market_farmer_price_idx"),
+            models.Index(fields=["farmer", "-discount", "-id"], name="market_farmer_discount_idx"),
+            models.Index(
+                fields=["-date_added", "-id"],
+                condition=models.Q(stock__gt=0),
+                name="market_instock_date_idx",
+            ),
+            models.Index(
+                fields=["price", "id"],
+                condition=models.Q(stock__gt=0),
+                name="market_instock_price_idx",
+            ),
+            models.Index(
+                fields=["-discount", "-id"],
+                condition=models.Q(stock__gt=0),
+                name="market_instock_discount_idx",
+            ),
+            models.Index(
+                fields=["crop", "-date_added", "-id"],
+                condition=models.Q(stock__gt=0),
+                name="market_instock_crop_idx",
+            ),
+            models.Index(
+                fields=["crop", "price", "id"],
+                condition=models.Q(stock__gt=0),
+                name="market_instock_crop_price_idx",
+            ),
+            models.Index(
+                fields=["crop", "-discount", "-id"],
+                condition=models.Q(stock__gt=0),
+                name="market_instock_crop_disc_idx",
+            ),
+            models.Index(
+                fields=["farmer", "-date_added", "-id"],
+                condition=models.Q(stock__gt=0),
+                name="market_instock_farmer_idx",
+            ),
+            models.Index(
+                fields=["farmer", "price", "id"],
+                condition=models.Q(stock__gt=0),
+                name="market_instock_farm_price_idx",
+            ),
+            models.Index(
+                fields=["farmer", "-discount", "-id"],
+                condition=models.Q(stock__gt=0),
+                name="market_instock_farm_disc_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.product_name} by {self.farmer.user.name}"
 
@@ -94,6 +196,36 @@ class WeatherData(models.Model):
     def __str__(self):
         return f"{self.date} - {self.temperature}°C"
     
+# === Multi-location weather (services/weather_ingest.py) ===
+class WeatherLocation(models.Model):
+    """A district whose weather is ingested; inactive ones are skipped."""
+    name = models.CharField(max_length=100, unique=True)
+    state = models.CharField(max_length=100, blank=True, default='')
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    active = models.BooleanField(default=True)
+    last_fetched_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.latitude}, {self.longitude})"
+
+
+class LocationWeather(models.Model):
+    """Observed weather of one location for one (local) day, upserted on every ingest."""
+    location = models.ForeignKey(WeatherLocation, on_delete=models.CASCADE, related_name="weather")
+    date = models.DateField()
+    temperature = models.FloatField()
+    cloudcover = models.FloatField()
+    precipitation = models.FloatField()
+    fetched_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ("location", "date")
+
+    def __str__(self):
+        return f"{self.location_id} {self.date} - {self.temperature}°C"
+
+
 class WeatherPrediction(models.Model):
     date = models.DateField(unique=True)
     temperature = models.FloatField()
@@ -103,11 +235,34 @@ class WeatherPrediction(models.Model):
     def __str__(self):
         return f"Prediction {self.date}"
     
+class CartQuerySet(models.QuerySet):
+    def with_items(self):
+        """
+        Cart read model: the cart with its total computed by the DB, plus one
+        prefetch of items joined to their market rows. Two queries no matter
+        how many items the cart holds.
+        """
+        line_total = models.ExpressionWrapper(
+            models.F("quantity") * models.F("market_item__price"),
+            output_field=models.FloatField(),
+        )
+        items = CartItem.objects.select_related("market_item").annotate(line_total=line_total).order_by("id")
+
+        return self.prefetch_related(models.Prefetch("items", queryset=items)).annotate(
+            items_total=models.Sum(
+                models.F("items__quantity") * models.F("items__market_item__price"),
+                output_field=models.FloatField(),
+            )
+        )
+
+
 class Cart(models.Model):
     cart_id = models.AutoField(primary_key=True)
     customer = models.OneToOneField(Customer, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CartQuerySet.as_manager()
+
     def __str__(self):
         return f"Cart {self.cart_id} for Customer {self.customer.customer_id}"
     
@@ -127,6 +282,17 @@ class CartItem(models.Model):
         return f"{self.market_item.product_name} x {self.quantity}"
 
 
+class CustomerActionQuerySet(models.QuerySet):
+    def hot(self):
+        """
+        Actions inside the retention window (ACTION_LOG_RETENTION_MONTHS,
+        current month included). The bound is month-aligned, so on
+        PostgreSQL only the recent partitions are scanned.
+        """
+        from services.action_partitions import retention_start
+        return self.filter(timestamp__gte=retention_start())
+
+
 class CustomerAction(models.Model):
     ACTIONS = [
         ('ADD', 'Add to Cart'),
@@ -134,20 +300,136 @@ class CustomerAction(models.Model):
         ('PURCHASE', 'Purchase')
     ]
     customer_id = models.ForeignKey(Customer, on_delete=models.CASCADE)
-    crop = models.CharField(max_length=100)
+    crop = models.ForeignKey(Crop, on_delete=models.PROTECT)
     action = models.CharField(max_length=10, choices=ACTIONS)
     quantity = models.PositiveIntegerField(default=1)
     price_at_action = models.DecimalField(max_digits=10, decimal_places=2)
     discount_at_action = models.DecimalField(max_digits=5, decimal_places=2)
     stock_at_action = models.PositiveIntegerField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set at construction (not on save) so the buffered writer keeps the action time
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    objects = CustomerActionQuerySet.as_manager()
+
+    class Meta:
+        # On PostgreSQL the table is partitioned by month on timestamp (0026)
+        indexes = [
+            models.Index(fields=["customer_id", "action", "timestamp"], name="action_cust_act_ts_idx"),
+            # Keyset pages of /customeraction/ (ordered by timestamp, id) per filter
+            models.Index(fields=["timestamp", "id"], name="action_ts_id_idx"),
+            models.Index(fields=["customer_id", "timestamp", "id"], name="action_cust_ts_idx"),
+            models.Index(fields=["crop", "timestamp", "id"], name="action_crop_ts_idx"),
+            models.Index(fields=["action", "timestamp", "id"], name="action_act_ts_idx"),
+        ]
 
     def __str__(self):
         return f"{self.crop} {self.quantity}"
+
+
+# === Per-customer, per-crop action rollup ===
+class CustomerCropStats(models.Model):
+    """
+    Running totals of a customer's actions on one crop, kept in step with
+    CustomerAction by F() increments (see services/action_stats.py).
+    Averages are sum / count, so they stay exact under increments.
+    """
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="crop_stats")
+    crop = models.ForeignKey(Crop, on_delete=models.PROTECT)
+
+    add_count = models.IntegerField(default=0)
+    remove_count = models.IntegerField(default=0)
+    purchase_count = models.IntegerField(default=0)
+
+    # Over all actions
+    price_sum = models.FloatField(default=0.0)
+    discount_sum = models.FloatField(default=0.0)
+    stock_sum = models.FloatField(default=0.0)
+
+    # Over PURCHASE actions only (customer profile)
+    purchase_price_sum = models.FloatField(default=0.0)
+    purchase_discount_sum = models.FloatField(default=0.0)
+    purchase_stock_sum = models.FloatField(default=0.0)
+
+    # Only moves forward; removed/archived actions don't roll it back
+    last_action_at = models.DateTimeField(null=True, blank=True)
+
+    # Recency-weighted action score (ADD +1, REMOVE -1, PURCHASE +3, each
+    # decaying by exp(-0.1 * days)), valued at interest_at; decayed to now
+    # when the recommendation features are built
+    interest_score = models.FloatField(default=0.0)
+    interest_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ("customer", "crop")
+
+    @property
+    def action_count(self):
+        return self.add_count + self.remove_count + self.purchase_count
+
+    def __str__(self):
+        return f"{self.customer_id} - {self.crop_id} ({self.action_count} actions)"
+
+
+@receiver(post_save, sender=CustomerAction)
+def add_action_to_stats(sender, instance, created, **kwargs):
+    # bulk_create (services/action_log.py) updates the rollup itself
+    if created:
+        from services.action_stats import apply_actions
+        apply_actions([instance])
+
     
+# === Nightly recommendation runs (checkpoints for run_recommendation) ===
+class RecommendationRun(models.Model):
+    STATUSES = [
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default='running')
+    chunk_size = models.IntegerField()
+    total_customers = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Run {self.pk} ({self.status})"
+
+
+class RecommendationRunChunk(models.Model):
+    """
+    A customer-ID range of a run; `done` chunks are skipped on resume and
+    failed ones are retried up to MAX_CHUNK_ATTEMPTS (recommendation_runner).
+    """
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    run = models.ForeignKey(RecommendationRun, on_delete=models.CASCADE, related_name="chunks")
+    first_customer_id = models.IntegerField()
+    last_customer_id = models.IntegerField()
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    attempts = models.IntegerField(default=0)
+    customers = models.IntegerField(default=0)
+
+    # Per-stage wall time inside the worker
+    profile_seconds = models.FloatField(default=0.0)
+    scoring_seconds = models.FloatField(default=0.0)
+    saving_seconds = models.FloatField(default=0.0)
+
+    error = models.TextField(blank=True, default='')
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["run", "status"], name="run_chunk_status_idx")]
+
+    def __str__(self):
+        return f"Run {self.run_id} customers {self.first_customer_id}..{self.last_customer_id} ({self.status})"
+
+
 class CustomerRecommendation(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
-    crop = models.CharField(max_length=100)
+    crop = models.ForeignKey(Crop, on_delete=models.PROTECT)
     purchase_prob = models.FloatField()
 
     class Meta:
@@ -157,8 +439,56 @@ class CustomerRecommendation(models.Model):
     def __str__(self):
         return f"{self.customer.user.name} - {self.crop} ({self.purchase_prob:.2f})"
 
+# === Materialized preferred-items feed (services/customer_feed.py) ===
+class CustomerFeed(models.Model):
+    """
+    A customer's top-N in-stock listings of their recommended crops,
+    score = the crop's purchase_prob; rank 1 is shown first.
+    """
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="feed")
+    market = models.ForeignKey(Market, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ("customer", "market")
+        indexes = [models.Index(fields=["customer", "rank"], name="customer_feed_rank_idx")]
+
+    def __str__(self):
+        return f"{self.customer_id} #{self.rank}: {self.market_id} ({self.score:.2f})"
+
+
+@receiver([post_save, post_delete], sender=Market)
+def refresh_feeds_for_listing(sender, instance, **kwargs):
+    # bulk_create / stock UPDATEs (services/market_listings.py, stock_ledger.py) call this themselves
+    from services.customer_feed import listings_changed
+    listings_changed([instance])
+
+
+# === Crop co-purchase neighbours (services/crop_neighbors.py) ===
+class CropNeighbor(models.Model):
+    """
+    One of the top-k crops bought by the same customers as `crop`.
+    score = co_purchases / sqrt(purchasers(crop) * purchasers(neighbor));
+    rank 0 is the closest.
+    """
+    crop = models.ForeignKey(Crop, on_delete=models.CASCADE, related_name="neighbors")
+    neighbor = models.ForeignKey(Crop, on_delete=models.CASCADE, related_name="+")
+    co_purchases = models.PositiveIntegerField()
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ("crop", "neighbor")
+        indexes = [models.Index(fields=["crop", "rank"], name="crop_neighbor_rank_idx")]
+        ordering = ["crop", "rank"]
+
+    def __str__(self):
+        return f"{self.crop_id} -> {self.neighbor_id} ({self.score:.2f})"
+
+
 class CropPrices(models.Model):
-    crop = models.CharField(max_length=100)
+    crop = models.ForeignKey(Crop, on_delete=models.PROTECT)
     year = models.IntegerField()
     predicted_yield = models.FloatField()
     synthetic_price = models.FloatField()  # default if missing
@@ -166,12 +496,52 @@ class CropPrices(models.Model):
 
     def __str__(self):
         return f"{self.crop} ({self.year})"
+
+
+# === Keep the in-memory crop/price tables in sync ===
+@receiver([post_save, post_delete], sender=Crop)
+@receiver([post_save, post_delete], sender=CropAlias)
+def refresh_crop_catalog(sender, **kwargs):
+    from services.crop_catalog import invalidate_crop_catalog
+    invalidate_crop_catalog()
+
+
+@receiver([post_save, post_delete], sender=CropPrices)
+def invalidate_crop_price_table(sender, **kwargs):
+    from services.price_resolver import invalidate_price_table
+    invalidate_price_table()
     
 class DailyCropForecast(models.Model):
-    crop = models.CharField(max_length=100)
+    crop = models.ForeignKey(Crop, on_delete=models.PROTECT)
     date = models.DateField()
     price_estimate = models.FloatField()
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.crop} - {self.date}"
\ No newline at end of file
+        return f"{self.crop} - {self.date}"
+
+
+# === Change counters (conditional GET) ===
+class ChangeCounter(models.Model):
+    """One row per tracked model, bumped on every write (see services/change_counters.py)."""
+    name = models.CharField(max_length=50, primary_key=True)  # model_name, e.g. "cropprices", or a shard ("market:3")
+    version = models.BigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+@receiver([post_save, post_delete], sender=CropPrices)
+@receiver([post_save, post_delete], sender=DailyCropForecast)
+@receiver([post_save, post_delete], sender=WeatherData)
+@receiver([post_save, post_delete], sender=WeatherPrediction)
+def bump_change_counter(sender, **kwargs):
+    from services.change_counters import bump_on_commit
+    bump_on_commit(sender._meta.model_name)
+
+
+@receiver([post_save, post_delete], sender=Market)
+def bump_market_counter(sender, instance, **kwargs):
+    from services.change_counters import bump_on_commit, market_counters
+    bump_on_commit(*market_counters([instance.pk]))
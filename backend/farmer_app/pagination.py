@@ -0,0 +1,178 @@
+import base64
+import json
+from binascii import Error as BinasciiError
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination that seeks on the WHOLE ordering, e.g. (price, id).
+
+    DRF's CursorPagination only puts the first ordering field in the cursor
+    and steps over ties with OFFSET, so a long run of equal values (every
+    listing at discount 0, every action of one checkout) degrades into an
+    offset scan. Here the cursor carries the value of every ordering field
+    of the last (or first) row on the page, and the next page is
+        WHERE key >= v AND (key > v OR id > i) ORDER BY key, id LIMIT n
+    which is a range scan on a (key, id) index however many rows tie.
+
+    Subclasses set ORDERINGS ({?ordering value: fields}); every ordering
+    must end with a unique field (id).
+    """
+    ORDERINGS = {}
+
+    def get_ordering(self, request, queryset, view):
+        return self.ORDERINGS.get(request.query_params.get("ordering"), self.ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        reverse, position = self.decode_cursor(request) or (False, None)
+        if position is not None:
+            position = self.coerce_position(queryset.model, position)
+
+        # A previous page is the next page of the inverted ordering, read backwards
+        ordering = tuple(_invert(field) for field in self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(_after(ordering, position))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        self.has_next = position is not None if reverse else has_more
+        self.has_previous = has_more if reverse else position is not None
+        return self.page
+
+    # ---------------- links ----------------
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(True, self.page[0])
+
+    def _link(self, reverse, instance):
+        position = [_value(instance, field) for field in self.ordering]
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor((reverse, position)))
+
+    # ---------------- cursor ----------------
+    def encode_cursor(self, cursor):
+        reverse, position = cursor
+        data = json.dumps({"r": int(reverse), "p": position}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(data.encode("ascii")).decode("ascii")
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")).decode("ascii"))
+            reverse, position = bool(data["r"]), data["p"]
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError
+        except (BinasciiError, KeyError, TypeError, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, position
+
+    def coerce_position(self, model, position):
+        """
+        Converts the cursor values to the ordering fields' types, so a
+        tampered cursor (a dict, a non-date string) is a 404 here rather than
+        a database error when the page query runs.
+        """
+        values = []
+        try:
+            for field, value in zip(self.ordering, position):
+                if value is None or isinstance(value, (dict, list)):
+                    raise ValueError
+                values.append(model._meta.get_field(field.lstrip("-")).to_python(value))
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+
+def _invert(field):
+    return field[1:] if field.startswith("-") else "-" + field
+
+
+def _value(instance, field):
+    value = getattr(instance, field.lstrip("-"))
+    # JSON-safe; the ORM parses ISO datetimes back when filtering
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def _after(ordering, position):
+    """
+    Rows strictly after `position` in `ordering`:
+        (a > x) OR (a = x AND b > y) OR ...
+    plus a leading a >= x bound so the index range starts at the cursor.
+    """
+    def lookup(field, op):
+        if op == "gt" and field.startswith("-"):
+            op = "lt"
+        elif op == "gte" and field.startswith("-"):
+            op = "lte"
+        return f"{field.lstrip('-')}__{op}"
+
+    after = Q()
+    equal = Q()
+    for field, value in zip(ordering, position):
+        after |= equal & Q(**{lookup(field, "gt"): value})
+        equal &= Q(**{field.lstrip("-"): value})
+    return Q(**{lookup(ordering[0], "gte"): position[0]}) & after
+
+
+class MarketCursorPagination(KeysetCursorPagination):
+    """
+    Keyset pagination for the shop. Every ordering ends with `id` so ties are
+    stable, and each one is backed by a composite index on Market.
+    """
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    ordering = ("-date_added", "-id")
+
+    # ?ordering=<key>
+    ORDERINGS = {
+        "-date_added": ("-date_added", "-id"),
+        "price": ("price", "id"),
+        "-price": ("-price", "-id"),
+        "-discount": ("-discount", "-id"),
+    }
+
+
+class CustomerActionCursorPagination(KeysetCursorPagination):
+    """
+    Keyset pagination over the action log on (timestamp, id); the actions
+    of one checkout or cart batch share a timestamp, so the id is part of
+    the cursor. Each filter of CustomerActionViewSet has a matching
+    (filter column, timestamp, id) index, so a page costs O(page size)
+    however large the log is.
+    """
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    ordering = ("-timestamp", "-id")
+
+    # ?ordering=<key>
+    ORDERINGS = {
+        "-timestamp": ("-timestamp", "-id"),
+        "timestamp": ("timestamp", "id"),
+    }
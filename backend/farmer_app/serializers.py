@@ -1,5 +1,74 @@
 from rest_framework import serializers
 from .models import *
+from services.crop_catalog import crop_name, get_crop_id, resolve_crop_id
+
+
+class CropField(serializers.RelatedField):
+    """
+    Crop FK exposed as the canonical crop name. Accepts any alias on write;
+    an unknown name validates to an unsaved Crop, registered by
+    CropResolvingSerializer on save. Names come from the cached crop
+    catalog, so no per-row query is made.
+    """
+    default_error_messages = {"invalid": "Expected a crop name."}
+
+    def __init__(self, **kwargs):
+        if not kwargs.get("read_only"):
+            kwargs.setdefault("queryset", Crop.objects.all())
+        super().__init__(**kwargs)
+
+    def use_pk_only_optimization(self):
+        return True
+
+    def to_representation(self, value):
+        return crop_name(value.pk)
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str) or not data.strip():
+            self.fail("invalid")
+        crop_id = get_crop_id(data)
+        if crop_id is None:
+            return Crop(name=data.strip())
+        return Crop(pk=crop_id, name=crop_name(crop_id))
+
+
+class CropResolvingSerializer(serializers.ModelSerializer):
+    """
+    Resolves the crop on save, not during validation: resolving an unknown
+    name registers a new Crop, which must not happen for a rejected write.
+    The crop comes from the `crop` CropField, or (crop_name_field) from the
+    model field holding the crop name.
+    """
+    crop_name_field = None
+
+    def run_validators(self, value):
+        crop = value.get("crop") if isinstance(value, dict) else None
+        if crop is None or crop.pk is not None:
+            return super().run_validators(value)
+
+        # No row can reference a crop that does not exist yet, and the
+        # unique-together lookups cannot filter on an unsaved Crop
+        validators = self.validators
+        self.validators = [v for v in validators if "crop" not in getattr(v, "fields", ())]
+        try:
+            super().run_validators(value)
+        finally:
+            self.validators = validators
+
+    def resolve_crop(self, validated_data):
+        crop = validated_data.pop("crop", None)
+        if crop is not None:
+            validated_data["crop_id"] = crop.pk if crop.pk is not None else resolve_crop_id(crop.name)
+        elif self.crop_name_field in validated_data and "crop_id" not in validated_data:
+            validated_data["crop_id"] = resolve_crop_id(validated_data[self.crop_name_field])
+        return validated_data
+
+    def create(self, validated_data):
+        return super().create(self.resolve_crop(validated_data))
+
+    def update(self, instance, validated_data):
+        return super().update(instance, self.resolve_crop(validated_data))
+
 
 class UsersSerializers(serializers.ModelSerializer):
     class Meta:
@@ -17,15 +86,20 @@ class FarmerSerializer(serializers.ModelSerializer):
         fields = ['farmer_id', 'name', 'email', 'password']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(CropResolvingSerializer):
     farmer_name = serializers.CharField(source='farmer.user.name', read_only=True)
+    crop = CropField(read_only=True)
+    crop_name_field = "name"
 
     class Meta:
         model = Product
-        fields = ['id', 'farmer', 'farmer_name', 'name', 'quantity', 'reap_date']
+        fields = ['id', 'farmer', 'farmer_name', 'name', 'crop', 'quantity', 'reap_date']
+
 
+class MarketSerializer(CropResolvingSerializer):
+    crop = CropField(read_only=True)
+    crop_name_field = "product_name"
 
-class MarketSerializer(serializers.ModelSerializer):
     class Meta:
         model = Market
         fields = [
@@ -33,12 +107,14 @@ class MarketSerializer(serializers.ModelSerializer):
             'farmer',
             'product',
             'product_name',
+            'crop',
             'weight',     # <-- correct field
             'stock',
             'discount',
             'price',
             'date_added'
         ]
+        read_only_fields = ['price']  # calculated in MarketViewSet.create
 
 
 class CustomerSerializers(serializers.ModelSerializer):
@@ -85,6 +161,9 @@ class CartItemSerializer(serializers.ModelSerializer):
         }
 
     def get_total_price(self, obj):
+        # line_total is annotated by Cart.objects.with_items()
+        if hasattr(obj, "line_total"):
+            return obj.line_total
         return obj.quantity * obj.market_item.price
 
 
@@ -97,22 +176,30 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ["cart_id", "customer", "items", "total_price"]  # cart_id exists in model, no source needed
 
     def get_total_price(self, obj):
+        # items_total is annotated by Cart.objects.with_items()
+        if hasattr(obj, "items_total"):
+            return obj.items_total or 0
         return sum(item.quantity * item.market_item.price for item in obj.items.all())
     
 
-class CustomerActionSerializer(serializers.ModelSerializer):
+class CustomerActionSerializer(CropResolvingSerializer):
+    crop = CropField()
+
     class Meta:
         model = CustomerAction
         fields = "__all__"
 
 
-class CustomerRecommendationSerializer(serializers.ModelSerializer):
+class CustomerRecommendationSerializer(CropResolvingSerializer):
+    crop = CropField()
+
     class Meta:
         model = CustomerRecommendation
         fields = '__all__'
 
 
-class CropPricesSerializer(serializers.ModelSerializer):
+class CropPricesSerializer(CropResolvingSerializer):
+    crop = CropField()
     forecast_7_days = serializers.SerializerMethodField()
 
     class Meta:
@@ -127,7 +214,7 @@ class CropPricesSerializer(serializers.ModelSerializer):
         ]
 
     def get_forecast_7_days(self, obj):
-        forecasts = DailyCropForecast.objects.filter(crop=obj.crop).order_by("date")[:7]
+        forecasts = DailyCropForecast.objects.filter(crop_id=obj.crop_id).order_by("date")[:7]
         return [
             {
                 "date": f.date,
@@ -136,7 +223,9 @@ class CropPricesSerializer(serializers.ModelSerializer):
             for f in forecasts
         ]
 
-class DailyCropForecastSerializer(serializers.ModelSerializer):
+class DailyCropForecastSerializer(CropResolvingSerializer):
+    crop = CropField()
+
     class Meta:
         model = DailyCropForecast
         fields = ['id', 'crop', 'date', 'price_estimate', 'created_at']
@@ -1,3 +1,1636 @@
-from django.test import TestCase
+import base64
+import datetime
+import gzip
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from django.db import NotSupportedError, OperationalError
+
+from farmer_app.models import (
+    Cart, CartItem, ChangeCounter, Crop, CropNeighbor, CropPrices, Customer, CustomerAction, CustomerCropStats,
+    CustomerFeed, CustomerRecommendation, DailyCropForecast, Farmer, LocationWeather, Market, Product,
+    RecommendationRun, Users, WeatherData, WeatherLocation,
+)
+from farmer_app.serializers import (
+    CustomerActionSerializer, CustomerRecommendationSerializer, DailyCropForecastSerializer, ProductSerializer,
+)
+from ml_model import recommendation_model
+from services import action_log, action_partitions, action_stats, background, price_resolver
+from services.action_log import ActionLogWriter
+from services.action_partitions import DEFAULT_PARTITION, existing_partitions, is_partitioned, months_to_archive
+from services.change_counters import market_counters
+from services import checkout as checkout_module
+from services.checkout import checkout
+from services import fetch_weather, recommendation_runner, weather_refresh
+from services.profile_updater import COLD_START_PROFILE, update_customer_profiles
+from services.recommendations import (
+    PROFILE_COLUMNS, _EpochSeconds, add_related_crops, save_recommendations_batch, serving_features, training_frame,
+)
+from services.crop_catalog import invalidate_crop_catalog, resolve_crop_id
+from services.crop_neighbors import build_crop_neighbors, popular_crops, related_crops
+from services.customer_feed import FEED_SIZE, ranked_listings
+from services.stock_ledger import InsufficientStock
+from services.weather_ingest import ingest_weather
+from services.weather_stub import StubWeatherServer
+
+
+def make_farmer(name="farmer"):
+    user = Users.objects.create(name=name, email=f"{name}@example.com", password="x", role="farmer")
+    return Farmer.objects.get(user=user)
+
+
+def make_customer(name="customer"):
+    user = Users.objects.create(name=name, email=f"{name}@example.com", password="x", role="customer")
+    return Customer.objects.get(user=user)
+
+
+def make_listing(farmer, stock, name="Rice", price=20.0):
+    # A rolled-back test leaves crop ids in the in-memory catalog
+    invalidate_crop_catalog()
+    crop_id = resolve_crop_id(name)
+    product = Product.objects.create(
+        farmer=farmer, name=name, crop_id=crop_id, quantity=1000, reap_date=datetime.date.today()
+    )
+    return Market.objects.create(
+        farmer=farmer, product=product, product_name=name, crop_id=crop_id,
+        weight=1, stock=stock, discount=0, price=price,
+    )
+
+
+# Threads need their own connections to a database that allows concurrent
+# writers, so this runs on PostgreSQL (not SQLite)
+@skipUnlessDBFeature("has_select_for_update")
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class ConcurrentPurchaseTests(TransactionTestCase):
+    STOCK = 50
+    BUYERS = 200
+    THREADS = 40  # well under PostgreSQL's default max_connections (100)
+
+    def setUp(self):
+        self.listing = make_listing(make_farmer(), stock=self.STOCK)
+        self.carts = []
+        for i in range(self.BUYERS):
+            cart = Cart.objects.create(customer=make_customer(f"buyer{i}"))
+            CartItem.objects.create(cart=cart, market_item=self.listing, quantity=1)
+            self.carts.append(cart)
+
+    def test_parallel_purchases_never_oversell(self):
+        lowest_stock = []
+
+        def buy(cart):
+            try:
+                try:
+                    checkout(cart)
+                    bought = True
+                except InsufficientStock:
+                    bought = False
+                lowest_stock.append(Market.objects.get(pk=self.listing.pk).stock)
+                return bought
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            results = list(pool.map(buy, self.carts))
+
+        self.listing.refresh_from_db()
+        self.assertEqual(sum(results), self.STOCK)
+        self.assertEqual(self.listing.stock, 0)
+        self.assertGreaterEqual(min(lowest_stock), 0)
+
+        # Only the successful buyers' carts were emptied
+        self.assertEqual(CartItem.objects.count(), self.BUYERS - self.STOCK)
+
+
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class MarketPaginationTests(TestCase):
+    LISTINGS = 600
+
+    @classmethod
+    def setUpTestData(cls):
+        farmer = make_farmer()
+        listing = make_listing(farmer, stock=5)
+        # Every listing ties on discount (0) and date_added
+        Market.objects.bulk_create([
+            Market(
+                farmer=farmer, product_id=listing.product_id, product_name="Rice", crop_id=listing.crop_id,
+                weight=1, stock=5, discount=0, price=20 + i % 3, date_added=listing.date_added,
+            )
+            for i in range(cls.LISTINGS - 1)
+        ])
+
+    def _walk(self, url, direction="next"):
+        client = APIClient()
+        pages = []
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                body = client.get(url).json()
+                pages.append([row["id"] for row in body["results"]])
+                url = body[direction]
+        return pages, queries
+
+    def test_ties_are_paged_by_keyset(self):
+        for ordering in ("-discount", "price", "-price", "-date_added"):
+            with self.subTest(ordering=ordering):
+                pages, queries = self._walk(f"/market/?ordering={ordering}&page_size=50")
+                ids = [market_id for page in pages for market_id in page]
+
+                self.assertEqual(len(pages), self.LISTINGS // 50)
+                self.assertEqual(len(ids), self.LISTINGS)
+                self.assertEqual(len(set(ids)), self.LISTINGS)
+                self.assertFalse([q["sql"] for q in queries if "OFFSET" in q["sql"].upper()])
+
+    def test_previous_links_walk_back(self):
+        forward, _ = self._walk("/market/?ordering=-discount&page_size=50")
+
+        client = APIClient()
+        last = client.get("/market/?ordering=-discount&page_size=50").json()
+        while last["next"]:
+            last = client.get(last["next"]).json()
+        backward, _ = self._walk(last["previous"], direction="previous")
+
+        self.assertEqual(backward, list(reversed(forward[:-1])))
+
+
+class MarketCursorValidationTests(TestCase):
+    @staticmethod
+    def cursor(position):
+        return base64.urlsafe_b64encode(json.dumps({"r": 0, "p": position}).encode()).decode()
+
+    def test_malformed_cursor_values_are_404(self):
+        make_listing(make_farmer(), stock=5)
+        for ordering, position in [
+            ("price", [{"a": 1}, 1]),
+            ("price", ["cheap", 1]),
+            ("-date_added", ["yesterday", 1]),
+            ("-date_added", [None, 1]),
+            ("-discount", [0, [1]]),
+        ]:
+            with self.subTest(ordering=ordering, position=position):
+                response = APIClient().get(f"/market/?ordering={ordering}&cursor={self.cursor(position)}")
+                self.assertEqual(response.status_code, 404)
+
+    def test_cursor_values_are_coerced(self):
+        listing = make_listing(make_farmer(), stock=5, price=20.0)
+        response = APIClient().get(f"/market/?ordering=price&cursor={self.cursor(['19.5', str(listing.pk - 1)])}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["id"] for row in response.json()["results"]], [listing.pk])
+
+
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class MarketCreateTests(TestCase):
+    def setUp(self):
+        self.farmer = make_farmer()
+        self.product = make_listing(self.farmer, stock=1).product
+        self.client = APIClient()
+
+    def _create(self, **fields):
+        data = dict(farmer=self.farmer.pk, product=self.product.pk, product_name="Rice", weight=2, stock=3, discount=0)
+        data.update(fields)
+        return self.client.post("/market/", data, format="json")
+
+    def test_creates_listing_and_registers_new_crop(self):
+        response = self._create(product_name="Dragonfruit")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["crop"], "Dragonfruit")
+        self.assertTrue(Crop.objects.filter(name="Dragonfruit").exists())
+
+    def test_invalid_listing_registers_no_crop(self):
+        response = self._create(product_name="Riceee", farmer=999999)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Crop.objects.filter(name="Riceee").exists())
+
+    def test_insufficient_stock_registers_no_crop(self):
+        response = self._create(product_name="Riceee", weight=1000, stock=5)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Crop.objects.filter(name="Riceee").exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 1000)
+
+
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class CartReadQueryTests(TestCase):
+    """Cart reads go through Cart.objects.with_items(): a fixed number of queries."""
+
+    def setUp(self):
+        self.farmer = make_farmer()
+        self.client = APIClient()
+        self.carts = []
+        for i, crops in enumerate((["Rice"], ["Rice", "Wheat", "Maize", "Potato", "Onion"] * 6)):
+            cart = Cart.objects.create(customer=make_customer(f"shopper{i}"))
+            for name in crops:
+                CartItem.objects.create(cart=cart, market_item=make_listing(self.farmer, stock=10, name=name), quantity=2)
+            self.carts.append(cart)
+        # Crop names come from the in-memory catalog; load it outside the measured block
+        self.client.get(f"/cart/{self.carts[0].pk}/")
+
+    def test_retrieve_is_two_queries_for_any_cart_size(self):
+        for cart in self.carts:
+            with self.subTest(items=cart.items.count()), self.assertNumQueries(2):
+                response = self.client.get(f"/cart/{cart.pk}/")
+            self.assertEqual(len(response.json()["items"]), cart.items.count())
+
+    def test_list_is_two_queries_for_any_number_of_items(self):
+        with self.assertNumQueries(2):
+            response = self.client.get("/cart/")
+        self.assertEqual(sum(len(cart["items"]) for cart in response.json()), 31)
+
+        # More carts and items: still two
+        cart = Cart.objects.create(customer=make_customer("shopper9"))
+        CartItem.objects.create(cart=cart, market_item=make_listing(self.farmer, stock=10, name="Barley"), quantity=1)
+        self.client.get(f"/cart/{cart.pk}/")
+        with self.assertNumQueries(2):
+            response = self.client.get("/cart/")
+        self.assertEqual(len(response.json()), 3)
+
+
+class ActionLogWriterTests(TestCase):
+    def setUp(self):
+        self.customer = make_customer()
+        self.crop_id = make_listing(make_farmer(), stock=1).crop_id
+        self.writer = ActionLogWriter(batch_size=10, max_retries=3, retry_backoff=0)
+
+    def _actions(self, count, **fields):
+        return [
+            CustomerAction(
+                customer_id=self.customer, crop_id=self.crop_id, action="ADD", quantity=1,
+                price_at_action=10, discount_at_action=0, stock_at_action=fields.get("stock_at_action", 5),
+            )
+            for _ in range(count)
+        ]
+
+    def _queue(self, actions):
+        for action in actions:
+            self.writer._queue.put_nowait(action)
+
+    def test_failed_batch_is_retried_not_dropped(self):
+        self._queue(self._actions(25))
+        real_write = action_log.write_actions
+        failures = [OperationalError("server closed the connection")] * 2
+
+        def flaky_write(batch):
+            if failures:
+                raise failures.pop()
+            real_write(batch)
+
+        with mock.patch.object(action_log, "write_actions", flaky_write), self.assertLogs(action_log.logger, "WARNING"):
+            self.assertEqual(self.writer.flush(), 0)   # first batch fails, the rest waits
+            self.assertEqual(self.writer.flush(), 0)   # its first retry fails too
+            self.assertEqual(self.writer.flush(), 25)  # retried, then the queue
+
+        metrics = self.writer.metrics()
+        self.assertEqual(CustomerAction.objects.count(), 25)
+        self.assertEqual((metrics["written"], metrics["retried"], metrics["dropped"]), (25, 10, 0))
+        self.assertEqual(metrics["failed"], 20)
+        self.assertEqual(metrics["retry_depth"], 0)
+
+    def test_bad_row_is_dropped_alone_after_max_retries(self):
+        # stock_at_action is a PositiveIntegerField: -1 fails its check constraint
+        self._queue(self._actions(4) + self._actions(1, stock_at_action=-1) + self._actions(5))
+
+        with self.assertLogs(action_log.logger, "WARNING") as logs:
+            for _ in range(self.writer.max_retries):
+                self.writer.flush()
+        self.assertIn("Dropping customer action", logs.output[-1])
+
+        metrics = self.writer.metrics()
+        self.assertEqual(CustomerAction.objects.count(), 9)
+        self.assertEqual((metrics["written"], metrics["dropped"], metrics["retry_depth"]), (9, 1, 0))
+
+    def test_outage_keeps_memory_bounded(self):
+        writer = ActionLogWriter(batch_size=10, max_queue=20, max_retries=3, retry_backoff=60, max_retry_rows=30)
+        writer._ensure_started = lambda: None  # no flusher thread: put() alone must bound the buffers
+
+        with mock.patch.object(action_log, "write_actions", side_effect=OperationalError("database is down")), \
+                self.assertLogs(action_log.logger, "WARNING") as logs:
+            for _ in range(10):
+                writer.put(self._actions(10))
+
+        metrics = writer.metrics()
+        self.assertLessEqual(metrics["queue_depth"], 20)
+        self.assertEqual(metrics["retry_depth"], 30)
+        self.assertEqual(metrics["queue_depth"] + metrics["retry_depth"] + metrics["dropped"], 100)
+        self.assertGreater(metrics["dropped"], 0)
+        self.assertTrue(any("retry buffer is full" in line for line in logs.output))
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "CustomerAction is only partitioned on PostgreSQL")
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class ActionArchiveDryRunTests(TestCase):
+    def test_dry_run_creates_no_partition_and_moves_no_rows(self):
+        self.assertTrue(is_partitioned())
+        # No monthly partition covers 2020: the row lands in DEFAULT
+        CustomerAction.objects.create(
+            customer_id=make_customer(), crop_id=make_listing(make_farmer(), stock=1).crop_id, action="ADD",
+            price_at_action=10, discount_at_action=0, stock_at_action=1,
+            timestamp=datetime.datetime(2020, 3, 5, tzinfo=datetime.timezone.utc),
+        )
+        partitions = existing_partitions()
+
+        months = months_to_archive(12, dry_run=True)
+
+        self.assertIn(datetime.date(2020, 3, 1), months)
+        self.assertEqual(existing_partitions(), partitions)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {connection.ops.quote_name(DEFAULT_PARTITION)}")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class CustomerActionPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = make_customer()
+        crop_id = make_listing(make_farmer(), stock=1).crop_id
+        # One checkout: every action shares the timestamp
+        at = datetime.datetime(2026, 5, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc)
+        CustomerAction.objects.bulk_create([
+            CustomerAction(
+                customer_id=cls.customer, crop_id=crop_id, action="PURCHASE",
+                price_at_action=10, discount_at_action=0, stock_at_action=1, timestamp=at,
+            )
+            for _ in range(250)
+        ])
+
+    def test_same_timestamp_batch_is_paged_by_keyset(self):
+        client = APIClient()
+        for ordering in ("-timestamp", "timestamp"):
+            with self.subTest(ordering=ordering), CaptureQueriesContext(connection) as queries:
+                url = f"/customeraction/?customer_id={self.customer.pk}&ordering={ordering}&page_size=100"
+                ids = []
+                while url:
+                    body = client.get(url).json()
+                    ids += [row["id"] for row in body["results"]]
+                    url = body["next"]
+
+            self.assertEqual(len(ids), 250)
+            self.assertEqual(ids, sorted(ids, reverse=ordering.startswith("-")))
+            self.assertFalse([q["sql"] for q in queries if "OFFSET" in q["sql"].upper()])
+
+
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class TrainingFrameTests(TestCase):
+    def test_profile_features_exclude_the_label_window(self):
+        customer = make_customer()
+        crop_id = make_listing(make_farmer(), stock=1).crop_id
+        cutoff = timezone.now() - datetime.timedelta(days=30)
+
+        def act(action, days_after_cutoff, discount):
+            CustomerAction.objects.create(
+                customer_id=customer, crop_id=crop_id, action=action, price_at_action=40,
+                discount_at_action=discount, stock_at_action=4,
+                timestamp=cutoff + datetime.timedelta(days=days_after_cutoff),
+            )
+
+        act("PURCHASE", -10, discount=0)
+        act("ADD", -5, discount=0)
+        act("PURCHASE", 5, discount=30)  # the label
+        update_customer_profiles()
+
+        row = training_frame(cutoff).iloc[0]
+        customer.refresh_from_db()
+
+        self.assertEqual(row["label"], 1)
+        self.assertEqual(row["purchase_count"], 1)
+        # As of the cutoff: one purchase at 0% discount, not the current profile
+        self.assertEqual(row["discount_sensitivity"], 0.0)
+        self.assertEqual(customer.discount_sensitivity, 0.5)
+
+    def test_customer_without_purchases_before_cutoff_is_cold_start(self):
+        customer = make_customer()
+        crop_id = make_listing(make_farmer(), stock=1).crop_id
+        cutoff = timezone.now() - datetime.timedelta(days=30)
+        for action, days in (("ADD", -3), ("PURCHASE", 3)):
+            CustomerAction.objects.create(
+                customer_id=customer, crop_id=crop_id, action=action, price_at_action=90,
+                discount_at_action=25, stock_at_action=1, timestamp=cutoff + datetime.timedelta(days=days),
+            )
+        update_customer_profiles()
+
+        row = training_frame(cutoff).iloc[0]
+        self.assertEqual(tuple(row[PROFILE_COLUMNS]), COLD_START_PROFILE)
+
+
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class RecommendationRunTests(TestCase):
+    def setUp(self):
+        self.customers = [make_customer(f"member{i}") for i in range(6)]
+        self.bad_customer = self.customers[2].pk
+        self.scored = []
+
+    def _refresh(self, failures):
+        """refresh_recommendations_batch that fails `failures` times for the chunk of bad_customer."""
+        remaining = [failures]
+
+        def refresh(customer_ids, timings=None):
+            if self.bad_customer in customer_ids and remaining[0]:
+                remaining[0] -= 1
+                raise RuntimeError("model exploded")
+            self.scored.extend(customer_ids)
+            return {}
+        return mock.patch.object(recommendation_runner, "refresh_recommendations_batch", refresh)
+
+    def test_failing_chunk_is_capped_and_next_run_starts_fresh(self):
+        run, resumed = recommendation_runner.start_or_resume_run(chunk_size=2)
+        with self._refresh(failures=99):
+            summary = recommendation_runner.run_chunks(run)
+
+        run.refresh_from_db()
+        bad_chunk = run.chunks.get(status="failed")
+        self.assertEqual(run.status, "failed")
+        self.assertEqual(bad_chunk.attempts, recommendation_runner.MAX_CHUNK_ATTEMPTS)
+        self.assertEqual((summary["failed"], summary["chunks"], summary["retries"]), (1, 2, 2))
+        self.assertEqual(len(self.scored), 4)
+
+        # A failed run is closed: the next run recomputes everyone
+        next_run, resumed = recommendation_runner.start_or_resume_run(chunk_size=2)
+        self.assertFalse(resumed)
+        self.assertNotEqual(next_run.pk, run.pk)
+        self.assertEqual(next_run.chunks.count(), 3)
+
+    def test_transient_failure_is_retried_within_the_run(self):
+        run, _ = recommendation_runner.start_or_resume_run(chunk_size=2)
+        with self._refresh(failures=1):
+            summary = recommendation_runner.run_chunks(run)
+
+        run.refresh_from_db()
+        self.assertEqual(run.status, "done")
+        self.assertEqual((summary["failed"], summary["chunks"], summary["retries"]), (0, 3, 1))
+        self.assertEqual(sorted(self.scored), sorted(c.pk for c in self.customers))
+
+    def test_interrupted_run_is_resumed(self):
+        run, _ = recommendation_runner.start_or_resume_run(chunk_size=2)
+        first = run.chunks.order_by("first_customer_id").first()
+        first.status = "done"
+        first.save()
+
+        resumed_run, resumed = recommendation_runner.start_or_resume_run(chunk_size=2)
+        self.assertTrue(resumed)
+        self.assertEqual(resumed_run.pk, run.pk)
+        with self._refresh(failures=0):
+            recommendation_runner.run_chunks(resumed_run)
+        self.assertEqual(len(self.scored), 4)
+        self.assertEqual(RecommendationRun.objects.get(pk=run.pk).status, "done")
+
+
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class ProfileUpdateTests(TestCase):
+    def test_only_changed_picks_up_late_written_actions(self):
+        customer = make_customer()
+        crop_id = make_listing(make_farmer(), stock=1).crop_id
+        self.assertEqual(update_customer_profiles(only_changed=True), 1)  # never profiled
+        self.assertEqual(update_customer_profiles(only_changed=True), 0)
+
+        # Stamped before the next pass, but still in the writer's buffer during it
+        purchase = CustomerAction(
+            customer_id=customer, crop_id=crop_id, action="PURCHASE", price_at_action=40,
+            discount_at_action=30, stock_at_action=2, timestamp=timezone.now() - datetime.timedelta(seconds=5),
+        )
+        self.assertEqual(update_customer_profiles(only_changed=True), 0)
+        action_log.write_actions([purchase])
+
+        self.assertEqual(update_customer_profiles(only_changed=True), 1)
+        customer.refresh_from_db()
+        self.assertEqual(customer.discount_sensitivity, 1.0)
+        self.assertEqual(customer.profile_watermark, customer.action_watermark)
+        self.assertEqual(update_customer_profiles(only_changed=True), 0)
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentWeatherRefreshTests(TransactionTestCase):
+    WORKERS = 8
+
+    def test_one_refresh_across_workers(self):
+        calls = []
+        started = threading.Barrier(self.WORKERS)
+        skipped = threading.Semaphore(0)
+
+        def fetch():
+            # Hold the claim until every other worker has tried and given up
+            calls.append(1)
+            for _ in range(self.WORKERS - 1):
+                self.assertTrue(skipped.acquire(timeout=10))
+
+        def refresh(_):
+            try:
+                started.wait()
+                refreshed = weather_refresh.refresh_weather()
+                if not refreshed:
+                    skipped.release()
+                return refreshed
+            finally:
+                connection.close()
+
+        with mock.patch("services.fetch_weather.fetch_and_save_weather", fetch), \
+                mock.patch("ml_model.weather_predictor.predict_next_7_days"), \
+                ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            results = list(pool.map(refresh, range(self.WORKERS)))
+
+        self.assertEqual(sum(results), 1)
+        self.assertEqual(len(calls), 1)
+        self.assertIsNotNone(weather_refresh.refreshed_at())
+
+
+class WeatherRefreshClaimTests(TestCase):
+    def test_claim_is_exclusive_until_released(self):
+        self.assertTrue(weather_refresh.claim_refresh())
+        self.assertFalse(weather_refresh.claim_refresh())
+        weather_refresh.release_refresh()
+        self.assertTrue(weather_refresh.claim_refresh())
+
+    @override_settings(WEATHER_RETRY_AFTER=60)
+    def test_failed_refresh_holds_off_every_process(self):
+        with mock.patch("services.fetch_weather.fetch_and_save_weather", side_effect=OSError), \
+                mock.patch("ml_model.weather_predictor.predict_next_7_days") as predict:
+            with self.assertRaises(OSError):
+                weather_refresh.refresh_weather()
+            self.assertFalse(weather_refresh.refresh_weather())
+        predict.assert_not_called()
+        self.assertIsNone(weather_refresh.refreshed_at())
+
+    def test_successful_refresh_releases_the_claim(self):
+        with mock.patch("services.fetch_weather.fetch_and_save_weather"), \
+                mock.patch("ml_model.weather_predictor.predict_next_7_days"):
+            self.assertTrue(weather_refresh.refresh_weather())
+            self.assertTrue(weather_refresh.refresh_weather())
+        self.assertEqual(ChangeCounter.objects.get(name=weather_refresh.COUNTER).version, 2)
+
+
+class WeatherCsvTests(unittest.TestCase):
+    def test_csv_is_replaced_whole(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(fetch_weather, "CSV_PATH", os.path.join(tmp, "weather_data.csv")):
+            today = datetime.date(2026, 10, 19)
+            fetch_weather.write_csv_atomic([["2026-10-18", 24.0, 50, 1.0], [today.isoformat(), 20.0, 90, 5.0]])
+            rows = fetch_weather.read_csv_rows(exclude_date=today)
+            rows.append([today.isoformat(), 25.5, 40, 0.0])
+            fetch_weather.write_csv_atomic(rows)
+
+            self.assertEqual(os.listdir(tmp), ["weather_data.csv"])  # no temp file left behind
+            self.assertEqual(
+                fetch_weather.read_csv_rows(),
+                [["2026-10-18", "24.0", "50", "1.0"], ["2026-10-19", "25.5", "40", "0.0"]],
+            )
+
+
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class CustomerFeedTests(TestCase):
+    def setUp(self):
+        self.farmer = make_farmer()
+        self.customer = make_customer()
+        invalidate_crop_catalog()
+        CustomerRecommendation.objects.create(customer=self.customer, crop_id=resolve_crop_id("Rice"), purchase_prob=0.8)
+
+    def feed(self):
+        return list(CustomerFeed.objects.filter(customer=self.customer).order_by("rank").values_list("market_id", flat=True))
+
+    def test_new_listing_reaches_the_feed_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = make_listing(self.farmer, stock=5)
+        self.assertEqual(self.feed(), [listing.pk])
+
+    def test_listing_save_only_queues_the_crop(self):
+        listing = make_listing(self.farmer, stock=5)
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as queries:
+            listing.discount = 10
+            listing.save()
+        self.assertEqual(len(queries), 1)  # the UPDATE; the fan-out runs in the background task
+        self.assertTrue(callbacks)
+
+    def test_deleted_listing_is_replaced(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            older = make_listing(self.farmer, stock=5)
+            newer = make_listing(self.farmer, stock=5)
+        self.assertEqual(self.feed(), [newer.pk, older.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            newer.delete()
+        self.assertEqual(self.feed(), [older.pk])
+
+    def test_view_builds_a_feed_that_was_never_built(self):
+        listing = make_listing(self.farmer, stock=5)  # on_commit never runs: no feed rows
+        self.assertEqual(self.feed(), [])
+
+        body = self.client.get(f"/recommendations/{self.customer.pk}/").json()
+        self.assertTrue(body["success"])
+        self.assertEqual([item["id"] for item in body["data"]], [listing.pk])
+        self.assertEqual(body["data"][0]["purchase_probability"], 0.8)
+        self.assertEqual(self.feed(), [listing.pk])
+
+    def test_view_without_recommendations(self):
+        make_listing(self.farmer, stock=5)
+        other = make_customer("other")
+        body = self.client.get(f"/recommendations/{other.pk}/").json()
+        self.assertEqual(body["data"], [])
+
+
+class RankedListingsTests(TestCase):
+    def test_ranks_by_probability_then_newest_in_stock_only(self):
+        farmer = make_farmer()
+        customer = make_customer()
+        rice, wheat = make_listing(farmer, stock=5, name="Rice"), make_listing(farmer, stock=5, name="Wheat")
+        newer_rice = make_listing(farmer, stock=5, name="Rice")
+        make_listing(farmer, stock=0, name="Rice")  # sold out
+        make_listing(farmer, stock=5, name="Maize")  # not recommended
+        CustomerRecommendation.objects.create(customer=customer, crop_id=rice.crop_id, purchase_prob=0.9)
+        CustomerRecommendation.objects.create(customer=customer, crop_id=wheat.crop_id, purchase_prob=0.4)
+
+        with self.assertNumQueries(1):
+            rows = list(ranked_listings([customer.pk]))
+        self.assertEqual(
+            rows,
+            [(customer.pk, newer_rice.pk, 0.9, 1), (customer.pk, rice.pk, 0.9, 2), (customer.pk, wheat.pk, 0.4, 3)],
+        )
+
+    def test_limits_each_customer_to_the_feed_size(self):
+        farmer = make_farmer()
+        listings = [make_listing(farmer, stock=1) for _ in range(FEED_SIZE + 3)]
+        customers = [make_customer("a"), make_customer("b")]
+        for customer in customers:
+            CustomerRecommendation.objects.create(customer=customer, crop_id=listings[0].crop_id, purchase_prob=0.5)
+
+        rows = list(ranked_listings([c.pk for c in customers]))
+        for customer in customers:
+            ranked = [market_id for customer_id, market_id, _, _ in rows if customer_id == customer.pk]
+            self.assertEqual(ranked, [listing.pk for listing in reversed(listings)][:FEED_SIZE])
+
+
+class CropResolvingSerializerTests(TestCase):
+    def setUp(self):
+        invalidate_crop_catalog()
+        self.customer = make_customer()
+
+    def test_rejected_writes_register_no_crop(self):
+        crops = Crop.objects.count()
+        serializers = [
+            ProductSerializer(data={"farmer": make_farmer().pk, "name": "Dragonfruit", "quantity": "lots"}),
+            CustomerActionSerializer(data={"customer_id": self.customer.pk, "crop": "Dragonfruit", "action": "BUY"}),
+            CustomerRecommendationSerializer(data={"customer": self.customer.pk, "crop": "Dragonfruit", "purchase_prob": "x"}),
+            DailyCropForecastSerializer(data={"crop": "Dragonfruit", "date": "someday", "price_estimate": 1}),
+        ]
+        for serializer in serializers:
+            self.assertFalse(serializer.is_valid(), type(serializer).__name__)
+        self.assertEqual(Crop.objects.count(), crops)
+
+    def test_unknown_crop_is_registered_on_save(self):
+        serializer = CustomerRecommendationSerializer(
+            data={"customer": self.customer.pk, "crop": "Dragonfruit", "purchase_prob": 0.4}
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        recommendation = serializer.save()
+        self.assertEqual(recommendation.crop.name, "Dragonfruit")
+        self.assertEqual(serializer.data["crop"], "Dragonfruit")
+
+    def test_alias_resolves_to_the_canonical_crop(self):
+        wheat = resolve_crop_id("Wheat")
+        CustomerRecommendation.objects.create(customer=self.customer, crop_id=wheat, purchase_prob=0.5)
+
+        # An alias of a crop the customer already has violates unique (customer, crop)
+        serializer = CustomerRecommendationSerializer(
+            data={"customer": self.customer.pk, "crop": " wheat ", "purchase_prob": 0.4}
+        )
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("non_field_errors", serializer.errors)
+
+    def test_product_rename_moves_the_crop(self):
+        product = Product.objects.create(
+            farmer=make_farmer(), name="Rice", crop_id=resolve_crop_id("Rice"), quantity=5, reap_date=datetime.date.today()
+        )
+        serializer = ProductSerializer(product, data={"name": "Dragonfruit"}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.save().crop.name, "Dragonfruit")
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentActionStatsTests(TransactionTestCase):
+    def test_overlapping_writers_do_not_deadlock(self):
+        customers = [make_customer("a"), make_customer("b")]
+        invalidate_crop_catalog()
+        crop_id = resolve_crop_id("Rice")
+
+        def add(customer):
+            return CustomerAction(
+                customer_id=customer, crop_id=crop_id, action="ADD", price_at_action=10,
+                discount_at_action=0, stock_at_action=5, timestamp=timezone.now(),
+            )
+
+        # Rows exist, so both writers take the locked UPDATE path; they touch the pairs in opposite orders
+        action_stats.apply_actions([add(customer) for customer in customers])
+        batches = [[add(customers[0]), add(customers[1])], [add(customers[1]), add(customers[0])]]
+
+        apply_delta = action_stats._apply_delta
+        started = threading.Barrier(2)
+
+        def slow_apply_delta(*args, **kwargs):
+            apply_delta(*args, **kwargs)
+            time.sleep(0.2)  # hold the row lock while the other writer takes its first one
+
+        def write(batch):
+            try:
+                started.wait()
+                action_stats.apply_actions(batch)
+            finally:
+                connection.close()
+
+        with mock.patch.object(action_stats, "_apply_delta", slow_apply_delta), \
+                ThreadPoolExecutor(max_workers=2) as pool:
+            list(pool.map(write, batches))
+
+        self.assertEqual(list(CustomerCropStats.objects.values_list("add_count", flat=True)), [3, 3])
+        self.assertEqual(list(Customer.objects.values_list("action_watermark", flat=True)), [3, 3])
+
+
+@override_settings(ACTION_LOG_SYNC=True)
+class ActionStatsTests(TestCase):
+    FIELDS = ("add_count", "remove_count", "purchase_count", "price_sum", "purchase_price_sum", "purchase_stock_sum")
+
+    def stats(self):
+        return list(CustomerCropStats.objects.order_by("crop_id").values_list(*self.FIELDS))
+
+    def test_incremental_rollup_matches_a_rebuild(self):
+        customer = make_customer()
+        invalidate_crop_catalog()
+        rice, wheat = resolve_crop_id("Rice"), resolve_crop_id("Wheat")
+        now = timezone.now()
+        actions = [
+            CustomerAction(customer_id=customer, crop_id=crop, action=kind, price_at_action=price,
+                           discount_at_action=10, stock_at_action=4, timestamp=now - datetime.timedelta(days=days))
+            for crop, kind, price, days in [
+                (rice, "ADD", 20, 3), (rice, "PURCHASE", 22, 2), (wheat, "ADD", 30, 1), (rice, "REMOVE", 21, 0),
+            ]
+        ]
+        action_log.write_actions(actions)
+        incremental = self.stats()
+        self.assertEqual(incremental, [(1, 1, 1, 63.0, 22.0, 4.0), (1, 0, 0, 30.0, 0.0, 0.0)])
+
+        action_stats.rebuild_stats()
+        self.assertEqual(self.stats(), incremental)
+
+    def test_deleting_an_action_subtracts_it(self):
+        customer = make_customer()
+        invalidate_crop_catalog()
+        crop_id = resolve_crop_id("Rice")
+        purchase = CustomerAction.objects.create(
+            customer_id=customer, crop_id=crop_id, action="PURCHASE", price_at_action=20,
+            discount_at_action=0, stock_at_action=3, timestamp=timezone.now(),
+        )
+        self.assertEqual(self.stats(), [(0, 0, 1, 20.0, 20.0, 3.0)])
+
+        response = APIClient().delete(f"/customeraction/{purchase.pk}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.stats(), [(0, 0, 0, 0.0, 0.0, 0.0)])
+        customer.refresh_from_db()
+        self.assertEqual(customer.action_watermark, 2)
+
+
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class ConditionalGetTests(TestCase):
+    def get(self, url, etag=None):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag) if etag else self.client.get(url)
+
+    def test_market_list_is_revalidated_after_a_purchase(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = make_listing(make_farmer(), stock=5)
+        first = self.get("/market/")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.get("/market/", first["ETag"]).status_code, 304)
+
+        cart = Cart.objects.create(customer=make_customer())
+        CartItem.objects.create(cart=cart, market_item=listing, quantity=2)
+        versions = dict(ChangeCounter.objects.values_list("name", "version"))
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout(cart)
+
+        # Only the shard of the listing sold is bumped
+        bumped = {
+            name for name, version in ChangeCounter.objects.values_list("name", "version")
+            if versions.get(name) != version
+        }
+        self.assertEqual(bumped, set(market_counters([listing.pk])))
+
+        second = self.get("/market/", first["ETag"])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second["ETag"], first["ETag"])
+        self.assertEqual(second.json()["results"][0]["stock"], 3)
+
+    def test_weather_endpoints_answer_304(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            WeatherData.objects.create(date=datetime.date.today(), temperature=25, cloudcover=40, precipitation=1)
+        with mock.patch.object(weather_refresh, "queue_weather_refresh", return_value=False):
+            for url in ("/weather/", "/api/weather/"):
+                first = self.get(url)
+                self.assertEqual(first.status_code, 200, url)
+                self.assertEqual(self.get(url, first["ETag"]).status_code, 304, url)
+
+
+class CropPricesConditionalGetTests(TransactionTestCase):
+    # A real commit per request: the forecasts written by the first GET
+    # must be covered by the ETag that GET returns
+    def test_first_response_of_the_day_is_not_stale(self):
+        invalidate_crop_catalog()
+        for name in ("Rice", "Wheat"):
+            CropPrices.objects.create(crop_id=resolve_crop_id(name), year=2025, predicted_yield=2.0, synthetic_price=30.0)
+
+        first = self.client.get("/crop-prices/")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(DailyCropForecast.objects.count(), 14)
+        self.assertTrue(all(len(row["forecast_7_days"]) == 7 for row in first.json()))
+
+        second = self.client.get("/crop-prices/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(DailyCropForecast.objects.count(), 14)
+
+
+class BulkListingTests(TestCase):
+    def setUp(self):
+        self.farmer = make_farmer()
+        invalidate_crop_catalog()
+        self.products = [
+            Product.objects.create(
+                farmer=self.farmer, name=f"Crop {i}", crop_id=resolve_crop_id("Rice"), quantity=100,
+                reap_date=datetime.date.today(),
+            )
+            for i in range(5)
+        ]
+
+    def rows(self, count, prefix):
+        return [
+            {"farmer": self.farmer.pk, "product": self.products[i % 5].pk, "product_name": f"{prefix} {i}",
+             "weight": 1, "stock": 2, "discount": 5}
+            for i in range(count)
+        ]
+
+    def post(self, rows):
+        return APIClient().post("/market/bulk/", {"listings": rows}, format="json")
+
+    def test_query_count_does_not_grow_with_new_crops(self):
+        self.post(self.rows(1, "Warm"))  # loads the price table
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.post(self.rows(2, "Small")).status_code, 201)
+        with self.assertNumQueries(len(small)):
+            response = self.post(self.rows(40, "Large"))  # 40 new crops over 5 products
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()["created"]), 40)
+        self.assertEqual(Crop.objects.filter(name__startswith="Large").count(), 40)
+        self.assertEqual(Market.objects.get(product_name="Large 7").crop.name, "Large 7")
+
+    def test_partial_failure_is_207(self):
+        rows = self.rows(2, "Okra")
+        rows[1]["product"] = 0
+        response = self.post(rows)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(len(response.json()["created"]), 1)
+        self.assertEqual(response.json()["errors"], [{"index": 1, "error": "Product not found"}])
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).quantity, 98)
+
+    def test_nothing_created_is_400_and_registers_no_crop(self):
+        rows = self.rows(1, "Dragonfruit")
+        rows[0]["stock"] = 500  # 500 kg from a 100 kg product
+        crops = Crop.objects.count()
+        response = self.post(rows)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Crop.objects.count(), crops)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).quantity, 100)
+
+
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class CheckoutTests(TestCase):
+    def setUp(self):
+        farmer = make_farmer()
+        self.rice = make_listing(farmer, stock=5, name="Rice")
+        self.wheat = make_listing(farmer, stock=1, name="Wheat")
+        self.cart = Cart.objects.create(customer=make_customer())
+
+    def add(self, listing, quantity):
+        CartItem.objects.create(cart=self.cart, market_item=listing, quantity=quantity)
+
+    def test_purchase_decrements_logs_and_clears_the_cart(self):
+        self.add(self.rice, 2)
+        self.add(self.wheat, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            purchased = checkout(self.cart)
+
+        self.assertEqual(purchased, [{"product": "Rice", "qty": 2}, {"product": "Wheat", "qty": 1}])
+        self.assertEqual(dict(Market.objects.values_list("pk", "stock")), {self.rice.pk: 3, self.wheat.pk: 0})
+        self.assertEqual(
+            sorted(CustomerAction.objects.filter(action="PURCHASE").values_list("quantity", "stock_at_action")),
+            [(1, 0), (2, 3)],
+        )
+        self.assertFalse(self.cart.items.exists())
+
+    def test_short_item_buys_nothing(self):
+        self.add(self.rice, 2)
+        self.add(self.wheat, 2)
+        with self.assertRaises(InsufficientStock) as raised:
+            checkout(self.cart)
+        self.assertEqual(raised.exception.details, [{"product": "Wheat", "requested": 2, "stock": 1}])
+        self.assertEqual(Market.objects.get(pk=self.rice.pk).stock, 5)
+        self.assertEqual(self.cart.items.count(), 2)
+
+    def test_listing_deleted_during_checkout_is_reported(self):
+        self.add(self.rice, 1)
+        self.add(self.wheat, 1)
+        deduct = checkout_module.deduct_market_stock_many
+
+        def delete_then_deduct(demand):
+            Market.objects.filter(pk=self.wheat.pk).delete()
+            return deduct(demand)
+
+        with mock.patch.object(checkout_module, "deduct_market_stock_many", delete_then_deduct):
+            response = APIClient().post(f"/cart/{self.cart.pk}/purchase/")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["invalid_items"],
+            [{"product": "Wheat", "requested": 1, "stock": 0, "error": "No longer available"}],
+        )
+        self.assertEqual(Market.objects.get(pk=self.rice.pk).stock, 5)
+
+
+@skipUnlessDBFeature("has_select_for_update")
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class ConcurrentCheckoutTests(TransactionTestCase):
+    def test_same_cart_is_bought_once(self):
+        listing = make_listing(make_farmer(), stock=10)
+        cart = Cart.objects.create(customer=make_customer())
+        CartItem.objects.create(cart=cart, market_item=listing, quantity=1)
+
+        deduct = checkout_module.deduct_market_stock_many
+        started = threading.Barrier(2)
+
+        def slow_deduct(demand):
+            time.sleep(0.2)  # both requests have read the cart by now, unless the first locked it
+            return deduct(demand)
+
+        def buy(_):
+            try:
+                started.wait()
+                return checkout(Cart.objects.get(pk=cart.pk))
+            finally:
+                connection.close()
+
+        with mock.patch.object(checkout_module, "deduct_market_stock_many", slow_deduct), \
+                ThreadPoolExecutor(max_workers=2) as pool:
+            results = list(pool.map(buy, range(2)))
+
+        self.assertEqual(sorted(map(len, results)), [0, 1])
+        self.assertEqual(Market.objects.get(pk=listing.pk).stock, 9)
+        self.assertEqual(CustomerAction.objects.filter(action="PURCHASE").count(), 1)
+
+
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class CartApplyTests(TestCase):
+    def setUp(self):
+        farmer = make_farmer()
+        self.rice = make_listing(farmer, stock=5, name="Rice")
+        self.wheat = make_listing(farmer, stock=5, name="Wheat")
+        self.maize = make_listing(farmer, stock=2, name="Maize")
+        self.cart = Cart.objects.create(customer=make_customer())
+        self.rice_item = CartItem.objects.create(cart=self.cart, market_item=self.rice, quantity=1)
+        self.wheat_item = CartItem.objects.create(cart=self.cart, market_item=self.wheat, quantity=2)
+
+    def apply(self, operations):
+        with self.captureOnCommitCallbacks(execute=True):
+            return APIClient().post(f"/cart/{self.cart.pk}/apply/", {"operations": operations}, format="json")
+
+    def contents(self):
+        return dict(self.cart.items.values_list("market_item_id", "quantity"))
+
+    def test_add_update_remove_in_one_batch(self):
+        response = self.apply([
+            {"op": "add", "market_item_id": self.maize.pk, "quantity": 2},
+            {"op": "update", "item_id": self.rice_item.pk, "quantity": 3},
+            {"op": "remove", "item_id": self.wheat_item.pk},
+            {"op": "update", "market_item_id": self.maize.pk, "quantity": 1},  # added earlier in the batch
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.contents(), {self.rice.pk: 3, self.maize.pk: 1})
+        self.assertEqual(
+            {(item["market_items"]["id"], item["quantity"]) for item in response.json()["items"]},
+            {(self.rice.pk, 3), (self.maize.pk, 1)},
+        )
+        self.assertEqual(
+            sorted(CustomerAction.objects.values_list("action", "quantity")),
+            [("ADD", 2), ("ADD", 2), ("REMOVE", 1), ("REMOVE", 2)],
+        )
+
+    def test_one_failed_operation_rolls_back_the_batch(self):
+        response = self.apply([
+            {"op": "add", "market_item_id": self.maize.pk},
+            {"op": "update", "item_id": self.rice_item.pk, "quantity": 4},
+            {"op": "remove", "item_id": 999999},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["errors"], [{"index": 2, "error": "Item not found"}])
+        self.assertEqual(self.contents(), {self.rice.pk: 1, self.wheat.pk: 2})
+        self.assertFalse(CustomerAction.objects.exists())
+
+    def test_out_of_stock(self):
+        response = self.apply([
+            {"op": "add", "market_item_id": self.maize.pk, "quantity": 2},
+            {"op": "add", "market_item_id": self.maize.pk, "quantity": 1},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["errors"], [{"index": 1, "error": "Cannot add more than available stock (2)"}]
+        )
+        self.assertNotIn(self.maize.pk, self.contents())
+
+    def test_update_requires_a_quantity(self):
+        response = self.apply([{"op": "update", "item_id": self.rice_item.pk}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["errors"], [{"index": 0, "error": "quantity is required for update"}])
+        self.assertEqual(self.contents(), {self.rice.pk: 1, self.wheat.pk: 2})
+
+
+@override_settings(BACKGROUND_TASKS_SYNC=False, BACKGROUND_RETRY_BACKOFF=30, BACKGROUND_MAX_BACKOFF=100)
+class BackgroundBackoffTests(TestCase):
+    key = ("test", 1)
+
+    def setUp(self):
+        background._failures.clear()
+        self.addCleanup(background._failures.clear)
+        self.now = 1000.0
+        patcher = mock.patch.object(background.time, "monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def wait(self, key):
+        deadline = time.time() + 5
+        while background.is_pending(key):
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+
+    def submit(self, fn):
+        queued = background.submit_once(self.key, fn)
+        self.wait(self.key)
+        return queued
+
+    def test_failed_task_backs_off(self):
+        failing = mock.Mock(side_effect=RuntimeError("model missing"))
+        with self.assertLogs("services.background", "ERROR"):
+            self.assertTrue(self.submit(failing))
+        self.assertFalse(self.submit(failing))
+        self.now += 29
+        self.assertFalse(self.submit(failing))
+        self.assertEqual(failing.call_count, 1)
+
+        self.now += 1
+        with self.assertLogs("services.background", "ERROR"):
+            self.assertTrue(self.submit(failing))
+        self.assertEqual(background._failures[self.key][1], self.now + 60)  # doubled
+
+        for _ in range(3):
+            self.now += 100
+            with self.assertLogs("services.background", "ERROR"):
+                self.submit(failing)
+        self.assertEqual(background._failures[self.key][1], self.now + 100)  # capped
+        self.assertEqual(failing.call_count, 5)
+
+    def test_success_clears_the_backoff(self):
+        with self.assertLogs("services.background", "ERROR"):
+            self.submit(mock.Mock(side_effect=RuntimeError))
+        self.now += 30
+        succeeding = mock.Mock()
+        self.assertTrue(self.submit(succeeding))
+        self.assertNotIn(self.key, background._failures)
+        self.assertTrue(self.submit(succeeding))
+        self.assertEqual(succeeding.call_count, 2)
+
+    def test_recommendations_are_not_requeued_while_backing_off(self):
+        customer = make_customer()
+        Customer.objects.filter(pk=customer.pk).update(action_watermark=5, recommendations_watermark=4)
+        key = ("recommendations", customer.pk)
+        client = APIClient()
+
+        with mock.patch("services.recommendations.refresh_recommendations",
+                        side_effect=RuntimeError("model missing")) as refresh:
+            with self.assertLogs("services.background", "ERROR"):
+                response = client.get("/recommendations/", {"customer_id": customer.pk})
+                self.wait(key)
+            self.assertEqual(response["X-Recommendations-Refreshing"], "true")
+
+            for _ in range(3):
+                response = client.get("/recommendations/", {"customer_id": customer.pk})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response["X-Recommendations-Refreshing"], "false")
+            self.assertEqual(refresh.call_count, 1)
+
+
+class LoadModelTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for name, value in (("MODEL_DIR", directory.name), ("_loaded", None), ("_resolved", None)):
+            patcher = mock.patch.object(recommendation_model, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.listdir = mock.patch.object(recommendation_model.os, "listdir", wraps=os.listdir)
+        self.addCleanup(self.listdir.stop)
+        self.listdir = self.listdir.start()
+
+    def save(self, version):
+        recommendation_model.joblib.dump({"version": version}, recommendation_model._model_path(version))
+
+    def test_no_model(self):
+        self.assertIsNone(recommendation_model.load_model())
+
+    def test_serves_newest_and_caches_the_path(self):
+        self.save(1)
+        self.save(2)
+        for _ in range(3):
+            self.assertEqual(recommendation_model.load_model()["version"], 2)
+        self.assertEqual(self.listdir.call_count, 1)
+
+    @override_settings(RECOMMENDATION_MODEL_RECHECK=0)
+    def test_picks_up_new_versions_after_the_recheck(self):
+        self.save(1)
+        self.assertEqual(recommendation_model.load_model()["version"], 1)
+        self.save(2)
+        self.assertEqual(recommendation_model.load_model()["version"], 2)
+
+    @override_settings(RECOMMENDATION_MODEL_VERSION=1)
+    def test_pinned_version(self):
+        self.save(1)
+        self.save(2)
+        self.assertEqual(recommendation_model.load_model()["version"], 1)
+
+    @override_settings(RECOMMENDATION_MODEL_VERSION=7)
+    def test_missing_pinned_version_falls_back_to_newest(self):
+        self.save(1)
+        self.save(2)
+        with self.assertLogs("ml_model.recommendation_model", "WARNING") as logs:
+            self.assertEqual(recommendation_model.load_model()["version"], 2)
+        self.assertIn("v7 not found", logs.output[0])
+
+    @override_settings(RECOMMENDATION_MODEL_VERSION=7)
+    def test_missing_pinned_version_without_models(self):
+        with self.assertLogs("ml_model.recommendation_model", "WARNING"):
+            self.assertIsNone(recommendation_model.load_model())
+
+
+class ActionArchiveSingleTableTests(TestCase):
+    @unittest.skipIf(connection.vendor == "postgresql", "covered by ActionArchiveTests")
+    def test_rows_inserted_while_archiving_are_kept(self):
+        customer, crop_id = make_customer(), make_listing(make_farmer(), stock=1).crop_id
+
+        def action(day):
+            return CustomerAction.objects.create(
+                customer_id=customer, crop_id=crop_id, action="ADD",
+                price_at_action=10, discount_at_action=0, stock_at_action=1,
+                timestamp=datetime.datetime(2020, 1, day, tzinfo=datetime.timezone.utc),
+            )
+
+        first = action(2)
+        late = []
+        replace = os.replace
+
+        def insert_then_replace(*args):
+            late.append(action(1))
+            return replace(*args)
+
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(action_partitions.os, "replace", insert_then_replace):
+            count, path = action_partitions.archive_month(datetime.date(2020, 1, 1), directory)
+            with gzip.open(path, "rt") as archive:
+                self.assertEqual([json.loads(line)["id"] for line in archive], [first.pk])
+
+        self.assertEqual(count, 1)
+        self.assertEqual(list(CustomerAction.objects.values_list("pk", flat=True)), [late[0].pk])
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "CustomerAction is only partitioned on PostgreSQL")
+class ActionArchiveTests(TestCase):
+    month = datetime.date(2020, 1, 1)
+
+    def setUp(self):
+        self.customer = make_customer()
+        self.crop_id = make_listing(make_farmer(), stock=1).crop_id
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        # Check the FKs per row: a partition with pending deferred checks cannot be dropped
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+    def action(self, day, **fields):
+        return CustomerAction(
+            customer_id=self.customer, crop_id=self.crop_id, action="ADD",
+            price_at_action=10, discount_at_action=0, stock_at_action=1,
+            timestamp=datetime.datetime(2020, 1, day, tzinfo=datetime.timezone.utc), **fields,
+        )
+
+    def archived_ids(self, path):
+        with gzip.open(path, "rt") as archive:
+            return [json.loads(line)["id"] for line in archive]
+
+    def default_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {connection.ops.quote_name(DEFAULT_PARTITION)}")
+            return cursor.fetchone()[0]
+
+    def test_rows_inserted_while_archiving_are_kept(self):
+        action_partitions.create_partition(self.month)
+        first, second = self.action(2), self.action(3)
+        first.save()
+        second.save()
+        late = []
+        replace = os.replace
+
+        def insert_then_replace(*args):
+            # A late row of the month arrives after the file is written
+            late.append(self.action(4))
+            late[0].save()
+            return replace(*args)
+
+        with mock.patch.object(action_partitions.os, "replace", insert_then_replace):
+            count, path = action_partitions.archive_month(self.month, self.directory)
+
+        self.assertEqual(count, 2)
+        self.assertEqual(self.archived_ids(path), [first.pk, second.pk])
+        self.assertNotIn(self.month, existing_partitions())
+        self.assertEqual(list(CustomerAction.objects.values_list("pk", flat=True)), [late[0].pk])
+        self.assertEqual(self.default_count(), 1)
+
+    def test_interrupted_run_is_resumed(self):
+        action_partitions.create_partition(self.month)
+        self.action(2).save()
+        self.action(3).save()
+
+        with mock.patch.object(action_partitions, "_write_archive", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                action_partitions.archive_month(self.month, self.directory)
+        self.assertIn(self.month, action_partitions.detached_partitions())
+        self.assertIn(self.month, months_to_archive(12))
+
+        count, path = action_partitions.archive_month(self.month, self.directory)
+        self.assertEqual(count, 2)
+        self.assertEqual(len(self.archived_ids(path)), 2)
+        self.assertNotIn(self.month, action_partitions.detached_partitions())
+        self.assertNotIn(self.month, months_to_archive(12))
+
+    def test_writes_create_next_months_partition(self):
+        now = datetime.datetime(2031, 5, 10, tzinfo=datetime.timezone.utc)
+        with mock.patch.object(action_partitions, "_ensured_month", None), \
+                mock.patch.object(action_partitions, "timezone", mock.Mock(now=lambda: now)), \
+                mock.patch.object(action_partitions, "ensure_partitions", wraps=action_partitions.ensure_partitions) as ensure:
+            action_log.write_actions([self.action(5)])
+            action_log.write_actions([self.action(6)])
+
+        self.assertEqual(ensure.call_count, 1)
+        partitions = existing_partitions()
+        self.assertIn(datetime.date(2031, 5, 1), partitions)
+        self.assertIn(datetime.date(2031, 6, 1), partitions)
+
+
+class EpochSecondsTests(TestCase):
+    def test_matches_python_timestamp(self):
+        stamp = datetime.datetime(2024, 2, 29, 13, 45, 10, 250000, tzinfo=datetime.timezone.utc)
+        CustomerAction.objects.create(
+            customer_id=make_customer(), crop_id=make_listing(make_farmer(), stock=1).crop_id, action="ADD",
+            price_at_action=10, discount_at_action=0, stock_at_action=1, timestamp=stamp,
+        )
+        epoch = CustomerAction.objects.annotate(epoch=_EpochSeconds("timestamp")).get().epoch
+        self.assertAlmostEqual(epoch, stamp.timestamp(), places=2)
+
+    def test_other_vendors_raise(self):
+        query = CustomerAction.objects.annotate(epoch=_EpochSeconds("timestamp")).query
+        compiler = query.get_compiler(connection=connection)
+        other = mock.Mock(vendor="mysql", ops=connection.ops, features=connection.features)
+        with self.assertRaisesMessage(NotSupportedError, "not implemented for mysql"):
+            _EpochSeconds("timestamp").resolve_expression(query).as_sql(compiler, other)
+
+
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True, PRICE_RESOLVER_TTL=60)
+class PriceResolverTests(TestCase):
+    def setUp(self):
+        invalidate_crop_catalog()
+        price_resolver.invalidate_price_table()
+        self.addCleanup(price_resolver.invalidate_price_table)
+        self.rice, self.wheat = resolve_crop_id("Rice"), resolve_crop_id("Wheat")
+
+    def price(self, crop_id, year, price):
+        return CropPrices.objects.create(crop_id=crop_id, year=year, predicted_yield=1.0, synthetic_price=price)
+
+    def test_latest_year_wins_and_the_table_is_cached(self):
+        self.price(self.rice, 2024, 12.5)
+        self.price(self.rice, 2023, 10.0)
+        self.price(self.wheat, 2024, 20.0)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(price_resolver.get_base_price(self.rice), 12.5)
+        with self.assertNumQueries(0):
+            self.assertEqual(price_resolver.get_base_price(self.wheat), 20.0)
+            self.assertEqual(price_resolver.get_base_price(self.rice), 12.5)
+
+    def test_fallbacks(self):
+        self.assertEqual(price_resolver.get_base_price(self.rice), price_resolver.FALLBACK_BASE_PRICE)
+
+        self.price(self.wheat, 2024, 20.0)
+        for _ in range(20):
+            self.assertTrue(18.0 <= price_resolver.get_base_price(self.rice) <= 24.0)
+
+    def test_price_writes_invalidate_the_table(self):
+        row = self.price(self.rice, 2024, 12.5)
+        self.assertEqual(price_resolver.get_base_price(self.rice), 12.5)
+
+        row.synthetic_price = 15.0
+        row.save()
+        self.assertEqual(price_resolver.get_base_price(self.rice), 15.0)
+
+        row.delete()
+        self.assertEqual(price_resolver.get_base_price(self.rice), price_resolver.FALLBACK_BASE_PRICE)
+
+    def test_writes_from_other_processes_show_after_the_ttl(self):
+        now = [1000.0]
+        self.price(self.rice, 2024, 12.5)
+        with mock.patch.object(price_resolver.time, "monotonic", lambda: now[0]):
+            self.assertEqual(price_resolver.get_base_price(self.rice), 12.5)
+            CropPrices.objects.update(synthetic_price=15.0)  # no signal, like another process
+
+            now[0] += 59
+            self.assertEqual(price_resolver.get_base_price(self.rice), 12.5)
+            now[0] += 1
+            self.assertEqual(price_resolver.get_base_price(self.rice), 15.0)
+
+    def test_listing_is_priced_from_the_table(self):
+        self.price(self.rice, 2024, 12.5)
+        farmer = make_farmer()
+        product = make_listing(farmer, stock=1).product
+
+        response = APIClient().post("/market/", {
+            "farmer": farmer.pk, "product": product.pk, "product_name": "rice",
+            "weight": 2, "stock": 3, "discount": 10,
+        }, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["price"], 22.5)  # 12.5 × 2 kg − 10%
+
+
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class InterestScoreTests(TestCase):
+    def setUp(self):
+        self.customer = make_customer()
+        invalidate_crop_catalog()
+        self.rice, self.wheat = resolve_crop_id("Rice"), resolve_crop_id("Wheat")
+        self.now = timezone.now()
+
+    def action(self, crop_id, kind, days_ago):
+        return CustomerAction(
+            customer_id=self.customer, crop_id=crop_id, action=kind, price_at_action=20,
+            discount_at_action=0, stock_at_action=5, timestamp=self.now - datetime.timedelta(days=days_ago),
+        )
+
+    def expected(self, actions, at):
+        return sum(
+            action_stats.ACTION_SCORES[action.action] * action_stats._decay(action_stats._days(at, action.timestamp))
+            for action in actions
+        )
+
+    def interest_at(self, crop_id, at):
+        score, valued_at = CustomerCropStats.objects.filter(crop_id=crop_id).values_list("interest_score", "interest_at").get()
+        return score * action_stats._decay(action_stats._days(at, valued_at))
+
+    def test_combine_interest_is_order_independent(self):
+        t0 = self.now
+        t1 = t0 + datetime.timedelta(days=2)
+        in_order = action_stats.combine_interest(*action_stats.combine_interest(0.0, None, 1.0, t0), 3.0, t1)
+        out_of_order = action_stats.combine_interest(*action_stats.combine_interest(0.0, None, 3.0, t1), 1.0, t0)
+        self.assertEqual(in_order[1], t1)
+        self.assertEqual(out_of_order[1], t1)
+        self.assertAlmostEqual(in_order[0], out_of_order[0])
+        self.assertAlmostEqual(in_order[0], 3.0 + math.exp(-0.2))
+
+    def test_incremental_scores_match_the_history(self):
+        batches = [
+            [self.action(self.rice, "ADD", 10), self.action(self.wheat, "ADD", 9)],
+            [self.action(self.rice, "PURCHASE", 4)],
+            [self.action(self.rice, "ADD", 12), self.action(self.rice, "REMOVE", 1)],  # one older than stored
+            [self.action(self.wheat, "PURCHASE", 0)],
+        ]
+        for batch in batches:
+            action_log.write_actions(batch)
+        actions = [action for batch in batches for action in batch]
+
+        for crop_id in (self.rice, self.wheat):
+            expected = self.expected([a for a in actions if a.crop_id == crop_id], self.now)
+            self.assertAlmostEqual(self.interest_at(crop_id, self.now), expected, places=9)
+
+        # Subtracting an action takes its contribution back out
+        removed = actions[1]
+        action_stats.apply_actions([removed], sign=-1)
+        expected = self.expected([a for a in actions if a.crop_id == self.wheat and a is not removed], self.now)
+        self.assertAlmostEqual(self.interest_at(self.wheat, self.now), expected, places=9)
+
+    def test_rebuild_and_serving_features_agree(self):
+        actions = [self.action(self.rice, "ADD", 6), self.action(self.rice, "PURCHASE", 2), self.action(self.rice, "ADD", 3)]
+        action_log.write_actions(actions)
+        incremental = serving_features([self.customer])
+
+        action_stats.rebuild_stats()
+        rebuilt = serving_features([self.customer])
+
+        self.assertAlmostEqual(
+            incremental["total_weighted_score"].iloc[0], self.expected(actions, timezone.now()), places=5
+        )
+        self.assertAlmostEqual(
+            incremental["total_weighted_score"].iloc[0], rebuilt["total_weighted_score"].iloc[0], places=5
+        )
+
+
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class CropNeighborTests(TestCase):
+    def setUp(self):
+        invalidate_crop_catalog()
+        self.a, self.b, self.c, self.d = (resolve_crop_id(name) for name in ("Apple", "Barley", "Corn", "Dates"))
+        baskets = [[self.a, self.b, self.c], [self.a, self.b], [self.b, self.d], [self.a]]
+        for i, basket in enumerate(baskets):
+            customer = make_customer(f"buyer{i}")
+            for crop_id in basket:
+                self.act(customer, crop_id, "PURCHASE")
+        self.act(customer, self.d, "ADD")  # not a purchase: no co-purchase of Apple and Dates
+
+    def act(self, customer, crop_id, kind):
+        CustomerAction.objects.create(
+            customer_id=customer, crop_id=crop_id, action=kind, price_at_action=10,
+            discount_at_action=0, stock_at_action=1, timestamp=timezone.now(),
+        )
+
+    def neighbors(self):
+        return {
+            (crop_id, neighbor_id): (co_purchases, round(score, 6), rank)
+            for crop_id, neighbor_id, co_purchases, score, rank in CropNeighbor.objects.values_list(
+                "crop_id", "neighbor_id", "co_purchases", "score", "rank"
+            )
+        }
+
+    def test_cosine_neighbours_and_purchaser_counts(self):
+        stats = build_crop_neighbors(chunk_size=2)  # several keyset chunks
+
+        self.assertEqual(stats, {"customers": 4, "pairs": 4, "neighbors": 8})
+        neighbors = self.neighbors()
+        one = round(1 / math.sqrt(3), 6)  # one co-purchase, 3 and 1 purchasers
+        self.assertEqual(neighbors[self.a, self.b], (2, round(2 / 3, 6), 0))
+        self.assertEqual(neighbors[self.a, self.c], (1, one, 1))
+        self.assertEqual(neighbors[self.b, self.a][2], 0)
+        self.assertEqual(neighbors[self.d, self.b], (1, one, 0))
+        self.assertNotIn((self.a, self.d), neighbors)
+        self.assertEqual(
+            dict(Crop.objects.filter(pk__in=[self.a, self.b, self.c, self.d]).values_list("pk", "purchasers")),
+            {self.a: 3, self.b: 3, self.c: 1, self.d: 1},
+        )
+
+        build_crop_neighbors(chunk_size=10000)
+        self.assertEqual(self.neighbors(), neighbors)
+
+    def test_k_and_min_co_purchases(self):
+        build_crop_neighbors(k=1)
+        # Corn's two neighbours tie on score and count: the higher id wins
+        self.assertEqual(set(self.neighbors()), {
+            (self.a, self.b), (self.b, self.a), (self.c, max(self.a, self.b)), (self.d, self.b),
+        })
+
+        build_crop_neighbors(min_co_purchases=2)
+        self.assertEqual(set(self.neighbors()), {(self.a, self.b), (self.b, self.a)})
+
+    def test_candidates_from_neighbours(self):
+        build_crop_neighbors()
+
+        self.assertEqual([crop_id for crop_id, _ in related_crops([self.a], per_crop=5)[self.a]], [self.b, self.c])
+        self.assertEqual(popular_crops(2), [(crop_id, 0.75) for crop_id in sorted([self.a, self.b])])
+
+        results = add_related_crops({1: [{"crop_id": self.c, "purchase_prob": 0.5}]})
+        self.assertEqual(results[1][0], {"crop_id": self.c, "purchase_prob": 0.5})
+        self.assertEqual({rec["crop_id"] for rec in results[1][1:]}, {self.a, self.b})
+        for rec in results[1][1:]:
+            self.assertAlmostEqual(rec["purchase_prob"], 0.5 / math.sqrt(3))
+
+
+@override_settings(ACTION_LOG_SYNC=True, BACKGROUND_TASKS_SYNC=True)
+class SaveRecommendationsTests(TestCase):
+    def setUp(self):
+        invalidate_crop_catalog()
+        self.rice, self.wheat, self.maize = (resolve_crop_id(name) for name in ("Rice", "Wheat", "Maize"))
+        self.customer, self.other = make_customer(), make_customer("other")
+        save_recommendations_batch({
+            self.customer.pk: [self.rec(self.rice, 0.9), self.rec(self.wheat, 0.5), self.rec(self.maize, 0.2)],
+            self.other.pk: [self.rec(self.rice, 0.4)],
+        })
+        self.rows = self.stored()
+
+    def rec(self, crop_id, prob):
+        return {"crop_id": crop_id, "purchase_prob": prob}
+
+    def stored(self):
+        return {
+            (customer_id, crop_id): (pk, prob)
+            for pk, customer_id, crop_id, prob in CustomerRecommendation.objects.values_list(
+                "pk", "customer_id", "crop_id", "purchase_prob"
+            )
+        }
+
+    def save(self, recs):
+        with mock.patch("services.recommendations.refresh_feeds") as refresh_feeds, \
+                CaptureQueriesContext(connection) as queries:
+            result = save_recommendations_batch({self.customer.pk: recs})
+        writes = [q["sql"] for q in queries.captured_queries if q["sql"].split(None, 1)[0] in ("INSERT", "UPDATE", "DELETE")]
+        refresh_feeds.assert_called_once_with(result["changed"])
+        return result, writes
+
+    def test_unchanged_recommendations_write_nothing(self):
+        result, writes = self.save([
+            self.rec(self.rice, 0.9), self.rec(self.wheat, 0.5 + 1e-4), self.rec(self.maize, 0.2),
+        ])
+        self.assertEqual(result, {"written": 0, "deleted": 0, "changed": set()})
+        self.assertEqual(writes, [])
+        self.assertEqual(self.stored(), self.rows)
+
+    def test_diff_upserts_moved_and_new_crops_and_deletes_dropped_ones(self):
+        potato = resolve_crop_id("Potato")
+        result, writes = self.save([
+            self.rec(self.rice, 0.9), self.rec(self.wheat, 0.6), self.rec(potato, 0.3),
+            self.rec(potato, 0.1),  # duplicate: the first one wins
+        ])
+
+        self.assertEqual(result, {"written": 2, "deleted": 1, "changed": {self.customer.pk}})
+        stored = self.stored()
+        self.assertEqual(stored[self.customer.pk, self.rice], self.rows[self.customer.pk, self.rice])
+        self.assertEqual(stored[self.customer.pk, self.wheat], (self.rows[self.customer.pk, self.wheat][0], 0.6))
+        self.assertEqual(stored[self.customer.pk, potato][1], 0.3)
+        self.assertNotIn((self.customer.pk, self.maize), stored)
+        self.assertEqual(stored[self.other.pk, self.rice], self.rows[self.other.pk, self.rice])
+        self.assertEqual(len(writes), 2)  # one upsert, one delete
+
+    def test_only_deletions_still_mark_the_customer_changed(self):
+        result, _ = self.save([self.rec(self.rice, 0.9), self.rec(self.wheat, 0.5)])
+        self.assertEqual(result, {"written": 0, "deleted": 1, "changed": {self.customer.pk}})
+
+
+class WeatherIngestTests(TestCase):
+    def setUp(self):
+        WeatherLocation.objects.all().delete()  # the districts seeded by migration 0034
+        self.pune = WeatherLocation.objects.create(name="Pune", latitude=18.52, longitude=73.86)
+        self.patna = WeatherLocation.objects.create(name="Patna", latitude=25.59, longitude=85.14)
+        WeatherLocation.objects.create(name="Inactive", latitude=10.0, longitude=76.0, active=False)
+
+    def ingest(self, **stub_options):
+        with StubWeatherServer(**stub_options) as stub:
+            return ingest_weather(url=stub.url, concurrency=2, timeout=5)
+
+    def rows(self):
+        return {
+            location_id: (pk, date, temperature, fetched_at)
+            for pk, location_id, date, temperature, fetched_at in LocationWeather.objects.values_list(
+                "pk", "location_id", "date", "temperature", "fetched_at"
+            )
+        }
+
+    def test_ingests_every_active_location(self):
+        result = self.ingest()
+
+        self.assertEqual((result["locations"], result["saved"], result["failed"]), (2, 2, []))
+        rows = self.rows()
+        self.assertEqual(set(rows), {self.pune.pk, self.patna.pk})
+        for location in (self.pune, self.patna):
+            location.refresh_from_db()
+            self.assertEqual(location.last_fetched_at, rows[location.pk][3])
+            # The reading of the location's local day (longitude / 15 hours ahead of UTC)
+            local_now = timezone.now() + datetime.timedelta(hours=round(location.longitude / 15))
+            self.assertIn(rows[location.pk][1], {local_now.date(), (local_now - datetime.timedelta(hours=1)).date()})
+
+    def test_reingesting_upserts_in_place(self):
+        self.ingest()
+        first = self.rows()
+
+        result = self.ingest()
+
+        self.assertEqual(result["saved"], 2)
+        second = self.rows()
+        self.assertEqual(LocationWeather.objects.count(), 2)
+        for location_id, (pk, date, _, fetched_at) in second.items():
+            self.assertEqual((pk, date), first[location_id][:2])
+            self.assertGreater(fetched_at, first[location_id][3])
+
+    def test_a_failing_location_does_not_stop_the_others(self):
+        result = self.ingest(fail_latitudes=[self.patna.latitude])
+
+        self.assertEqual(result["saved"], 1)
+        self.assertEqual([name for name, _ in result["failed"]], ["Patna"])
+        self.assertIn("HTTPStatusError", result["failed"][0][1])
+        self.assertEqual(set(self.rows()), {self.pune.pk})
+        self.patna.refresh_from_db()
+        self.assertIsNone(self.patna.last_fetched_at)
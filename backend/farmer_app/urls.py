@@ -22,5 +22,6 @@ urlpatterns = [
     path('login/', LoginView.as_view(), name='login'),  # manual APIView route
     path("weather/", WeatherAPI.as_view(), name='weather'),
     path('api/weather/', get_weather, name='get_weather'),
+    path('api/action-log/', action_log_status, name='action_log_status'),
     path('recommendations/<int:customer_id>/', views.preferred_market_items_api, name='preferred_market_items_api'),
 ]
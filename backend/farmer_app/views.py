@@ -1,19 +1,31 @@
 from rest_framework import viewsets, permissions, status
 from django.views.decorators.http import require_http_methods
+from django.utils.decorators import method_decorator
 from django.http import JsonResponse
-from services.market_search import get_preferred_market_items
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from services.customer_feed import get_feed_items
+from services.change_counters import conditional_on, market_counters
+from services.crop_forecasts import FORECAST_DAYS, average_synthetic_price, ensure_daily_forecasts, synthetic_price
+from services.crop_catalog import get_crop_id, resolve_crop_id
+from services.market_listings import MAX_BULK_LISTINGS, create_listings_bulk, listing_price
+from services.action_log import action_log_metrics, log_action
+from services.action_stats import apply_actions
+from services.cart_ops import CartOperationError, apply_cart_operations
+from services.checkout import checkout
+from services.stock_ledger import InsufficientStock, deduct_product_quantity, restore_product_quantity
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view
-from services.fetch_weather import fetch_and_save_weather
-from ml_model.weather_predictor import predict_next_7_days
+from services.weather_refresh import serve_stale_while_revalidate
 from django.shortcuts import render
+from django.db import transaction
 from .models import *
 from .serializers import *
+from .pagination import CustomerActionCursorPagination, MarketCursorPagination
 import datetime
-from services.recommendations import get_customer_recommendations
-import numpy as np
+from services.recommendations import queue_recommendation_refresh
 
 
 
@@ -90,12 +102,35 @@ class MarketViewSet(viewsets.ViewSet):
     permission_classes = [permissions.AllowAny]
 
     # ---------------- LIST ----------------
+    @method_decorator(conditional_on(*market_counters()))
     def list(self, request):
-        farmer_id = request.query_params.get("farmer_id")
-        items = Market.objects.filter(farmer_id=farmer_id) if farmer_id else Market.objects.all()
+        params = request.query_params
+        items = Market.objects.all()
 
-        serializer = MarketSerializer(items, many=True)
-        return Response(serializer.data)
+        # ---------------- Filters ----------------
+        try:
+            if params.get("farmer_id"):
+                items = items.filter(farmer_id=int(params["farmer_id"]))
+            if params.get("product_name"):
+                items = items.filter(crop_id=get_crop_id(params["product_name"]))
+            if params.get("min_price"):
+                items = items.filter(price__gte=float(params["min_price"]))
+            if params.get("max_price"):
+                items = items.filter(price__lte=float(params["max_price"]))
+            if params.get("min_discount"):
+                items = items.filter(discount__gte=float(params["min_discount"]))
+        except ValueError:
+            return Response({"error": "farmer_id, min_price, max_price and min_discount must be numbers"}, status=400)
+
+        if params.get("in_stock") in ("1", "true", "True"):
+            items = items.filter(stock__gt=0)
+
+        # ---------------- Cursor page ----------------
+        paginator = MarketCursorPagination()
+        page = paginator.paginate_queryset(items, request, view=self)
+
+        serializer = MarketSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     # ---------------- CREATE ----------------
     def create(self, request):
@@ -106,61 +141,68 @@ class MarketViewSet(viewsets.ViewSet):
         stock = int(request.data.get("stock"))
         discount = float(request.data.get("discount"))
 
-        # ---------------- 1) Try ML Price ----------------
-        crop_price_obj = CropPrices.objects.filter(
-            crop__iexact=product_name
-        ).order_by("-year").first()
-
-        if crop_price_obj:
-            base_price = float(crop_price_obj.synthetic_price)
-        else:
-            # ---------------- 2) Fallback = avg price × random 0.9–1.2 ----------------
-            from django.db.models import Avg
-            avg = CropPrices.objects.aggregate(avg=Avg("synthetic_price"))["avg"]
-
-            if avg:
-                import random
-                base_price = float(avg) * random.uniform(0.9, 1.2)
-            else:
-                base_price = 10  # final fallback
-
-        # ---------------- Final price ----------------
-        final_price = round(base_price * weight * (1 - discount / 100), 2)
-
-        # ---------------- Validate stock ----------------
+        # ---------------- Validate product & listing ----------------
         try:
             prod = Product.objects.get(id=product)
         except Product.DoesNotExist:
             return Response({"error": "Product not found"}, status=404)
 
-        total_weight_needed = weight * stock
-
-        if prod.quantity < total_weight_needed:
-            return Response({
-                "error": f"Not enough stock. Available: {prod.quantity} kg"
-            }, status=400)
-
-        # Deduct
-        prod.quantity -= total_weight_needed
-        prod.save()
-
-        # ---------------- Save Market Item ----------------
-        data = {
+        serializer = MarketSerializer(data={
             "farmer": farmer,
             "product": product,
             "product_name": product_name,
             "weight": weight,
             "stock": stock,
             "discount": discount,
-            "price": final_price,
-        }
-
-        serializer = MarketSerializer(data=data)
+        })
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+
+        total_weight_needed = weight * stock
+
+        with transaction.atomic():
+            # Deduct (conditional UPDATE, fails if the stock is not there)
+            if not deduct_product_quantity(prod.id, total_weight_needed):
+                prod.refresh_from_db(fields=["quantity"])
+                return Response({
+                    "error": f"Not enough stock. Available: {prod.quantity} kg"
+                }, status=400)
+
+            # Only a valid listing may register a new crop, and it is rolled
+            # back with the listing if the insert fails
+            crop_id = resolve_crop_id(product_name)
+
+            # ---------------- Final price (cached ML price / fallbacks) ----------------
+            final_price = listing_price(crop_id, weight, discount)
+
+            # ---------------- Save Market Item ----------------
+            serializer.save(crop_id=crop_id, price=final_price)
 
         return Response(serializer.data, status=201)
 
+    # ---------------- BULK CREATE ----------------
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        rows = request.data.get("listings") if isinstance(request.data, dict) else request.data
+
+        if not isinstance(rows, list) or not rows:
+            return Response({"error": "Send a non-empty list of listings"}, status=400)
+        if len(rows) > MAX_BULK_LISTINGS:
+            return Response({"error": f"At most {MAX_BULK_LISTINGS} listings per request"}, status=400)
+
+        created, errors = create_listings_bulk(rows)
+
+        # 207: some rows were created, the rest are listed in "errors"
+        if not created:
+            status_code = 400
+        elif errors:
+            status_code = 207
+        else:
+            status_code = 201
+        return Response({
+            "created": MarketSerializer(created, many=True).data,
+            "errors": errors,
+        }, status=status_code)
+
     # ---------------- DELETE ----------------
     def destroy(self, request, pk=None):
         try:
@@ -168,15 +210,10 @@ class MarketViewSet(viewsets.ViewSet):
         except Market.DoesNotExist:
             return Response({"error": "Item not found"}, status=404)
 
-        # restore product quantity
-        try:
-            prod = Product.objects.get(id=item.product_id)
-            prod.quantity += item.weight * item.stock
-            prod.save()
-        except Product.DoesNotExist:
-            pass
-
-        item.delete()
+        with transaction.atomic():
+            # restore product quantity
+            restore_product_quantity(item.product_id, item.weight * item.stock)
+            item.delete()
         return Response({"message": "Deleted successfully"}, status=204)
     
 
@@ -212,6 +249,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             product = Product.objects.create(
                 farmer_id=farmer_id,
                 name=name,
+                crop_id=resolve_crop_id(name),
                 quantity=quantity,
                 reap_date=reap_date
             )
@@ -281,24 +319,8 @@ class WeatherDataViewSet(viewsets.ModelViewSet):
         serializer = self.serializer_class(queryset, many=True)
         return Response(serializer.data)
     
-class WeatherAPI(APIView):
-    def get(self, request):
-        # Fetch & store today's real data
-        fetch_and_save_weather()
-
-        # Run ML prediction & store in DB
-        prediction = predict_next_7_days()
-
-        latest = WeatherData.objects.latest("date")
-        pred_data = WeatherPrediction.objects.all().order_by("date")
-
-        return Response({
-            "current_weather": WeatherDataSerializer(latest).data,
-            "next_7_days": WeatherPredictionSerializer(pred_data, many=True).data
-        })
-
-@api_view(['GET'])
-def get_weather(request):
+def _weather_payload(refreshed_at):
+    """Stored current weather + 7-day prediction; a pure read (services/weather_refresh.py refreshes them)."""
     try:
         current = WeatherData.objects.latest('date')
         current_weather = {
@@ -323,16 +345,42 @@ def get_weather(request):
         for i, p in enumerate(predictions)
     ]
 
-    return Response({
+    return {
         "current_weather": current_weather,
-        "next_7_days": next_7_days
-    })
+        "next_7_days": next_7_days,
+        "refreshed_at": refreshed_at,
+    }
+
+
+class WeatherAPI(APIView):
+    # Used to fetch + retrain on every GET; now the same read as /api/weather/
+    @method_decorator(serve_stale_while_revalidate)
+    @method_decorator(conditional_on("weatherdata", "weatherprediction", "weather_refresh"))
+    def get(self, request):
+        return Response(_weather_payload(request.weather_refreshed_at))
+
+
+@api_view(['GET'])
+@serve_stale_while_revalidate
+@conditional_on("weatherdata", "weatherprediction", "weather_refresh")
+def get_weather(request):
+    return Response(_weather_payload(request.weather_refreshed_at))
 
 
 class CartViewSet(viewsets.ModelViewSet):
     queryset = Cart.objects.all()
     serializer_class = CartSerializer
 
+    def get_queryset(self):
+        # Reads use the two-query read model; mutations only need the cart row
+        if self.action in ("list", "retrieve"):
+            return Cart.objects.with_items()
+        return Cart.objects.all()
+
+    def _cart_data(self, cart):
+        """Serialized cart after a mutation, re-read through the read model."""
+        return CartSerializer(Cart.objects.with_items().get(pk=cart.pk)).data
+
     # ============================================================
     # ADD ITEM TO CART
     # ============================================================
@@ -368,9 +416,9 @@ class CartViewSet(viewsets.ModelViewSet):
             )
 
         # Log ADD action
-        CustomerAction.objects.create(
+        log_action(
             customer_id=cart.customer,
-            crop=market_item.product_name,
+            crop_id=market_item.crop_id,
             action="ADD",
             quantity=quantity,
             price_at_action=market_item.price,
@@ -379,7 +427,7 @@ class CartViewSet(viewsets.ModelViewSet):
             timestamp=timezone.now()
         )
 
-        return Response(CartSerializer(cart).data)
+        return Response(self._cart_data(cart))
 
     # ============================================================
     # UPDATE QUANTITY
@@ -408,16 +456,16 @@ class CartViewSet(viewsets.ModelViewSet):
             action_type = "REMOVE"
             action_qty = old_quantity - new_quantity
         else:
-            return Response(CartSerializer(cart).data)
+            return Response(self._cart_data(cart))
 
         # Save
         item.quantity = new_quantity
         item.save()
 
         # Log action
-        CustomerAction.objects.create(
+        log_action(
             customer_id=cart.customer,
-            crop=item.market_item.product_name,
+            crop_id=item.market_item.crop_id,
             action=action_type,
             quantity=action_qty,
             price_at_action=item.market_item.price,
@@ -426,7 +474,7 @@ class CartViewSet(viewsets.ModelViewSet):
             timestamp=timezone.now()
         )
 
-        return Response(CartSerializer(cart).data)
+        return Response(self._cart_data(cart))
 
     # ============================================================
     # REMOVE ITEM
@@ -442,9 +490,9 @@ class CartViewSet(viewsets.ModelViewSet):
             return Response({"error": "Item not found"}, status=404)
 
         # Log action
-        CustomerAction.objects.create(
+        log_action(
             customer_id=cart.customer,
-            crop=item.market_item.product_name,
+            crop_id=item.market_item.crop_id,
             action="REMOVE",
             quantity=item.quantity,
             price_at_action=item.market_item.price,
@@ -454,66 +502,50 @@ class CartViewSet(viewsets.ModelViewSet):
         )
 
         item.delete()
-        return Response(CartSerializer(cart).data)
+        return Response(self._cart_data(cart))
 
     # ============================================================
-    # PURCHASE (UPDATED)
+    # APPLY A BATCH OF ADD / UPDATE / REMOVE OPERATIONS
     # ============================================================
     @action(detail=True, methods=["post"])
-    def purchase(self, request, pk=None):
+    def apply(self, request, pk=None):
         cart = self.get_object()
-        customer = cart.customer
-
-        items = cart.items.all()
 
-        if not items.exists():
-            return Response({"error": "Cart is empty"}, status=400)
+        # Accept either a bare list or {"operations": [...]}
+        operations = request.data
+        if isinstance(operations, dict):
+            operations = operations.get("operations")
+        if not isinstance(operations, list) or not operations:
+            return Response({"error": "Expected a non-empty list of operations"}, status=400)
 
-        # 1️⃣ Collect invalid items
-        invalid_items = []
-        for item in items:
-            if item.quantity > item.market_item.stock:
-                invalid_items.append({
-                    "product": item.market_item.product_name,
-                    "requested": item.quantity,
-                    "stock": item.market_item.stock
-                })
-
-        # 2️⃣ Stop purchase if any invalid items
-        if invalid_items:
+        try:
+            apply_cart_operations(cart, operations)
+        except CartOperationError as e:
             return Response({
-                "error": "Some items have insufficient stock.",
-                "invalid_items": invalid_items
+                "error": "Some operations could not be applied.",
+                "errors": e.errors
             }, status=400)
 
-        # 3️⃣ Purchase valid items
-        purchased_items = []
-        for item in items:
-            market_item = item.market_item
-
-            # Reduce stock
-            market_item.stock -= item.quantity
-            market_item.save()
-
-            # Log PURCHASE action
-            CustomerAction.objects.create(
-                customer_id=customer,
-                crop=market_item.product_name,
-                action="PURCHASE",
-                quantity=item.quantity,
-                price_at_action=market_item.price,
-                discount_at_action=market_item.discount,
-                stock_at_action=market_item.stock,
-                timestamp=timezone.now()
-            )
+        return Response(self._cart_data(cart))
 
-            purchased_items.append({
-                "product": market_item.product_name,
-                "qty": item.quantity
-            })
+    # ============================================================
+    # PURCHASE (UPDATED)
+    # ============================================================
+    @action(detail=True, methods=["post"])
+    def purchase(self, request, pk=None):
+        cart = self.get_object()
 
-            # Remove purchased item from cart
-            item.delete()
+        # One transaction, set-based stock update (services/checkout.py)
+        try:
+            purchased_items = checkout(cart)
+        except InsufficientStock as e:
+            return Response({
+                "error": "Some items have insufficient stock.",
+                "invalid_items": e.details
+            }, status=400)
+
+        if not purchased_items:
+            return Response({"error": "Cart is empty"}, status=400)
 
         return Response({
             "success": True,
@@ -521,15 +553,72 @@ class CartViewSet(viewsets.ModelViewSet):
             "purchased_items": purchased_items
         }, status=200)
 
+def _parse_time(value, name):
+    """ISO date or datetime query param -> aware datetime."""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({name: "Expected an ISO date or datetime"})
+        parsed = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
 class CustomerActionViewSet(viewsets.ModelViewSet):
     serializer_class = CustomerActionSerializer
     queryset = CustomerAction.objects.all()
+    pagination_class = CustomerActionCursorPagination
+
+    def get_queryset(self):
+        actions = CustomerAction.objects.all()
+        if self.action != "list":
+            return actions
+
+        # ---------------- Filters (each backed by a (column, timestamp, id) index) ----------------
+        params = self.request.query_params
+        if params.get("customer_id"):
+            try:
+                actions = actions.filter(customer_id=int(params["customer_id"]))
+            except ValueError:
+                raise ValidationError({"customer_id": "Must be a number"})
+        if params.get("crop"):
+            actions = actions.filter(crop_id=get_crop_id(params["crop"]))
+        if params.get("action"):
+            if params["action"] not in dict(CustomerAction.ACTIONS):
+                raise ValidationError({"action": "Must be one of ADD, REMOVE, PURCHASE"})
+            actions = actions.filter(action=params["action"])
+        if params.get("since"):
+            actions = actions.filter(timestamp__gte=_parse_time(params["since"], "since"))
+        if params.get("until"):
+            actions = actions.filter(timestamp__lt=_parse_time(params["until"], "until"))
+        return actions
+
+    # Creates go through the post_save receiver; edits and deletes adjust the rollup here
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            previous = CustomerAction.objects.get(pk=serializer.instance.pk)
+            action = serializer.save()
+            apply_actions([previous], sign=-1)
+            apply_actions([action])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            apply_actions([instance], sign=-1)
+
+
+@api_view(['GET'])
+def action_log_status(request):
+    """Queue depth and flush latency of the buffered CustomerAction writer."""
+    return Response(action_log_metrics())
 
 
 def log_customer_action(customer, crop_name, action, quantity, price, discount, stock):
-    CustomerAction.objects.create(
+    log_action(
         customer_id=customer,
-        crop=crop_name,
+        crop_id=resolve_crop_id(crop_name),
         action=action,
         quantity=quantity,
         price_at_action=price,
@@ -548,20 +637,23 @@ class CustomerRecommendationViewSet(viewsets.ViewSet):
             try:
                 # Ensure you get the OBJECT, not the ID
                 customer = Customer.objects.get(pk=customer_id)
-                
-                # This function (from step 1) updates the DB
-                get_customer_recommendations(customer)
-                
-                # Retrieve the updated rows
-                recommendations = CustomerRecommendation.objects.filter(customer=customer).order_by('-purchase_prob')[:10]
             except Customer.DoesNotExist:
                 return Response({"error": "Customer not found"}, status=404)
+
+            # Serve the stored rows now; recompute in the background only if
+            # actions arrived since they were computed (action watermark)
+            refreshing = queue_recommendation_refresh(customer)
+
+            recommendations = CustomerRecommendation.objects.filter(customer=customer).order_by('-purchase_prob')[:10]
         else:
             # This path reads OLD data only
+            refreshing = False
             recommendations = CustomerRecommendation.objects.all().order_by('-purchase_prob')[:10]
 
         serializer = CustomerRecommendationSerializer(recommendations, many=True)
-        return Response(serializer.data)
+        response = Response(serializer.data)
+        response["X-Recommendations-Refreshing"] = "true" if refreshing else "false"
+        return response
 
 @require_http_methods(["GET"])
 def preferred_market_items_api(request, customer_id):
@@ -569,11 +661,8 @@ def preferred_market_items_api(request, customer_id):
     API endpoint to fetch market items recommended for a specific customer.
     """
     try:
-        # 1. Call the service function to get the structured list of preferred items
-        preferred_items_list = get_preferred_market_items(
-            customer_id=customer_id, 
-            limit=20
-        )
+        # 1. Read the customer's materialized feed (services/customer_feed.py)
+        preferred_items_list = get_feed_items(customer_id)
         
         # 2. Return the list as a JSON response
         return JsonResponse({
@@ -593,13 +682,18 @@ def preferred_market_items_api(request, customer_id):
         }, status=500)
 
 
-DEFAULT_PRICE = 1000.0
-
 class CropPricesViewSet(viewsets.ModelViewSet):
     queryset = CropPrices.objects.all()
     serializer_class = CropPricesSerializer
 
     def list(self, request, *args, **kwargs):
+        # Missing forecasts are written before the ETag is computed, not while serving
+        ensure_daily_forecasts()
+        return self._list(request, *args, **kwargs)
+
+    # Forecasts are listed from today on and regenerated per day, so the date is part of the ETag
+    @method_decorator(conditional_on("cropprices", "dailycropforecast", extra=lambda request: datetime.date.today()))
+    def _list(self, request, *args, **kwargs):
         """Override list to include synthetic prices + 7-day daily forecasts."""
         queryset = self.get_queryset()
         response_data = []
@@ -611,20 +705,17 @@ class CropPricesViewSet(viewsets.ModelViewSet):
         # ---------------------------------------
         # 1) Compute average synthetic price
         # ---------------------------------------
-        prices = [row['synthetic_price'] for row in data if row['synthetic_price'] is not None]
-        average_price = np.mean(prices) if prices else DEFAULT_PRICE
+        average_price = average_synthetic_price(row['synthetic_price'] for row in data)
 
         today = datetime.date.today()
 
-        for row in data:
-            crop_name = row["crop"]
+        for obj, row in zip(queryset, data):
+            crop_id = obj.crop_id
 
             # ---------------------------------------
-            # 2) Fill missing synthetic price
+            # 2) Fill missing synthetic price (same value all day)
             # ---------------------------------------
-            if row['synthetic_price'] is None:
-                random_factor = np.random.uniform(0.95, 1.05)
-                row['synthetic_price'] = round(average_price * random_factor, 2)
+            row['synthetic_price'] = synthetic_price(crop_id, row['synthetic_price'], average_price, today)
 
             # ---------------------------------------
             # 3) Fill missing predicted yield
@@ -632,45 +723,20 @@ class CropPricesViewSet(viewsets.ModelViewSet):
             if row['predicted_yield'] is None:
                 row['predicted_yield'] = 0.0
 
-            base_price = row['synthetic_price']
-
             # ---------------------------------------
-            # 4) Ensure 7-day forecast exists
+            # 4) Attach forecast to the output (generated by ensure_daily_forecasts)
             # ---------------------------------------
             existing = DailyCropForecast.objects.filter(
-                crop=crop_name,
+                crop_id=crop_id,
                 date__gte=today
             ).order_by("date")
 
-            # If fewer than 7 forecast records → regenerate
-            if existing.count() < 7:
-                DailyCropForecast.objects.filter(crop=crop_name).delete()
-
-                for i in range(1, 8):
-                    date = today + datetime.timedelta(days=i)
-                    price = round(base_price * (0.95 + np.random.rand() * 0.1), 2)
-
-                    DailyCropForecast.objects.create(
-                        crop=crop_name,
-                        date=date,
-                        price_estimate=price,
-                    )
-
-                # Reload data
-                existing = DailyCropForecast.objects.filter(
-                    crop=crop_name,
-                    date__gte=today
-                ).order_by("date")
-
-            # ---------------------------------------
-            # 5) Attach forecast to the output
-            # ---------------------------------------
             row["forecast_7_days"] = [
                 {
                     "date": str(f.date),
                     "price_estimate": f.price_estimate
                 }
-                for f in existing[:7]
+                for f in existing[:FORECAST_DAYS]
             ]
 
             response_data.append(row)
@@ -686,7 +752,7 @@ class DailyCropForecastViewSet(viewsets.ModelViewSet):
 
         queryset = self.get_queryset()
         if crop_name:
-            queryset = queryset.filter(crop=crop_name).order_by('date')
+            queryset = queryset.filter(crop_id=get_crop_id(crop_name)).order_by('date')
 
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
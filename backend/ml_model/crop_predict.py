@@ -694,6 +694,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 django.setup()
 
 from farmer_app.models import CropPrices
+from services.crop_catalog import resolve_crop_id
 
 print("\n--- 8. Saving predictions to CropPrices model ---")
 CropPrices.objects.filter(year=TARGET_PREDICTION_YEAR).delete()
@@ -705,7 +706,7 @@ for _, row in df_future_inputs.iterrows():
     synthetic_price = float(row['Synthetic_Price_Annual'])
 
     obj, created = CropPrices.objects.update_or_create(
-        crop=crop_name,
+        crop_id=resolve_crop_id(crop_name),
         year=year_val,
         defaults={
             'predicted_yield': predicted_yield,
@@ -715,6 +716,10 @@ for _, row in df_future_inputs.iterrows():
 
     print(f"[{'CREATED' if created else 'UPDATED'}] {crop_name} {year_val} → Yield={predicted_yield:.2f}, Price={synthetic_price:.2f}")
 
+# Bulk write done: make listing prices pick up the new table
+from services.price_resolver import invalidate_price_table
+invalidate_price_table()
+
 print("\n✔ DONE: All predictions saved to database.")
 
 from farmer_app.models import DailyCropForecast
@@ -730,7 +735,7 @@ for crop, forecast_list in daily_forecasts.items():
         price = entry['Price_Estimate']
 
         DailyCropForecast.objects.update_or_create(
-            crop=crop,
+            crop_id=resolve_crop_id(crop),
             date=date_str,
             defaults={'price_estimate': price}
         )
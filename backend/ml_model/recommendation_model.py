@@ -0,0 +1,157 @@
+"""
+Global purchase-propensity model for recommendations.
+
+One classifier for all customers, trained offline on the FEATURE_COLUMNS of
+services/recommendations.py and saved as a versioned joblib file:
+    ml_model/data/recommendation/purchase_model_v<N>.joblib
+Serving loads the newest version once per process (or the one pinned with
+the RECOMMENDATION_MODEL_VERSION setting) and scores a whole feature
+matrix per call. The model directory is re-listed at most every
+RECOMMENDATION_MODEL_RECHECK seconds (default 300) to pick up new
+versions; a pinned version that is missing falls back to the newest.
+"""
+import logging
+import os
+import re
+import threading
+import time
+
+import joblib
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import MinMaxScaler
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(BASE_DIR, "data", "recommendation")
+MODEL_PATTERN = re.compile(r"^purchase_model_v(\d+)\.joblib$")
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_loaded = None  # (path, artifact)
+_resolved = None  # (pinned version, path or None, monotonic time to re-list)
+
+
+def _model_path(version):
+    return os.path.join(MODEL_DIR, f"purchase_model_v{version}.joblib")
+
+
+def available_versions():
+    if not os.path.isdir(MODEL_DIR):
+        return []
+    versions = []
+    for name in os.listdir(MODEL_DIR):
+        match = MODEL_PATTERN.match(name)
+        if match:
+            versions.append(int(match.group(1)))
+    return sorted(versions)
+
+
+def train_model(X, y, feature_columns):
+    """
+    Fits the pipeline (MinMax scaling + random forest) on a feature matrix
+    and saves it as the next version.
+
+    Returns:
+        dict: the saved artifact (version, metrics, ...), without the pipeline
+    """
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=int)
+    if len(np.unique(y)) < 2:
+        raise ValueError("Training data needs both purchased and not-purchased examples")
+
+    pipeline = Pipeline([
+        ("scale", MinMaxScaler()),
+        ("model", RandomForestClassifier(n_estimators=200, min_samples_leaf=5, n_jobs=-1, random_state=42)),
+    ])
+
+    # Hold out 20% to report AUC, then refit on everything
+    metrics = {"rows": int(len(y)), "positives": int(y.sum())}
+    if len(y) >= 50 and min(np.bincount(y)) >= 5:
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+        pipeline.fit(X_train, y_train)
+        metrics["holdout_auc"] = round(float(roc_auc_score(y_test, pipeline.predict_proba(X_test)[:, 1])), 4)
+    pipeline.fit(X, y)
+
+    versions = available_versions()
+    version = versions[-1] + 1 if versions else 1
+    artifact = {
+        "version": version,
+        "trained_at": timezone.now().isoformat(),
+        "feature_columns": list(feature_columns),
+        "metrics": metrics,
+        "pipeline": pipeline,
+    }
+
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    tmp_path = _model_path(version) + ".tmp"
+    joblib.dump(artifact, tmp_path)
+    os.replace(tmp_path, _model_path(version))
+
+    # Serve the new version from this process without waiting for the re-list
+    global _resolved
+    _resolved = None
+
+    return {key: value for key, value in artifact.items() if key != "pipeline"}
+
+
+def _resolve_path():
+    """Path of the version to serve, or None; re-listed every RECOMMENDATION_MODEL_RECHECK."""
+    global _resolved
+
+    pinned = getattr(settings, "RECOMMENDATION_MODEL_VERSION", None)
+    resolved = _resolved
+    if resolved is not None and resolved[0] == pinned and resolved[2] > time.monotonic():
+        return resolved[1]
+
+    versions = available_versions()
+    if pinned is not None and int(pinned) in versions:
+        version = int(pinned)
+    else:
+        version = versions[-1] if versions else None
+        if pinned is not None:
+            logger.warning(
+                "Recommendation model v%s not found in %s; serving %s",
+                pinned, MODEL_DIR, f"v{version}" if version else "no model",
+            )
+
+    path = _model_path(version) if version is not None else None
+    _resolved = (pinned, path, time.monotonic() + getattr(settings, "RECOMMENDATION_MODEL_RECHECK", 300))
+    return path
+
+
+def load_model():
+    """
+    The artifact to serve with (pinned version or newest), cached per
+    process; None if no model has been trained yet.
+    """
+    global _loaded, _resolved
+
+    path = _resolve_path()
+    if path is None:
+        return None
+
+    loaded = _loaded
+    if loaded is not None and loaded[0] == path:
+        return loaded[1]
+
+    with _lock:
+        if _loaded is None or _loaded[0] != path:
+            try:
+                _loaded = (path, joblib.load(path))
+            except FileNotFoundError:
+                # Removed since the directory was listed: re-list next call
+                _resolved = None
+                logger.error("Recommendation model %s disappeared; keeping the loaded one", path)
+                return _loaded[1] if _loaded is not None else None
+        return _loaded[1]
+
+
+def predict_proba(artifact, X):
+    """Purchase probability for every row of X, in one call."""
+    return artifact["pipeline"].predict_proba(np.asarray(X, dtype=float))[:, 1]
@@ -55,51 +55,52 @@ def predict_next_7_days(user_state=None, user_district=None):
         model_rain = None
         last_day_index = 0
 
-    # ---------- Clear old predictions ----------
-    WeatherPrediction.objects.all().delete()
-
-    forecasts = []
-
-    # ---------- Predict next 7 days ----------
-    for i in range(1, 8):
-
-        future_date = today_date + timedelta(days=i)
-        future_day_index = last_day_index + i
-
-        # Temperature
-        if model_temp:
-            t_pred = float(model_temp.predict(
-                pd.DataFrame({"day_index": [future_day_index]})
-            )[0])
-        else:
-            t_pred = monthly_temp_avg.get(future_date.month, today_temp)
-
-        # Rainfall
-        if model_rain:
-            r_pred = float(model_rain.predict(
-                pd.DataFrame({"day_index": [future_day_index]})
-            )[0])
-        else:
-            r_pred = monthly_rain_avg.get(future_date.month, today_rain)
-
-        # Cloudcover (random variation)
-        c_pred = min(max(today_cloud * random.uniform(0.8, 1.2), 0), 100)
-
-        WeatherPrediction.objects.update_or_create(
-            date=future_date,
-            defaults={
+    # ---------- Replace old predictions (one transaction: readers never see an empty table) ----------
+    with transaction.atomic():
+        WeatherPrediction.objects.all().delete()
+
+        forecasts = []
+
+        # ---------- Predict next 7 days ----------
+        for i in range(1, 8):
+
+            future_date = today_date + timedelta(days=i)
+            future_day_index = last_day_index + i
+
+            # Temperature
+            if model_temp:
+                t_pred = float(model_temp.predict(
+                    pd.DataFrame({"day_index": [future_day_index]})
+                )[0])
+            else:
+                t_pred = monthly_temp_avg.get(future_date.month, today_temp)
+
+            # Rainfall
+            if model_rain:
+                r_pred = float(model_rain.predict(
+                    pd.DataFrame({"day_index": [future_day_index]})
+                )[0])
+            else:
+                r_pred = monthly_rain_avg.get(future_date.month, today_rain)
+
+            # Cloudcover (random variation)
+            c_pred = min(max(today_cloud * random.uniform(0.8, 1.2), 0), 100)
+
+            WeatherPrediction.objects.update_or_create(
+                date=future_date,
+                defaults={
+                    "temperature": round(t_pred, 1),
+                    "cloudcover": round(c_pred, 1),
+                    "precipitation": round(r_pred, 1)
+                }
+            )
+
+            forecasts.append({
+                "date": future_date.strftime("%Y-%m-%d"),
                 "temperature": round(t_pred, 1),
                 "cloudcover": round(c_pred, 1),
-                "precipitation": round(r_pred, 1)
-            }
-        )
-
-        forecasts.append({
-            "date": future_date.strftime("%Y-%m-%d"),
-            "temperature": round(t_pred, 1),
-            "cloudcover": round(c_pred, 1),
-            "precipitation": round(r_pred, 1),
-        })
+                "precipitation": round(r_pred, 1),
+            })
 
     # ---------- Optional training metrics ----------
     metrics = {}
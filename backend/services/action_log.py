@@ -0,0 +1,313 @@
+"""
+Buffered CustomerAction writer.
+
+Requests hand unsaved CustomerAction rows to log_actions() and return; a
+background thread writes them with bulk_create, either when BATCH_SIZE rows
+are waiting or every FLUSH_INTERVAL seconds, and once more at interpreter
+shutdown. Rows are only enqueued when the surrounding transaction commits,
+so a rolled-back checkout never logs anything.
+
+When the queue is full the caller flushes inline instead of dropping rows.
+A hard crash (not a normal shutdown) can lose at most the rows still queued.
+
+A batch whose write fails (e.g. the database restarting) is kept and
+retried with exponential backoff, ahead of newer rows. After
+ACTION_LOG_MAX_RETRIES failed attempts its rows are written one by one so
+a single bad row cannot sink the batch; only rows that still fail are
+dropped (logged and counted in metrics()["dropped"]).
+
+Failed batches waiting for a retry are capped at ACTION_LOG_MAX_RETRY_ROWS
+rows: during a long outage the queue keeps filling and spilling into the
+retry buffer, so beyond the cap the oldest batches are dropped (and
+counted). Memory stays bounded by MAX_QUEUE + MAX_RETRY_ROWS rows.
+
+Settings (all optional):
+    ACTION_LOG_SYNC            write immediately in the caller (tests, scripts)
+    ACTION_LOG_BATCH_SIZE      rows per bulk_create              (default 200)
+    ACTION_LOG_FLUSH_INTERVAL  seconds between timed flushes     (default 1.0)
+    ACTION_LOG_MAX_QUEUE       queued rows before inline flushes (default 10000)
+    ACTION_LOG_MAX_RETRIES     failed attempts before row-by-row (default 5)
+    ACTION_LOG_RETRY_BACKOFF   seconds before the first retry, doubling
+                               each attempt up to 60 s           (default 0.5)
+    ACTION_LOG_MAX_RETRY_ROWS  rows kept for retries             (default 10000)
+"""
+import atexit
+import collections
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from farmer_app.models import CustomerAction
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+MAX_RETRY_BACKOFF = 60.0
+
+
+class ActionLogWriter:
+    def __init__(self, batch_size=200, flush_interval=1.0, max_queue=10000, max_retries=5, retry_backoff=0.5,
+                 max_retry_rows=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_retry_rows = max_retry_rows
+        self._queue = queue.Queue(maxsize=max_queue)
+        # Failed batches awaiting a retry: [attempts, monotonic retry time, rows]
+        self._retries = collections.deque()
+        self._retry_rows = 0
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+        # Metrics
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0    # rows in failed write attempts (each retry counts again)
+        self.retried = 0   # rows written on a retry
+        self.dropped = 0   # rows given up on
+        self.flushes = 0
+        self.inline_flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    # ---------------- producer side ----------------
+    def put(self, actions):
+        self._ensure_started()
+        for action in actions:
+            while True:
+                try:
+                    self._queue.put_nowait(action)
+                    break
+                except queue.Full:
+                    # Back-pressure: the request pays for one batch
+                    with self._stats_lock:
+                        self.inline_flushes += 1
+                    self.flush(max_batches=1)
+
+        with self._stats_lock:
+            self.enqueued += len(actions)
+
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    # ---------------- consumer side ----------------
+    def _drain(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self, max_batches=None, final=False):
+        """
+        Writes due retries, then queued rows. Stops at the first failed
+        write (the database is likely down; the rest waits for the retry).
+        final: retry every kept batch now and drop what still fails (shutdown).
+        Returns the number of rows written.
+        """
+        written = 0
+        batches = 0
+        with self._flush_lock:
+            while self._retries and (final or self._retries[0][1] <= time.monotonic()):
+                attempts, _, batch = self._retries.popleft()
+                self._retry_rows -= len(batch)
+                if not self._write(batch, attempts, final=final):
+                    return written
+                written += len(batch)
+                batches += 1
+
+            while max_batches is None or batches < max_batches:
+                batch = self._drain()
+                if not batch:
+                    break
+                if not self._write(batch, 0, final=final):
+                    break
+                written += len(batch)
+                batches += 1
+        return written
+
+    def _write(self, batch, attempts, final=False):
+        """Writes one batch; on failure keeps it for a retry (or drops it). Returns True if written."""
+        started = time.perf_counter()
+        try:
+            write_actions(batch)
+        except Exception:
+            attempts += 1
+            with self._stats_lock:
+                self.failed += len(batch)
+            if attempts < self.max_retries and not final:
+                delay = min(self.retry_backoff * 2 ** (attempts - 1), MAX_RETRY_BACKOFF)
+                logger.warning(
+                    "Writing %d customer actions failed (attempt %d of %d); retrying in %.1fs",
+                    len(batch), attempts, self.max_retries, delay, exc_info=True,
+                )
+                self._keep_for_retry(attempts, time.monotonic() + delay, batch)
+            else:
+                self._write_rows(batch)
+            return False
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self.written += len(batch)
+            self.flushes += 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self.total_flush_ms += elapsed_ms
+            if attempts:
+                self.retried += len(batch)
+        return True
+
+    def _keep_for_retry(self, attempts, retry_at, batch):
+        """Queues a failed batch for a retry, dropping the oldest kept batches beyond max_retry_rows."""
+        self._retries.append([attempts, retry_at, batch])
+        self._retry_rows += len(batch)
+        while self._retry_rows > self.max_retry_rows and len(self._retries) > 1:
+            _, _, oldest = self._retries.popleft()
+            self._retry_rows -= len(oldest)
+            logger.error(
+                "Customer action retry buffer is full (%d rows); dropping the oldest %d",
+                self.max_retry_rows, len(oldest),
+            )
+            with self._stats_lock:
+                self.dropped += len(oldest)
+
+    def _write_rows(self, batch):
+        """Last resort for a batch that kept failing: salvage the rows that can be written."""
+        dropped = 0
+        for action in batch:
+            try:
+                write_actions([action])
+            except Exception:
+                dropped += 1
+                logger.exception("Dropping customer action %r after %d failed attempts", action.__dict__, self.max_retries)
+        with self._stats_lock:
+            self.written += len(batch) - dropped
+            self.retried += len(batch) - dropped
+            self.dropped += dropped
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                # The thread keeps its own DB connection; recycle it like a request would
+                close_old_connections()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="action-log-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stops the flusher thread and writes whatever is still queued."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush(final=True)
+
+    def metrics(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "retry_depth": self._retry_rows,
+                "retry_capacity": self.max_retry_rows,
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "failed": self.failed,
+                "retried": self.retried,
+                "dropped": self.dropped,
+                "flushes": self.flushes,
+                "inline_flushes": self.inline_flushes,
+                "last_flush_ms": round(self.last_flush_ms, 3),
+                "max_flush_ms": round(self.max_flush_ms, 3),
+                "avg_flush_ms": round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ActionLogWriter(
+                    batch_size=_setting("ACTION_LOG_BATCH_SIZE", 200),
+                    flush_interval=_setting("ACTION_LOG_FLUSH_INTERVAL", 1.0),
+                    max_queue=_setting("ACTION_LOG_MAX_QUEUE", 10000),
+                    max_retries=_setting("ACTION_LOG_MAX_RETRIES", 5),
+                    retry_backoff=_setting("ACTION_LOG_RETRY_BACKOFF", 0.5),
+                    max_retry_rows=_setting("ACTION_LOG_MAX_RETRY_ROWS", 10000),
+                )
+                atexit.register(_writer.stop)
+    return _writer
+
+
+def write_actions(actions):
+    """INSERTs the rows and adds them to the CustomerCropStats rollup, atomically."""
+    from services.action_partitions import ensure_next_partition
+    from services.action_stats import apply_actions
+
+    # Outside the transaction: the partition DDL must not hold locks for the write
+    ensure_next_partition()
+    with transaction.atomic():
+        CustomerAction.objects.bulk_create(actions)
+        apply_actions(actions)
+
+
+def _enqueue(actions):
+    if _setting("ACTION_LOG_SYNC", False):
+        write_actions(actions)
+    else:
+        get_writer().put(actions)
+
+
+def log_actions(actions):
+    """
+    Queues unsaved CustomerAction instances for writing once the current
+    transaction commits (immediately in autocommit mode). timestamp is set
+    when the instance is built, so a delayed flush keeps the action time.
+    """
+    actions = list(actions)
+    if not actions:
+        return
+    transaction.on_commit(lambda: _enqueue(actions))
+
+
+def log_action(**fields):
+    log_actions([CustomerAction(**fields)])
+
+
+def flush_actions():
+    """Writes everything queued so far (no-op in sync mode)."""
+    if _writer is None:
+        return 0
+    return _writer.flush()
+
+
+def action_log_metrics():
+    return get_writer().metrics()
@@ -0,0 +1,310 @@
+"""
+Monthly partitions and archival of the CustomerAction log.
+
+PostgreSQL: farmer_app_customeraction is a declaratively partitioned table
+(RANGE on timestamp, set up by migration 0026) with one partition per month,
+farmer_app_customeraction_pYYYY_MM, plus a DEFAULT partition that catches
+rows no monthly partition covers. Queries with a timestamp bound (see
+CustomerAction.objects.hot()) are pruned to the matching partitions, and an
+old month is archived by detaching its partition, writing the detached
+table out and dropping it. write_actions() creates the current and next
+month's partitions ahead of time (once per process per month), so new rows
+do not pile up in DEFAULT between runs of the archive command.
+
+Other backends (SQLite in dev) keep a single table. The same month
+boundaries are applied as timestamp ranges over the timestamp index, so
+hot() and the archive command behave the same, only with row deletes.
+"""
+import datetime
+import gzip
+import json
+import logging
+import os
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from farmer_app.models import CustomerAction
+from services.action_stats import subtract_aggregate
+
+TABLE = CustomerAction._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FIELDS = [
+    "id", "customer_id_id", "crop_id", "action", "quantity",
+    "price_at_action", "discount_at_action", "stock_at_action", "timestamp",
+]
+
+
+# ---------------- month arithmetic ----------------
+def month_start(value):
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(month):
+    """[start, end) of a month as aware UTC datetimes."""
+    start = datetime.datetime(month.year, month.month, 1, tzinfo=datetime.timezone.utc)
+    end_month = add_months(month, 1)
+    end = datetime.datetime(end_month.year, end_month.month, 1, tzinfo=datetime.timezone.utc)
+    return start, end
+
+
+def retention_start(months=None):
+    """
+    First instant inside the retention window: the start of the month
+    `months - 1` months before the current one.
+    """
+    if months is None:
+        months = getattr(settings, "ACTION_LOG_RETENTION_MONTHS", 12)
+    return month_bounds(add_months(month_start(timezone.now()), -(months - 1)))[0]
+
+
+# ---------------- PostgreSQL partitions ----------------
+def partition_name(month):
+    return f"{TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def is_partitioned():
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [TABLE])
+        return cursor.fetchone() is not None
+
+
+def existing_partitions():
+    """{month: partition table name} of the monthly partitions."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [TABLE],
+        )
+        return _monthly(row[0] for row in cursor.fetchall())
+
+
+def detached_partitions():
+    """{month: table name} of monthly partitions an interrupted archive run left detached."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_class c "
+            "WHERE c.relkind = 'r' AND c.relnamespace = current_schema()::regnamespace "
+            "AND starts_with(c.relname, %s) "
+            "AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)",
+            [f"{TABLE}_p"],
+        )
+        return _monthly(row[0] for row in cursor.fetchall())
+
+
+def _monthly(names):
+    prefix = f"{TABLE}_p"
+    partitions = {}
+    for name in names:
+        if name.startswith(prefix):
+            year, month = name[len(prefix):].split("_")
+            partitions[datetime.date(int(year), int(month), 1)] = name
+    return partitions
+
+
+def create_partition(month):
+    """
+    Adds the partition for `month`. Rows of that month sitting in the DEFAULT
+    partition are moved into it first; PostgreSQL refuses to add a partition
+    whose range still has rows in DEFAULT.
+    """
+    qn = connection.ops.quote_name
+    name = partition_name(month)
+    start, end = month_bounds(month)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {qn(name)} (LIKE {qn(TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"WITH moved AS ("
+            f"DELETE FROM {qn(DEFAULT_PARTITION)} WHERE \"timestamp\" >= %s AND \"timestamp\" < %s RETURNING *"
+            f") INSERT INTO {qn(name)} SELECT * FROM moved",
+            [start, end],
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(TABLE)} ATTACH PARTITION {qn(name)} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    return name
+
+
+def default_partition_months():
+    """Months that have rows stuck in the DEFAULT partition."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT date_trunc('month', \"timestamp\" AT TIME ZONE 'UTC') "
+            f"FROM {connection.ops.quote_name(DEFAULT_PARTITION)}"
+        )
+        return {row[0].date() for row in cursor.fetchall()}
+
+
+_ensured_month = None
+
+
+def ensure_next_partition():
+    """
+    ensure_partitions(months_ahead=1), once per process per month (no query
+    in between). Called before action writes; a failure (e.g. another
+    process creating the same partition) is logged and retried next call.
+    """
+    global _ensured_month
+
+    current = month_start(timezone.now())
+    if _ensured_month == current:
+        return []
+    try:
+        created = ensure_partitions(months_ahead=1)
+    except DatabaseError:
+        logger.warning("Could not create the CustomerAction partitions for %s", f"{current:%Y-%m}", exc_info=True)
+        return []
+    _ensured_month = current
+    return created
+
+
+def ensure_partitions(months_ahead=3):
+    """
+    Creates the partitions for the current month and `months_ahead` months
+    after it, plus one for every month that has rows stuck in DEFAULT.
+    Returns the names of the partitions created (none on other backends).
+    """
+    if not is_partitioned():
+        return []
+
+    current = month_start(timezone.now())
+    wanted = {add_months(current, i) for i in range(months_ahead + 1)}
+    wanted.update(default_partition_months())
+
+    existing = existing_partitions()
+    return [create_partition(month) for month in sorted(wanted - set(existing))]
+
+
+# ---------------- archival ----------------
+def months_to_archive(months, dry_run=False):
+    """
+    Months that end before the retention window of `months` months.
+    dry_run: read-only, no partition is created and no row moved.
+    """
+    cutoff = retention_start(months)
+
+    if is_partitioned():
+        if dry_run:
+            # The months DEFAULT rows would be sorted into, without the DDL
+            found = set(existing_partitions()) | default_partition_months()
+        else:
+            # Sort rows left in DEFAULT into their own months first
+            ensure_partitions(months_ahead=0)
+            found = set(existing_partitions()) | set(detached_partitions())
+        return sorted(month for month in found if month_bounds(month)[1] <= cutoff)
+
+    return sorted(
+        month_start(day)
+        for day in CustomerAction.objects.filter(timestamp__lt=cutoff).dates("timestamp", "month")
+    )
+
+
+def _archive_path(directory, month):
+    base = os.path.join(directory, f"customeraction-{month:%Y-%m}")
+    path = f"{base}.jsonl.gz"
+    suffix = 1
+    # Never overwrite an earlier archive of the same month
+    while os.path.exists(path):
+        path = f"{base}.{suffix}.jsonl.gz"
+        suffix += 1
+    return path
+
+
+def _write_archive(directory, month, rows):
+    """Writes the `rows` dicts to a new archive file. Returns (count, path or None if empty)."""
+    os.makedirs(directory, exist_ok=True)
+    path = _archive_path(directory, month)
+    tmp_path = f"{path}.tmp"
+    count = 0
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as archive:
+        for row in rows:
+            archive.write(json.dumps(row, cls=DjangoJSONEncoder) + "\n")
+            count += 1
+
+    if not count:
+        os.remove(tmp_path)
+        return 0, None
+    # Only a complete file gets the final name
+    os.replace(tmp_path, path)
+    return count, path
+
+
+def _detached_rows(name):
+    """The rows of a detached partition, streamed in archive order."""
+    qn = connection.ops.quote_name
+    columns = ", ".join(qn(CustomerAction._meta.get_field(field).column) for field in ARCHIVE_FIELDS)
+    with transaction.atomic(), connection.chunked_cursor() as cursor:
+        cursor.execute(f"SELECT {columns} FROM {qn(name)} ORDER BY \"timestamp\", id")
+        while True:
+            chunk = cursor.fetchmany(2000)
+            if not chunk:
+                break
+            for row in chunk:
+                yield dict(zip(ARCHIVE_FIELDS, row))
+
+
+def archive_month(month, directory):
+    """
+    Writes every action of `month` to a gzipped JSON-lines file in
+    `directory`, then removes the month from the live table and from the
+    CustomerCropStats rollup.
+
+    PostgreSQL: the partition is detached first (with the rollup update, in
+    one transaction), then the detached table is archived and dropped. A row
+    of that month inserted meanwhile lands in DEFAULT and is archived next
+    run instead of being dropped unarchived. A partition left detached by
+    an interrupted run is picked up again.
+    Elsewhere: only rows up to the highest id seen when the run starts are
+    archived and deleted; later ones wait for the next run.
+
+    Returns:
+        tuple: (rows archived, archive path or None if the month was empty)
+    """
+    start, end = month_bounds(month)
+    month_rows = CustomerAction.objects.filter(timestamp__gte=start, timestamp__lt=end)
+
+    if is_partitioned():
+        qn = connection.ops.quote_name
+        name = partition_name(month)
+        if existing_partitions().get(month) == name:
+            with transaction.atomic(), connection.cursor() as cursor:
+                # Block inserts until detached, so the rollup matches what is archived
+                cursor.execute(f"LOCK TABLE {qn(TABLE)} IN SHARE ROW EXCLUSIVE MODE")
+                subtract_aggregate(month_rows)
+                cursor.execute(f"ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(name)}")
+        elif month not in detached_partitions():
+            return 0, None
+
+        count, path = _write_archive(directory, month, _detached_rows(name))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {qn(name)}")
+        return count, path
+
+    last_id = month_rows.order_by("-id").values_list("id", flat=True).first()
+    if last_id is None:
+        return 0, None
+    month_rows = month_rows.filter(id__lte=last_id)
+
+    count, path = _write_archive(
+        directory, month,
+        month_rows.order_by("timestamp", "id").values(*ARCHIVE_FIELDS).iterator(chunk_size=2000),
+    )
+    with transaction.atomic():
+        # Keep the CustomerCropStats rollup equal to the live log
+        subtract_aggregate(month_rows)
+        month_rows.delete()
+    return count, path
@@ -0,0 +1,237 @@
+"""
+CustomerCropStats rollup: one row per (customer, crop) with running counts
+and sums of that customer's actions on the crop.
+
+Every write path keeps it in step inside the same transaction as the
+action rows:
+  - services/action_log.write_actions (buffered writer and sync mode)
+  - the CustomerAction post_save receiver (single .create() / API create)
+  - CustomerActionViewSet update/destroy, and the archive command,
+    which subtract what they remove
+`manage.py rebuild_customer_crop_stats` recomputes it from the log.
+"""
+import math
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from farmer_app.models import Customer, CustomerAction, CustomerCropStats
+
+COUNT_FIELDS = {"ADD": "add_count", "REMOVE": "remove_count", "PURCHASE": "purchase_count"}
+
+SUM_FIELDS = [
+    "add_count", "remove_count", "purchase_count",
+    "price_sum", "discount_sum", "stock_sum",
+    "purchase_price_sum", "purchase_discount_sum", "purchase_stock_sum",
+]
+
+# Interest score: each action adds its score, and the total decays by
+# exp(-INTEREST_DECAY_PER_DAY * days) (the recommendation recency weight)
+ACTION_SCORES = {"ADD": 1, "REMOVE": -1, "PURCHASE": 3}
+INTEREST_DECAY_PER_DAY = 0.1
+
+
+# ---------------- Decayed interest ----------------
+def _decay(days):
+    return math.exp(-INTEREST_DECAY_PER_DAY * days)
+
+
+def _days(later, earlier):
+    return (later - earlier).total_seconds() / (60*60*24)
+
+
+def combine_interest(score, at, delta, delta_at):
+    """
+    Adds `delta` (valued at delta_at) to `score` (valued at `at`). The
+    result is valued at the later of the two times, so it is O(1) per
+    update and never needs the history.
+    """
+    if at is None:
+        return delta, delta_at
+    if delta_at >= at:
+        return score * _decay(_days(delta_at, at)) + delta, delta_at
+    # Out-of-order (older) action: decay it up to the stored time instead
+    return score + delta * _decay(_days(at, delta_at)), at
+
+
+# ---------------- Rollup updates ----------------
+def _deltas(actions, sign):
+    """
+    {(customer_id, crop_id): {field: delta, "last_action_at": max timestamp,
+                              "interest": score delta valued at "interest_at"}}
+    """
+    deltas = {}
+    for action in actions:
+        key = (action.customer_id_id, action.crop_id)
+        row = deltas.get(key)
+        if row is None:
+            row = deltas[key] = dict.fromkeys(SUM_FIELDS, 0)
+            row["last_action_at"] = None
+
+        price = float(action.price_at_action)
+        discount = float(action.discount_at_action)
+        stock = float(action.stock_at_action)
+
+        row[COUNT_FIELDS[action.action]] += sign
+        row["price_sum"] += sign * price
+        row["discount_sum"] += sign * discount
+        row["stock_sum"] += sign * stock
+        if action.action == "PURCHASE":
+            row["purchase_price_sum"] += sign * price
+            row["purchase_discount_sum"] += sign * discount
+            row["purchase_stock_sum"] += sign * stock
+
+        if row["last_action_at"] is None or action.timestamp > row["last_action_at"]:
+            row["last_action_at"] = action.timestamp
+        row.setdefault("events", []).append((sign * ACTION_SCORES[action.action], action.timestamp))
+
+    # Fold each pair's actions into one contribution valued at its latest action
+    for row in deltas.values():
+        events = row.pop("events")
+        row["interest_at"] = max(timestamp for _, timestamp in events)
+        row["interest"] = sum(score * _decay(_days(row["interest_at"], timestamp)) for score, timestamp in events)
+    return deltas
+
+
+def _apply_delta(customer_id, crop_id, delta, add):
+    changes = {field: F(field) + value for field, value in delta.items() if field in SUM_FIELDS and value}
+    if add and delta["last_action_at"] is not None:
+        # Greatest() is NULL on SQLite if either side is NULL
+        changes["last_action_at"] = Greatest(
+            Coalesce(F("last_action_at"), Value(delta["last_action_at"])), Value(delta["last_action_at"])
+        )
+
+    stats = CustomerCropStats.objects.filter(customer_id=customer_id, crop_id=crop_id)
+
+    # The row is locked while its interest score is read, decayed and written back
+    current = stats.select_for_update().values_list("interest_score", "interest_at").first()
+    if current is not None:
+        changes["interest_score"], changes["interest_at"] = combine_interest(
+            *current, delta["interest"], delta["interest_at"]
+        )
+        stats.update(**changes)
+        return
+    if not add:
+        return
+
+    # First action of this customer on this crop
+    try:
+        with transaction.atomic():
+            CustomerCropStats.objects.create(
+                customer_id=customer_id,
+                crop_id=crop_id,
+                **{field: delta[field] for field in SUM_FIELDS},
+                last_action_at=delta["last_action_at"],
+                interest_score=delta["interest"],
+                interest_at=delta["interest_at"],
+            )
+    except IntegrityError:
+        # Created concurrently; take the locked update path instead
+        _apply_delta(customer_id, crop_id, delta, add)
+
+
+def apply_actions(actions, sign=1):
+    """
+    Adds (sign=1) or subtracts (sign=-1) CustomerAction instances to/from
+    the rollup: per (customer, crop) touched, one locked SELECT of the
+    interest score and one UPDATE (F() increments), or an INSERT for a
+    pair seen for the first time. Also bumps the action watermark of every
+    customer touched.
+
+    Locks are always taken in the same order (the customers by id, then
+    their pairs sorted), so concurrent writers with overlapping pairs wait
+    for each other instead of deadlocking.
+    """
+    deltas = _deltas(actions, sign)
+    customer_ids = sorted({customer_id for customer_id, _ in deltas})
+    with transaction.atomic():
+        list(Customer.objects.select_for_update().filter(pk__in=customer_ids).order_by("pk").values_list("pk", flat=True))
+        for customer_id, crop_id in sorted(deltas):
+            _apply_delta(customer_id, crop_id, deltas[customer_id, crop_id], add=sign > 0)
+
+        # New data for these customers: their stored recommendations are stale
+        Customer.objects.filter(pk__in=customer_ids).update(action_watermark=F("action_watermark") + 1)
+
+
+def aggregate_actions(actions):
+    """
+    Grouped SQL aggregate of a CustomerAction queryset, one row per
+    (customer, crop), with the same fields as CustomerCropStats.
+    """
+    purchase = Q(action="PURCHASE")
+    return actions.order_by().values("customer_id_id", "crop_id").annotate(
+        add_count=Count("id", filter=Q(action="ADD")),
+        remove_count=Count("id", filter=Q(action="REMOVE")),
+        purchase_count=Count("id", filter=purchase),
+        price_sum=Sum("price_at_action"),
+        discount_sum=Sum("discount_at_action"),
+        stock_sum=Sum("stock_at_action"),
+        purchase_price_sum=Sum("price_at_action", filter=purchase),
+        purchase_discount_sum=Sum("discount_at_action", filter=purchase),
+        purchase_stock_sum=Sum("stock_at_action", filter=purchase),
+        last_action_at=Max("timestamp"),
+    )
+
+
+def _row_totals(row):
+    """Counts as ints, sums as floats (the aggregate returns Decimals)."""
+    return {
+        field: int(row[field] or 0) if field in COUNT_FIELDS.values() else float(row[field] or 0)
+        for field in SUM_FIELDS
+    }
+
+
+def subtract_aggregate(actions):
+    """
+    Subtracts a whole CustomerAction queryset from the rollup (set-based).
+    Interest scores are left alone: archived months have decayed to ~0.
+    """
+    with transaction.atomic():
+        for row in aggregate_actions(actions).iterator():
+            changes = {field: F(field) - value for field, value in _row_totals(row).items() if value}
+            CustomerCropStats.objects.filter(
+                customer_id=row["customer_id_id"], crop_id=row["crop_id"]
+            ).update(**changes)
+
+
+def rebuild_stats(customer_ids=None, batch_size=1000):
+    """
+    Recomputes the rollup from CustomerAction, for all customers or only
+    `customer_ids`. Returns the number of rollup rows written.
+    """
+    actions = CustomerAction.objects.all()
+    stats = CustomerCropStats.objects.all()
+    if customer_ids is not None:
+        actions = actions.filter(customer_id__in=customer_ids)
+        stats = stats.filter(customer_id__in=customer_ids)
+
+    written = 0
+    with transaction.atomic():
+        # Interest scores valued at `now`, streamed so memory is one float per pair
+        now = timezone.now()
+        interest = {}
+        rows = actions.values_list("customer_id_id", "crop_id", "action", "timestamp")
+        for customer_id, crop_id, action, timestamp in rows.iterator(chunk_size=5000):
+            key = (customer_id, crop_id)
+            interest[key] = interest.get(key, 0.0) + ACTION_SCORES[action] * _decay(_days(now, timestamp))
+
+        stats.delete()
+        batch = []
+        for row in aggregate_actions(actions).iterator(chunk_size=batch_size):
+            batch.append(CustomerCropStats(
+                customer_id=row["customer_id_id"],
+                crop_id=row["crop_id"],
+                **_row_totals(row),
+                last_action_at=row["last_action_at"],
+                interest_score=interest.get((row["customer_id_id"], row["crop_id"]), 0.0),
+                interest_at=now,
+            ))
+            if len(batch) >= batch_size:
+                CustomerCropStats.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            CustomerCropStats.objects.bulk_create(batch)
+            written += len(batch)
+    return written
@@ -0,0 +1,111 @@
+"""
+Small in-process background executor for work that should not run in the
+request (e.g. recomputing a customer's recommendations).
+
+submit_once(key, fn, *args) runs fn(*args) on a worker thread unless a task
+with the same key is already queued or running, so a burst of page loads
+queues one recompute, not one per request. submit(fn, *args) always queues.
+
+A keyed task that fails is not queued again until its backoff has passed
+(BACKGROUND_RETRY_BACKOFF seconds, doubled per consecutive failure up to
+BACKGROUND_MAX_BACKOFF), so a recompute that keeps failing is not retried
+on every page load. A success clears the backoff.
+
+Settings (all optional):
+    BACKGROUND_TASKS_SYNC     run tasks inline in the caller (tests, scripts)
+    BACKGROUND_WORKERS        worker threads (default 2)
+    BACKGROUND_RETRY_BACKOFF  seconds before a failed keyed task is retried (default 30)
+    BACKGROUND_MAX_BACKOFF    upper bound of the backoff (default 3600)
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_executor = None
+_pending = set()
+# key -> (consecutive failures, monotonic time the key may be queued again)
+_failures = {}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, "BACKGROUND_WORKERS", 2),
+                    thread_name_prefix="background",
+                )
+    return _executor
+
+
+def _record_failure(key):
+    failures = _failures.get(key, (0, 0))[0] + 1
+    delay = min(
+        getattr(settings, "BACKGROUND_RETRY_BACKOFF", 30) * 2 ** (failures - 1),
+        getattr(settings, "BACKGROUND_MAX_BACKOFF", 3600),
+    )
+    _failures[key] = (failures, time.monotonic() + delay)
+    return delay
+
+
+def _run(key, fn, args):
+    try:
+        fn(*args)
+    except Exception:
+        if key is None:
+            logger.exception("Background task failed")
+        else:
+            with _lock:
+                delay = _record_failure(key)
+            logger.exception("Background task %s failed; not retrying for %ss", key, delay)
+    else:
+        if key is not None:
+            with _lock:
+                _failures.pop(key, None)
+    finally:
+        with _lock:
+            _pending.discard(key)
+        # Worker threads keep their own DB connections; recycle like a request would
+        close_old_connections()
+
+
+def submit_once(key, fn, *args):
+    """
+    Queues fn(*args) unless `key` is already queued or running, or failed
+    recently and is backing off. Returns True if the task was queued (or
+    run, in sync mode).
+    """
+    if getattr(settings, "BACKGROUND_TASKS_SYNC", False):
+        fn(*args)
+        return True
+
+    with _lock:
+        if key in _pending or _failures.get(key, (0, 0))[1] > time.monotonic():
+            return False
+        _pending.add(key)
+
+    _get_executor().submit(_run, key, fn, args)
+    return True
+
+
+def submit(fn, *args):
+    """Queues fn(*args) unconditionally (for work that must not be dropped)."""
+    if getattr(settings, "BACKGROUND_TASKS_SYNC", False):
+        fn(*args)
+        return
+
+    _get_executor().submit(_run, None, fn, args)
+
+
+def is_pending(key):
+    """True while a task with `key` is queued or running."""
+    with _lock:
+        return key in _pending
@@ -0,0 +1,181 @@
+from django.db import transaction
+from django.utils import timezone
+from farmer_app.models import Cart, CartItem, CustomerAction, Market
+from services.action_log import log_actions
+
+# Largest operation list accepted by one /cart/{id}/apply/ request
+MAX_CART_OPERATIONS = 200
+
+
+class CartOperationError(Exception):
+    """Raised when an operation list is rejected; nothing has been applied."""
+
+    def __init__(self, errors):
+        super().__init__("Invalid cart operations")
+        self.errors = errors
+
+
+def _parse_operation(op, items_by_id):
+    """
+    Normalizes one operation to (kind, market_item_id, quantity).
+
+    Accepted shapes (same fields as the single-item actions):
+        {"op": "add",    "market_item_id": 5, "quantity": 2}
+        {"op": "update", "item_id": 9,        "quantity": 3}   (quantity required)
+        {"op": "remove", "item_id": 9}
+    "update" and "remove" may name the listing with "market_item_id"
+    instead of "item_id", so an item added earlier in the same batch can
+    be changed again before it has a cart item id.
+    """
+    if not isinstance(op, dict):
+        raise ValueError("Operation must be an object")
+
+    kind = op.get("op")
+    if kind not in ("add", "update", "remove"):
+        raise ValueError("op must be one of: add, update, remove")
+
+    if kind == "add" or op.get("item_id") is None:
+        if op.get("market_item_id") is None:
+            raise ValueError("market_item_id is required")
+        market_item_id = int(op["market_item_id"])
+    else:
+        item = items_by_id.get(int(op["item_id"]))
+        if item is None:
+            raise LookupError("Item not found")
+        market_item_id = item.market_item_id
+
+    if kind == "remove":
+        return kind, market_item_id, 0
+
+    # An update without a quantity must not silently become a removal
+    if kind == "update" and op.get("quantity") is None:
+        raise ValueError("quantity is required for update")
+    quantity = int(op.get("quantity", 1))
+    if quantity < 0 or (kind == "add" and quantity == 0):
+        raise ValueError("quantity must be positive")
+    return kind, market_item_id, quantity
+
+
+def apply_cart_operations(cart, operations):
+    """
+    Applies an ordered list of add/update/remove operations to a cart,
+    all or nothing:
+      - one SELECT for the cart items, one for every listing involved
+      - operations are replayed in memory against current Market.stock
+      - the net result is written with bulk_create / bulk_update / one
+        DELETE; every step is logged as a CustomerAction through the
+        buffered writer (services/action_log.py) once the transaction commits
+
+    An "update" to quantity 0 removes the item.
+
+    Raises:
+        CartOperationError: errors list of {"index": i, "error": message}.
+    """
+    if len(operations) > MAX_CART_OPERATIONS:
+        raise CartOperationError([{
+            "index": None,
+            "error": f"At most {MAX_CART_OPERATIONS} operations per request",
+        }])
+
+    with transaction.atomic():
+        # Serializes concurrent batches on the same cart
+        Cart.objects.select_for_update().filter(pk=cart.pk).exists()
+
+        items = list(CartItem.objects.filter(cart=cart).order_by("id"))
+        items_by_id = {item.id: item for item in items}
+
+        errors = []
+        parsed = []
+        for index, op in enumerate(operations):
+            try:
+                parsed.append((index, *_parse_operation(op, items_by_id)))
+            except LookupError as e:
+                errors.append({"index": index, "error": str(e)})
+            except (TypeError, ValueError) as e:
+                errors.append({"index": index, "error": str(e) or "Invalid operation"})
+
+        market_ids = {item.market_item_id for item in items}
+        market_ids.update(market_item_id for _, _, market_item_id, _ in parsed)
+        markets = Market.objects.in_bulk(list(market_ids))
+
+        # Replay on in-memory quantities: {market_item_id: quantity}
+        quantities = {}
+        for item in items:
+            quantities[item.market_item_id] = quantities.get(item.market_item_id, 0) + item.quantity
+
+        now = timezone.now()
+        actions = []
+        for index, kind, market_item_id, quantity in parsed:
+            market_item = markets.get(market_item_id)
+            if market_item is None:
+                errors.append({"index": index, "error": "Market item not found"})
+                continue
+
+            current = quantities.get(market_item_id, 0)
+            if kind == "add":
+                new_quantity = current + quantity
+            elif market_item_id not in quantities:
+                errors.append({"index": index, "error": "Item not found"})
+                continue
+            else:
+                new_quantity = quantity
+
+            if new_quantity > market_item.stock:
+                errors.append({
+                    "index": index,
+                    "error": f"Cannot add more than available stock ({market_item.stock})",
+                })
+                continue
+
+            if new_quantity == current:
+                continue
+
+            if new_quantity:
+                quantities[market_item_id] = new_quantity
+            else:
+                quantities.pop(market_item_id)
+
+            actions.append(CustomerAction(
+                customer_id_id=cart.customer_id,
+                crop_id=market_item.crop_id,
+                action="ADD" if new_quantity > current else "REMOVE",
+                quantity=abs(new_quantity - current),
+                price_at_action=market_item.price,
+                discount_at_action=market_item.discount,
+                stock_at_action=market_item.stock,
+                timestamp=now,
+            ))
+
+        if errors:
+            raise CartOperationError(sorted(errors, key=lambda e: e["index"]))
+
+        # Net changes: keep the first cart item per listing, drop the rest
+        to_update = []
+        to_delete = []
+        kept = set()
+        for item in items:
+            new_quantity = quantities.get(item.market_item_id)
+            if new_quantity is None or item.market_item_id in kept:
+                to_delete.append(item.pk)
+                continue
+            kept.add(item.market_item_id)
+            if item.quantity != new_quantity:
+                item.quantity = new_quantity
+                to_update.append(item)
+
+        to_create = [
+            CartItem(cart=cart, market_item_id=market_item_id, quantity=quantity)
+            for market_item_id, quantity in quantities.items()
+            if market_item_id not in kept
+        ]
+
+        if to_delete:
+            CartItem.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ["quantity"])
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        if actions:
+            log_actions(actions)
+
+    return len(actions)
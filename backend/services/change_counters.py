@@ -0,0 +1,87 @@
+import hashlib
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.views.decorators.http import condition
+from farmer_app.models import ChangeCounter
+
+# Market changes on every purchase, so its counter is split into shards
+# ("market:0".."market:15", by listing id). Two purchases only update the
+# same counter row when their listings share a shard; the /market/ ETag
+# reads all shards in one query.
+MARKET_COUNTER_SHARDS = 16
+
+
+def market_counters(listing_ids=None):
+    """Counter names of these listings' shards, or of every shard."""
+    if listing_ids is None:
+        shards = range(MARKET_COUNTER_SHARDS)
+    else:
+        shards = {listing_id % MARKET_COUNTER_SHARDS for listing_id in listing_ids}
+    return [f"market:{shard}" for shard in sorted(shards)]
+
+
+def bump(*names):
+    """Increments the change counter of each model name."""
+    now = timezone.now()
+    # Sorted, so callers bumping several rows inside a transaction lock them in one order
+    for name in sorted(set(names)):
+        updated = ChangeCounter.objects.filter(name=name).update(
+            version=F("version") + 1, changed_at=now
+        )
+        if not updated:
+            ChangeCounter.objects.get_or_create(name=name, defaults={"version": 1, "changed_at": now})
+
+
+def bump_on_commit(*names):
+    """
+    Bumps once the surrounding transaction commits. This keeps the counter
+    row lock out of long transactions (e.g. checkout), and a new ETag is only
+    handed out once the data it describes is visible.
+    """
+    transaction.on_commit(lambda: bump(*names))
+
+
+def read_counters(names):
+    """{name: (version, changed_at)} for the given model names, in one query."""
+    rows = ChangeCounter.objects.filter(name__in=names).values_list("name", "version", "changed_at")
+    return {name: (version, changed_at) for name, version, changed_at in rows}
+
+
+def conditional_on(*names, extra=None):
+    """
+    View decorator: strong ETag + Last-Modified derived from the change
+    counters of `names`. A matching If-None-Match / If-Modified-Since is
+    answered with 304 before the view (and its queries/serializers) runs.
+
+    The ETag also covers the full request path, so every filter/cursor
+    combination gets its own tag. `extra(request)` can add more inputs
+    (e.g. today's date for data that is regenerated daily).
+    """
+    def _counters(request):
+        # etag_func and last_modified_func share one lookup
+        counters = getattr(request, "_change_counters", None)
+        if counters is None:
+            counters = read_counters(names)
+            request._change_counters = counters
+        return counters
+
+    def etag_func(request, *args, **kwargs):
+        counters = _counters(request)
+        parts = [f"{name}:{counters.get(name, (0, None))[0]}" for name in names]
+        parts.append(request.get_full_path())
+        if extra:
+            parts.append(str(extra(request)))
+        return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+    def last_modified_func(request, *args, **kwargs):
+        stamps = [changed_at for _, changed_at in _counters(request).values()]
+        return max(stamps) if stamps else None
+
+    # Date-dependent responses (extra) can change without a counter bump,
+    # so they only get the ETag
+    return condition(
+        etag_func=etag_func,
+        last_modified_func=None if extra else last_modified_func,
+    )
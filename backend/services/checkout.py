@@ -0,0 +1,87 @@
+from django.db import transaction
+from farmer_app.models import Cart, CartItem, CustomerAction, Market
+from services.action_log import log_actions
+from services.stock_ledger import InsufficientStock, deduct_market_stock_many
+
+
+def _short_items(items, stock_by_market):
+    """
+    Cart items whose quantity exceeds the given market stock. A listing
+    missing from stock_by_market was deleted meanwhile: reported as
+    unavailable with stock 0.
+    """
+    short = []
+    for item in items:
+        stock = stock_by_market.get(item.market_item_id)
+        if stock is not None and item.quantity <= stock:
+            continue
+        entry = {"product": item.market_item.product_name, "requested": item.quantity, "stock": stock or 0}
+        if stock is None:
+            entry["error"] = "No longer available"
+        short.append(entry)
+    return short
+
+
+def checkout(cart):
+    """
+    Purchases everything in the cart, all or nothing, in one transaction:
+      - the cart row is locked first (like cart_ops), so a second checkout
+        of the same cart waits and then finds it empty
+      - one SELECT for the items and their market rows
+      - one conditional UPDATE for all stock decrements
+      - the PURCHASE actions are queued for the buffered writer on commit
+      - one DELETE to clear the purchased items
+
+    Returns:
+        list: [{"product": name, "qty": quantity}, ...] (empty if the cart is empty)
+
+    Raises:
+        InsufficientStock: details list the items that could not be covered.
+    """
+    with transaction.atomic():
+        Cart.objects.select_for_update().filter(pk=cart.pk).exists()
+
+        items = list(cart.items.select_related("market_item").order_by("id"))
+        if not items:
+            return []
+
+        demand = {}
+        for item in items:
+            demand[item.market_item_id] = demand.get(item.market_item_id, 0) + item.quantity
+
+        # Friendly pre-check on the stock we just read
+        short = _short_items(items, {item.market_item_id: item.market_item.stock for item in items})
+        if short:
+            raise InsufficientStock(short)
+
+        if deduct_market_stock_many(demand) != len(demand):
+            # Another buyer got there first (or the listing is gone): report current stock and roll back
+            current = dict(Market.objects.filter(pk__in=list(demand)).values_list("id", "stock"))
+            raise InsufficientStock(_short_items(items, current) or [])
+
+        # Stock remaining after this purchase, as logged by the per-item flow
+        remaining = {}
+        actions = []
+        purchased_items = []
+        for item in items:
+            market_item = item.market_item
+            remaining[market_item.id] = remaining.get(market_item.id, market_item.stock) - item.quantity
+
+            actions.append(CustomerAction(
+                customer_id_id=cart.customer_id,
+                crop_id=market_item.crop_id,
+                action="PURCHASE",
+                quantity=item.quantity,
+                price_at_action=market_item.price,
+                discount_at_action=market_item.discount,
+                stock_at_action=max(remaining[market_item.id], 0),
+            ))
+            purchased_items.append({
+                "product": market_item.product_name,
+                "qty": item.quantity
+            })
+
+        log_actions(actions)
+        CartItem.objects.filter(pk__in=[item.pk for item in items]).delete()
+
+    return purchased_items
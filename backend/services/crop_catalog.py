@@ -0,0 +1,111 @@
+import threading
+
+from django.db import transaction
+from farmer_app.models import Crop, CropAlias
+
+_lock = threading.Lock()
+_catalog = None
+
+
+def normalize_crop_name(name):
+    """Alias key: stripped and lowercase (replaces the old `iexact` matching)."""
+    return (name or "").strip().lower()
+
+
+def _load_catalog():
+    """
+    Returns:
+        dict: {"aliases": {normalized alias: crop id}, "names": {crop id: canonical name}}
+    """
+    return {
+        "aliases": dict(CropAlias.objects.values_list("alias", "crop_id")),
+        "names": dict(Crop.objects.values_list("id", "name")),
+    }
+
+
+def _get_catalog():
+    global _catalog
+    catalog = _catalog
+    if catalog is not None:
+        return catalog
+
+    with _lock:
+        if _catalog is None:
+            _catalog = _load_catalog()
+        return _catalog
+
+
+def invalidate_crop_catalog():
+    global _catalog
+    with _lock:
+        _catalog = None
+
+
+def get_crop_id(name):
+    """Crop id for a canonical name or alias, or None if the crop is unknown."""
+    key = normalize_crop_name(name)
+    crop_id = _get_catalog()["aliases"].get(key)
+    if crop_id is not None:
+        return crop_id
+
+    # May have been added by another process since the catalog was loaded
+    crop_id = CropAlias.objects.filter(alias=key).values_list("crop_id", flat=True).first()
+    if crop_id is not None:
+        invalidate_crop_catalog()
+    return crop_id
+
+
+def resolve_crop_id(name):
+    """Like get_crop_id, but registers unknown names as a new Crop."""
+    crop_id = get_crop_id(name)
+    if crop_id is not None:
+        return crop_id
+
+    name = (name or "").strip() or "Unknown"
+    with transaction.atomic():
+        crop, _ = Crop.objects.get_or_create(name=name)
+        alias, _ = CropAlias.objects.get_or_create(
+            alias=normalize_crop_name(name), defaults={"crop": crop}
+        )
+    return alias.crop_id
+
+
+def resolve_crop_ids(names):
+    """
+    {name: crop id} for many names, registering the unknown ones. A fixed
+    number of queries however many names are new (resolve_crop_id costs
+    a few per unknown name).
+    """
+    keys = {name: normalize_crop_name(name) or "unknown" for name in names}
+    aliases = _get_catalog()["aliases"]
+    unknown = {key for key in keys.values() if key not in aliases}
+    if not unknown:
+        return {name: aliases[key] for name, key in keys.items()}
+
+    found = dict(CropAlias.objects.filter(alias__in=unknown).values_list("alias", "crop_id"))
+    new = {}
+    for name, key in keys.items():
+        if key in unknown and key not in found:
+            new.setdefault(key, (name or "").strip() or "Unknown")  # first spelling seen
+
+    if new:
+        with transaction.atomic():
+            # ignore_conflicts: another request may register the same crops meanwhile
+            Crop.objects.bulk_create([Crop(name=name) for name in new.values()], ignore_conflicts=True)
+            crop_ids = dict(Crop.objects.filter(name__in=new.values()).values_list("name", "id"))
+            CropAlias.objects.bulk_create(
+                [CropAlias(alias=key, crop_id=crop_ids[name]) for key, name in new.items()], ignore_conflicts=True
+            )
+            found.update(CropAlias.objects.filter(alias__in=new).values_list("alias", "crop_id"))
+    # bulk_create skips the post_save receiver
+    invalidate_crop_catalog()
+    return {name: aliases[key] if key in aliases else found[key] for name, key in keys.items()}
+
+
+def crop_name(crop_id):
+    """Canonical name for a crop id, without a query in the common case."""
+    name = _get_catalog()["names"].get(crop_id)
+    if name is None and crop_id is not None:
+        invalidate_crop_catalog()
+        name = _get_catalog()["names"].get(crop_id)
+    return name
@@ -0,0 +1,86 @@
+"""
+7-day DailyCropForecast rows for every crop in CropPrices.
+
+/cropprices/ used to (re)generate missing forecasts while serving the GET,
+after its ETag had been computed, so the first response of the day carried
+a tag that was stale at once. ensure_daily_forecasts() now runs before the
+ETag is computed, and the filled-in prices are seeded by (crop, day), so a
+response is the same for every request of the day.
+"""
+import datetime
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count
+from farmer_app.models import CropPrices, DailyCropForecast
+
+FORECAST_DAYS = 7
+DEFAULT_PRICE = 1000.0
+
+
+def _rng(crop_id, today):
+    return np.random.default_rng([crop_id, today.toordinal()])
+
+
+def average_synthetic_price(prices):
+    prices = [price for price in prices if price is not None]
+    return float(np.mean(prices)) if prices else DEFAULT_PRICE
+
+
+def synthetic_price(crop_id, price, average_price, today):
+    """`price`, or the average ±5% when the crop has none (stable for the day)."""
+    if price is not None:
+        return price
+    return round(average_price * _rng(crop_id, today).uniform(0.95, 1.05), 2)
+
+
+def _complete_crops(crop_ids, today):
+    return set(
+        DailyCropForecast.objects.filter(crop_id__in=crop_ids, date__gte=today)
+        .values("crop_id").annotate(days=Count("id")).filter(days__gte=FORECAST_DAYS)
+        .values_list("crop_id", flat=True)
+    )
+
+
+def ensure_daily_forecasts(today=None):
+    """
+    Regenerates the forecasts of every crop with fewer than FORECAST_DAYS
+    from `today` on. Returns the number of crops regenerated (usually 0:
+    one query).
+    """
+    today = today or datetime.date.today()
+
+    # First CropPrices row of each crop, as the list view shows them
+    base = {}
+    for crop_id, price in CropPrices.objects.values_list("crop_id", "synthetic_price"):
+        base.setdefault(crop_id, price)
+
+    missing = set(base) - _complete_crops(base, today)
+    if not missing:
+        return 0
+
+    average_price = average_synthetic_price(base.values())
+    with transaction.atomic():
+        # Concurrent first requests of the day: one regenerates, the others find it done
+        list(CropPrices.objects.select_for_update().filter(crop_id__in=missing).order_by("pk").values_list("pk", flat=True))
+        missing -= _complete_crops(missing, today)
+
+        rows = []
+        for crop_id in sorted(missing):
+            base_price = synthetic_price(crop_id, base[crop_id], average_price, today)
+            rng = _rng(crop_id, today)
+            rows.extend(
+                DailyCropForecast(
+                    crop_id=crop_id,
+                    date=today + datetime.timedelta(days=i),
+                    price_estimate=round(base_price * (0.95 + rng.random() * 0.1), 2),
+                )
+                for i in range(1, FORECAST_DAYS + 1)
+            )
+        DailyCropForecast.objects.filter(crop_id__in=missing).delete()
+        DailyCropForecast.objects.bulk_create(rows)
+
+        # bulk_create skips post_save
+        from services.change_counters import bump_on_commit
+        bump_on_commit("dailycropforecast")
+    return len(missing)
@@ -0,0 +1,109 @@
+"""
+Crop co-purchase neighbours for candidate generation.
+
+build_crop_neighbors() (nightly, `manage.py build_crop_neighbors`) counts,
+for every pair of crops, the customers who purchased both, and keeps the
+top-k neighbours of each crop in CropNeighbor, ranked by cosine similarity
+co_purchases / sqrt(purchasers(a) * purchasers(b)). It also stores each
+crop's purchaser count on Crop.purchasers for cold start.
+
+The purchased (customer, crop) pairs are streamed from the CustomerCropStats
+rollup (purchase_count > 0, i.e. the live PURCHASE actions) in keyset
+chunks, so memory is bounded by the number of crop pairs, not by the size
+of the action log.
+"""
+import heapq
+import itertools
+import math
+from collections import Counter, defaultdict
+from operator import itemgetter
+
+from django.db import transaction
+from django.db.models import Q
+from farmer_app.models import Crop, CropNeighbor, Customer, CustomerCropStats
+
+DEFAULT_NEIGHBORS = 20
+
+
+def _purchased_pairs(chunk_size):
+    """(customer_id, crop_id) of every purchase, ordered, one chunk per query."""
+    purchased = CustomerCropStats.objects.filter(purchase_count__gt=0).order_by("customer_id", "crop_id")
+    last_customer, last_crop = 0, 0
+    while True:
+        rows = list(
+            purchased.filter(Q(customer_id__gt=last_customer) | Q(customer_id=last_customer, crop_id__gt=last_crop))
+            .values_list("customer_id", "crop_id")[:chunk_size]
+        )
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_customer, last_crop = rows[-1]
+
+
+def build_crop_neighbors(k=DEFAULT_NEIGHBORS, chunk_size=10000, min_co_purchases=1):
+    """
+    Rebuilds CropNeighbor and Crop.purchasers.
+
+    Returns:
+        dict: customers, crop pairs seen, neighbour rows written
+    """
+    purchasers = Counter()
+    co_purchases = Counter()
+    customers = 0
+
+    # One basket (the crops a customer purchased, sorted) at a time
+    for _, group in itertools.groupby(_purchased_pairs(chunk_size), key=itemgetter(0)):
+        basket = [crop_id for _, crop_id in group]
+        customers += 1
+        purchasers.update(basket)
+        co_purchases.update(itertools.combinations(basket, 2))
+
+    candidates = defaultdict(list)
+    for (a, b), count in co_purchases.items():
+        if count < min_co_purchases:
+            continue
+        score = count / math.sqrt(purchasers[a] * purchasers[b])
+        candidates[a].append((score, count, b))
+        candidates[b].append((score, count, a))
+
+    rows = [
+        CropNeighbor(crop_id=crop_id, neighbor_id=neighbor_id, co_purchases=count, score=score, rank=rank)
+        for crop_id, scored in candidates.items()
+        for rank, (score, count, neighbor_id) in enumerate(heapq.nlargest(k, scored))
+    ]
+
+    with transaction.atomic():
+        CropNeighbor.objects.all().delete()
+        CropNeighbor.objects.bulk_create(rows, batch_size=1000)
+
+        crops = list(Crop.objects.only("pk", "purchasers"))
+        for crop in crops:
+            crop.purchasers = purchasers.get(crop.pk, 0)
+        Crop.objects.bulk_update(crops, ["purchasers"], batch_size=1000)
+
+    return {"customers": customers, "pairs": len(co_purchases), "neighbors": len(rows)}
+
+
+def related_crops(crop_ids, per_crop=5):
+    """
+    {crop_id: [(neighbor_id, score), ...] closest first} for the top
+    `per_crop` neighbours of each crop; one query on (crop, rank).
+    """
+    related = defaultdict(list)
+    rows = (
+        CropNeighbor.objects.filter(crop_id__in=crop_ids, rank__lt=per_crop)
+        .order_by("crop_id", "rank")
+        .values_list("crop_id", "neighbor_id", "score")
+    )
+    for crop_id, neighbor_id, score in rows:
+        related[crop_id].append((neighbor_id, score))
+    return related
+
+
+def popular_crops(limit):
+    """[(crop_id, share of customers who purchased it)] most purchased first."""
+    rows = list(Crop.objects.filter(purchasers__gt=0).order_by("-purchasers", "pk").values_list("pk", "purchasers")[:limit])
+    if not rows:
+        return []
+    total = max(Customer.objects.count(), 1)
+    return [(crop_id, count / total) for crop_id, count in rows]
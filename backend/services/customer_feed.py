@@ -0,0 +1,132 @@
+"""
+CustomerFeed: each customer's top FEED_SIZE in-stock listings of their
+recommended crops, ranked by purchase_prob, then newest (ranked_listings is
+the only place this ranking lives), so /recommendations/<customer_id>/ is
+one indexed read.
+
+The feed is rewritten for a customer when:
+  - their stored recommendations change (save_recommendations_batch)
+  - a listing of a crop they are recommended is created or restocked and
+    would make their top N
+  - a listing in their feed is deleted or sells out
+Listing writes only queue the crop ids (after commit); finding the affected
+customers and rewriting their feeds both run on the background executor.
+A customer whose feed was never built gets it built on first read.
+`manage.py rebuild_customer_feeds` backfills every customer.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Min, Q, Window
+from django.db.models.functions import RowNumber
+from farmer_app.models import Customer, CustomerFeed, CustomerRecommendation
+
+FEED_SIZE = 20
+
+
+def ranked_listings(customer_ids):
+    """(customer_id, market_id, score, rank) of the top FEED_SIZE listings per customer, one query."""
+    return (
+        CustomerRecommendation.objects
+        .filter(customer_id__in=customer_ids, crop__market__stock__gt=0)
+        .annotate(
+            market_id=F("crop__market__id"),
+            rank=Window(
+                RowNumber(),
+                partition_by=[F("customer_id")],
+                order_by=[F("purchase_prob").desc(), F("crop__market__date_added").desc(), F("crop__market__id").desc()],
+            ),
+        )
+        .filter(rank__lte=FEED_SIZE)
+        .values_list("customer_id", "market_id", "purchase_prob", "rank")
+    )
+
+
+def refresh_feeds(customer_ids, chunk_size=500):
+    """Rewrites the feed of each customer; returns the feed rows written."""
+    customer_ids = sorted(set(customer_ids))
+    written = 0
+    for start in range(0, len(customer_ids), chunk_size):
+        chunk = customer_ids[start:start + chunk_size]
+        with transaction.atomic():
+            # Serializes concurrent refreshes of the same customer
+            list(Customer.objects.select_for_update().filter(pk__in=chunk).order_by("pk").values_list("pk", flat=True))
+
+            rows = [
+                CustomerFeed(customer_id=customer_id, market_id=market_id, score=score, rank=rank)
+                for customer_id, market_id, score, rank in ranked_listings(chunk)
+            ]
+            CustomerFeed.objects.filter(customer_id__in=chunk).delete()
+            CustomerFeed.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+    return written
+
+
+def affected_customers(crop_ids):
+    """
+    Customers whose feed may change because listings of these crops did:
+    those recommended one of the crops whose feed is not full or whose
+    lowest score would not beat it. This also covers a customer showing a
+    listing of the crop that sold out or was deleted (its score is at
+    least their lowest, and a deleted row leaves the feed short).
+    """
+    return set(
+        CustomerRecommendation.objects.filter(crop_id__in=crop_ids)
+        .annotate(feed_rows=Count("customer__feed"), lowest=Min("customer__feed__score"))
+        .filter(Q(feed_rows__lt=FEED_SIZE) | Q(lowest__lte=F("purchase_prob")))
+        .values_list("customer_id", flat=True)
+    )
+
+
+def refresh_crop_feeds(crop_ids):
+    """Background task: rewrites the feeds a listing change of these crops may affect."""
+    return refresh_feeds(affected_customers(crop_ids))
+
+
+def listings_changed(listings):
+    """
+    Called on Market create/update/delete and stock changes. Runs no query:
+    the affected customers are looked up by the background task, after commit.
+    """
+    crop_ids = {listing.crop_id for listing in listings if listing.crop_id is not None}
+    if not crop_ids:
+        return
+
+    from services.background import submit
+    transaction.on_commit(lambda: submit(refresh_crop_feeds, crop_ids))
+
+
+def _feed_rows(customer_id):
+    return (
+        CustomerFeed.objects.filter(customer_id=customer_id, market__stock__gt=0)
+        .order_by("rank")
+        .values(
+            "market_id", "market__product_name", "market__price", "market__weight", "market__stock",
+            "market__discount", "market__farmer__user__name", "score",
+        )
+    )
+
+
+def get_feed_items(customer_id):
+    """
+    The customer's feed as /recommendations/<id>/ returns it. A customer
+    with recommendations but no feed rows (never built, e.g. before
+    rebuild_customer_feeds ran) has it built here, for that one customer.
+    """
+    rows = list(_feed_rows(customer_id))
+    if not rows and not CustomerFeed.objects.filter(customer_id=customer_id).exists() \
+            and CustomerRecommendation.objects.filter(customer_id=customer_id).exists():
+        refresh_feeds([customer_id])
+        rows = list(_feed_rows(customer_id))
+
+    return [
+        {
+            'id': row['market_id'],
+            'crop_name': row['market__product_name'],
+            'price': row['market__price'],
+            'weight': row['market__weight'],
+            'stock': row['market__stock'],
+            'discount': row['market__discount'],
+            'farmer_name': row['market__farmer__user__name'],
+            'purchase_probability': round(row['score'], 4),
+        }
+        for row in rows
+    ]
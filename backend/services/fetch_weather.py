@@ -1,6 +1,7 @@
 import requests
 import csv
 import os
+import tempfile
 from datetime import datetime
 from django.conf import settings
 from farmer_app.models import WeatherData
@@ -8,6 +9,19 @@ from farmer_app.models import WeatherData
 CSV_PATH = os.path.join(settings.BASE_DIR, "ml_model", "data", "weather_data.csv")
 
 
+def closest_hour(hourly, now):
+    """(date, temperature, cloudcover, precipitation) of the open-meteo hourly value closest to `now`."""
+    hourly_times = [datetime.fromisoformat(t) for t in hourly["time"]]
+    closest_index = min(range(len(hourly_times)), key=lambda i: abs(hourly_times[i] - now))
+
+    return (
+        hourly_times[closest_index].date(),
+        hourly["temperature_2m"][closest_index],
+        hourly["cloudcover"][closest_index],
+        hourly["precipitation"][closest_index],
+    )
+
+
 def fetch_and_save_weather():
     print("=== FETCH FUNCTION RUNNING ===")
 
@@ -18,32 +32,13 @@ def fetch_and_save_weather():
         "hourly=temperature_2m,cloudcover,precipitation&timezone=auto"
     )
 
-    data = requests.get(url).json()
-    hourly = data["hourly"]
-
-    # Pick closest hourly value to real time
-    now = datetime.now()
-    hourly_times = [datetime.fromisoformat(t) for t in hourly["time"]]
-    closest_index = min(range(len(hourly_times)), key=lambda i: abs(hourly_times[i] - now))
-
-    today_date = hourly_times[closest_index].date()
-    temp = hourly["temperature_2m"][closest_index]
-    cloud = hourly["cloudcover"][closest_index]
-    rain = hourly["precipitation"][closest_index]
-
-    # Create CSV if not exists
-    if not os.path.exists(CSV_PATH):
-        with open(CSV_PATH, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["date", "temperature", "cloudcover", "precipitation"])
+    data = requests.get(url, timeout=10).json()
+    today_date, temp, cloud, rain = closest_hour(data["hourly"], datetime.now())
 
-    # Remove duplicate for same day
-    remove_csv_duplicate(today_date)
-
-    # Save to CSV (append)
-    with open(CSV_PATH, "a", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([today_date, temp, cloud, rain])
+    # Replace today's row (keeping the history) and swap the file in whole
+    rows = read_csv_rows(exclude_date=today_date)
+    rows.append([today_date, temp, cloud, rain])
+    write_csv_atomic(rows)
 
     # Save into DB
     WeatherData.objects.update_or_create(
@@ -58,21 +53,33 @@ def fetch_and_save_weather():
     print(f"Weather Saved: {today_date}  {temp}°C  {cloud}%  {rain}mm")
 
 
-def remove_csv_duplicate(today_date):
-    """Keep full history but remove duplicates of same date."""
+def read_csv_rows(exclude_date=None):
+    """History rows of the CSV (without header), minus those of `exclude_date`."""
     rows = []
     if not os.path.exists(CSV_PATH):
-        return
+        return rows
 
-    with open(CSV_PATH, "r") as f:
+    with open(CSV_PATH, "r", newline="") as f:
         reader = csv.reader(f)
-        header = next(reader, None)
+        next(reader, None)
         for row in reader:
-            row_date = datetime.fromisoformat(row[0]).date()
-            if row_date != today_date:
+            if datetime.fromisoformat(row[0]).date() != exclude_date:
                 rows.append(row)
+    return rows
+
 
-    with open(CSV_PATH, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["date", "temperature", "cloudcover", "precipitation"])
-        writer.writerows(rows)
\ No newline at end of file
+def write_csv_atomic(rows):
+    """
+    Writes the CSV to a temp file next to it and renames it over the old one,
+    so a concurrent reader (predict_next_7_days) never sees a half-written file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(CSV_PATH), prefix=".weather_data.", suffix=".csv")
+    try:
+        with os.fdopen(fd, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["date", "temperature", "cloudcover", "precipitation"])
+            writer.writerows(rows)
+        os.replace(tmp_path, CSV_PATH)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,142 @@
+from django.db import transaction
+from farmer_app.models import Farmer, Market, Product
+from services.change_counters import bump_on_commit, market_counters
+from services.crop_catalog import resolve_crop_ids
+from services.customer_feed import listings_changed
+from services.price_resolver import get_base_price
+from services.stock_ledger import deduct_product_quantities
+
+MAX_BULK_LISTINGS = 1000
+
+
+def listing_price(crop_id, weight, discount):
+    """Final listing price: base price per kg × weight, minus the discount."""
+    base_price = get_base_price(crop_id)
+    return round(base_price * weight * (1 - discount / 100), 2)
+
+
+def _parse_row(row):
+    """Returns (listing dict, None) or (None, error message)."""
+    if not isinstance(row, dict):
+        return None, "Listing must be an object"
+
+    try:
+        listing = {
+            "farmer": int(row.get("farmer")),
+            "product": int(row.get("product")),
+            "product_name": str(row.get("product_name") or "").strip(),
+            "weight": float(row.get("weight")),
+            "stock": int(row.get("stock")),
+            "discount": float(row.get("discount", 0)),
+        }
+    except (TypeError, ValueError):
+        return None, "farmer, product, weight, stock and discount must be numbers"
+
+    if not listing["product_name"]:
+        return None, "product_name is required"
+    if listing["weight"] <= 0 or listing["stock"] <= 0:
+        return None, "weight and stock must be positive"
+    if not 0 <= listing["discount"] < 100:
+        return None, "discount must be between 0 and 100"
+
+    return listing, None
+
+
+def create_listings_bulk(rows):
+    """
+    Creates many Market listings in one transaction.
+
+    Rows are validated and allocated against Product.quantity in request order;
+    a row that does not fit the remaining stock is rejected, the rest go through.
+    The number of queries does not depend on how many rows, products or new
+    crop names there are.
+
+    Args:
+        rows (list): Listing dicts with the same fields as MarketViewSet.create.
+
+    Returns:
+        tuple: (created Market objects, [{"index": i, "error": msg}, ...])
+    """
+    errors = []
+    parsed = []
+
+    # ---------------- 1) Parse rows ----------------
+    for index, row in enumerate(rows):
+        listing, error = _parse_row(row)
+        if error:
+            errors.append({"index": index, "error": error})
+        else:
+            parsed.append((index, listing))
+
+    # ---------------- 2) Load products & farmers (one query each) ----------------
+    products = Product.objects.in_bulk({listing["product"] for _, listing in parsed})
+    farmer_ids = set(
+        Farmer.objects.filter(
+            farmer_id__in={listing["farmer"] for _, listing in parsed}
+        ).values_list("farmer_id", flat=True)
+    )
+
+    # ---------------- 3) Allocate stock per product, in request order ----------------
+    remaining = {pk: prod.quantity for pk, prod in products.items()}
+    accepted = []
+    for index, listing in parsed:
+        prod = products.get(listing["product"])
+        if prod is None:
+            errors.append({"index": index, "error": "Product not found"})
+            continue
+        if listing["farmer"] not in farmer_ids:
+            errors.append({"index": index, "error": "Farmer not found"})
+            continue
+
+        total_weight_needed = listing["weight"] * listing["stock"]
+        if remaining[prod.pk] < total_weight_needed:
+            errors.append({
+                "index": index,
+                "error": f"Not enough stock. Available: {remaining[prod.pk]} kg"
+            })
+            continue
+
+        remaining[prod.pk] -= total_weight_needed
+        accepted.append((index, listing, total_weight_needed))
+
+    # ---------------- 4) Deduct & insert in one transaction ----------------
+    demand = {}
+    for _, listing, weight_needed in accepted:
+        demand[listing["product"]] = demand.get(listing["product"], 0) + weight_needed
+
+    with transaction.atomic():
+        # Checked again under lock: another request may have taken the stock meanwhile
+        failed_products = deduct_product_quantities(demand)
+
+        inserted = []
+        for index, listing, _ in accepted:
+            if listing["product"] in failed_products:
+                errors.append({"index": index, "error": "Not enough stock"})
+            else:
+                inserted.append(listing)
+
+        # Resolved only for rows being inserted (may register new Crops), all names at once
+        crop_ids = resolve_crop_ids({listing["product_name"] for listing in inserted})
+        new_items = []
+        for listing in inserted:
+            crop_id = crop_ids[listing["product_name"]]
+            new_items.append(Market(
+                farmer_id=listing["farmer"],
+                product_id=listing["product"],
+                product_name=listing["product_name"],
+                crop_id=crop_id,
+                weight=listing["weight"],
+                stock=listing["stock"],
+                discount=listing["discount"],
+                price=listing_price(crop_id, listing["weight"], listing["discount"]),
+            ))
+
+        created = Market.objects.bulk_create(new_items, batch_size=500)
+        if created:
+            # bulk_create skips post_save, so bump the /market/ ETag and
+            # update the customer feeds here
+            bump_on_commit(*market_counters(listing.pk for listing in created))
+            listings_changed(created)
+
+    errors.sort(key=lambda e: e["index"])
+    return created, errors
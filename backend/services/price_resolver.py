@@ -0,0 +1,85 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from farmer_app.models import CropPrices
+
+# Used when the CropPrices table is empty
+FALLBACK_BASE_PRICE = 10
+
+_lock = threading.Lock()
+_table = None
+
+
+def _load_table():
+    """
+    Reads CropPrices once and builds the in-memory price table.
+
+    Returns:
+        dict: {"prices": {crop id: latest-year price},
+               "average": mean synthetic price over all rows (or None),
+               "loaded_at": monotonic load time}
+    """
+    prices = {}
+    total = 0.0
+    count = 0
+
+    # Ascending year order, so the latest year for each crop wins
+    rows = CropPrices.objects.order_by("year", "id").values_list("crop_id", "synthetic_price")
+    for crop_id, synthetic_price in rows:
+        if synthetic_price is None:
+            continue
+        prices[crop_id] = float(synthetic_price)
+        total += float(synthetic_price)
+        count += 1
+
+    return {
+        "prices": prices,
+        "average": total / count if count else None,
+        "loaded_at": time.monotonic(),
+    }
+
+
+def _get_table():
+    global _table
+
+    # Signals only reach this process; the TTL bounds staleness for writes
+    # made elsewhere (e.g. the crop_predict.py script run from a shell).
+    ttl = getattr(settings, "PRICE_RESOLVER_TTL", 300)
+
+    table = _table
+    if table is not None and time.monotonic() - table["loaded_at"] < ttl:
+        return table
+
+    with _lock:
+        if _table is None or time.monotonic() - _table["loaded_at"] >= ttl:
+            _table = _load_table()
+        return _table
+
+
+def invalidate_price_table():
+    """Drops the cached table; the next lookup reloads it."""
+    global _table
+    with _lock:
+        _table = None
+
+
+def get_base_price(crop_id):
+    """
+    Base price (per kg) for a new market listing.
+
+    1) Latest-year ML synthetic price for the crop
+    2) Fallback = average synthetic price × random 0.9–1.2
+    3) Final fallback = FALLBACK_BASE_PRICE
+    """
+    table = _get_table()
+
+    price = table["prices"].get(crop_id)
+    if price is not None:
+        return price
+
+    if table["average"]:
+        return table["average"] * random.uniform(0.9, 1.2)
+
+    return FALLBACK_BASE_PRICE
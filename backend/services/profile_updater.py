@@ -1,7 +1,70 @@
-from farmer_app.models import CustomerAction, Customer # Assuming CustomerAction is in farmer_app
-from django.db.models import Avg
+from farmer_app.models import Customer, CustomerCropStats
+from django.db.models import Count, F, Q, Sum
 from django.utils import timezone
 
+# Simple Normalization/Mapping (Needs domain tuning, but this is a start)
+# Assuming Max Discount = 30, Max Price = 100, Max Stock = 20
+MAX_DISCOUNT = 30.0
+MAX_PRICE = 100.0
+MAX_STOCK = 20.0
+
+# Defaults/Cold Start Profile
+COLD_START_PROFILE = (0.5, 0.5, 0.5)
+
+PURCHASE_TOTALS = dict(
+    purchases=Sum('purchase_count'),
+    disc_sum=Sum('purchase_discount_sum'),
+    price_sum=Sum('purchase_price_sum'),
+    stock_sum=Sum('purchase_stock_sum'),
+)
+
+
+def profile_scores(stats):
+    """
+    (discount_sensitivity, price_elasticity, stock_urgency) from a
+    customer's purchase totals (PURCHASE_TOTALS); cold start if none.
+    """
+    purchase_count = (stats or {}).get('purchases') or 0
+    if not purchase_count:
+        return COLD_START_PROFILE
+
+    # Average context of items PURCHASED
+    avg_discount = float(stats['disc_sum'] or 0) / purchase_count
+    avg_price = float(stats['price_sum'] or 0) / purchase_count
+    avg_stock = float(stats['stock_sum'] or 0) / purchase_count
+
+    # Discount Sensitivity: Higher average discount purchased -> Higher sensitivity
+    discount_sensitivity = min(avg_discount / MAX_DISCOUNT, 1.0)
+
+    # Price Elasticity: Higher average price purchased -> Lower elasticity (less sensitive to price)
+    # We invert the score (1 - score) so high elasticity means they buy cheap.
+    price_elasticity = 1.0 - min(avg_price / MAX_PRICE, 1.0)
+
+    # Stock Urgency: Lower average stock purchased -> Higher urgency
+    # We invert the score (1 - score) so high urgency means they buy when stock is low.
+    stock_urgency = 1.0 - min(avg_stock / MAX_STOCK, 1.0)
+
+    return discount_sensitivity, price_elasticity, stock_urgency
+
+
+def profiles_from_actions(actions):
+    """
+    {customer_id: profile_scores(...)} from a CustomerAction queryset
+    rather than the rollup, e.g. only the actions before a training cutoff.
+    Customers with no purchase in it are missing (cold start).
+    """
+    totals = (
+        actions.filter(action='PURCHASE').order_by().values('customer_id_id')
+        .annotate(
+            purchases=Count('id'),
+            disc_sum=Sum('discount_at_action'),
+            price_sum=Sum('price_at_action'),
+            stock_sum=Sum('stock_at_action'),
+        )
+    )
+    return {row['customer_id_id']: profile_scores(row) for row in totals}
+
+
 def update_customer_profile(customer_id):
     """
     Calculates and saves customer preference scores based on ALL past purchases.
@@ -14,57 +77,69 @@ def update_customer_profile(customer_id):
         print(f"ERROR: Customer ID {customer_id} not found for profile update.")
         return
 
-    # 1. Get ALL historical purchases for the customer
-    purchases = CustomerAction.objects.filter(
-        customer_id=customer_id, 
-        action='PURCHASE'
-    ).exclude(
-        # Exclude bad data points
-        price_at_action__isnull=True,
-        discount_at_action__isnull=True,
-        stock_at_action__isnull=True,
-    )
-    
-    # Defaults/Cold Start Profile
-    if not purchases.exists():
-        customer.discount_sensitivity = 0.5
-        customer.price_elasticity = 0.5
-        customer.stock_urgency = 0.5
-    else:
-        # 2. Calculate the preference scores from purchases
-        
-        # Aggregate the average context of items PURCHASED
-        stats = purchases.aggregate(
-            avg_disc=Avg('discount_at_action'),
-            avg_price=Avg('price_at_action'),
-            avg_stock=Avg('stock_at_action'),
-        )
-        
-        # FIX: Explicitly cast the Decimal values returned by Django's Avg
-        # to float before using them in calculations with float literals.
-        avg_discount = float(stats['avg_disc'] or 0)
-        avg_price = float(stats['avg_price'] or 0)
-        avg_stock = float(stats['avg_stock'] or 0)
-
-        # 3. Simple Normalization/Mapping (Needs domain tuning, but this is a start)
-        # Assuming Max Discount = 30, Max Price = 100, Max Stock = 20
-        MAX_DISCOUNT = 30.0
-        MAX_PRICE = 100.0
-        MAX_STOCK = 20.0 
-        
-        # Discount Sensitivity: Higher average discount purchased -> Higher sensitivity
-        customer.discount_sensitivity = min(avg_discount / MAX_DISCOUNT, 1.0)
-        
-        # Price Elasticity: Higher average price purchased -> Lower elasticity (less sensitive to price)
-        # We invert the score (1 - score) so high elasticity means they buy cheap.
-        customer.price_elasticity = 1.0 - min(avg_price / MAX_PRICE, 1.0)
-        
-        # Stock Urgency: Lower average stock purchased -> Higher urgency
-        # We invert the score (1 - score) so high urgency means they buy when stock is low.
-        customer.stock_urgency = 1.0 - min(avg_stock / MAX_STOCK, 1.0)
-    
-    # Save the updated profile and timestamp
+    # Purchase totals from the CustomerCropStats rollup (one small row
+    # per crop) instead of re-aggregating every purchase. The watermark
+    # was read (with the customer) before them, see update_customer_profiles
+    stats = CustomerCropStats.objects.filter(customer_id=customer_id).aggregate(**PURCHASE_TOTALS)
+    customer.discount_sensitivity, customer.price_elasticity, customer.stock_urgency = profile_scores(stats)
+
+    # Save the updated profile, timestamp and watermark
     customer.last_profiled = timezone.now()
-    customer.save()
-    
-    return customer.discount_sensitivity, customer.price_elasticity, customer.stock_urgency
\ No newline at end of file
+    customer.profile_watermark = customer.action_watermark
+    customer.save(update_fields=[
+        'discount_sensitivity', 'price_elasticity', 'stock_urgency', 'last_profiled', 'profile_watermark'
+    ])
+
+    return customer.discount_sensitivity, customer.price_elasticity, customer.stock_urgency
+
+
+def update_customer_profiles(customer_ids=None, only_changed=False, batch_size=1000):
+    """
+    Set-based update_customer_profile for many customers (all, or only
+    `customer_ids`): one grouped aggregate over the rollup, then chunked
+    bulk_update of the scores and last_profiled.
+
+    only_changed: skip customers with no action WRITTEN since their last
+    profile (action_watermark unchanged). Action timestamps cannot tell:
+    the buffered writer inserts rows up to a flush interval after their
+    timestamp, so a purchase stamped before a pass may land after it.
+
+    Returns the number of customers updated.
+    """
+    customers = Customer.objects.all()
+    stats = CustomerCropStats.objects.all()
+    if customer_ids is not None:
+        customers = customers.filter(pk__in=customer_ids)
+    if only_changed:
+        customers = customers.filter(
+            Q(profile_watermark__isnull=True) | ~Q(profile_watermark=F('action_watermark'))
+        )
+    if customer_ids is not None or only_changed:
+        stats = stats.filter(customer__in=customers)
+
+    now = timezone.now()
+
+    # Watermarks first: the rollup and the watermark bump are written in one
+    # transaction, so a write landing in between is either counted in the
+    # totals or leaves the stored watermark behind (picked up next pass)
+    selected = list(customers.order_by('pk').values_list('pk', 'action_watermark'))
+    totals = {
+        row['customer_id']: row
+        for row in stats.order_by().values('customer_id').annotate(**PURCHASE_TOTALS)
+    }
+
+    fields = ['discount_sensitivity', 'price_elasticity', 'stock_urgency', 'last_profiled', 'profile_watermark']
+    for start in range(0, len(selected), batch_size):
+        batch = []
+        for customer_id, watermark in selected[start:start + batch_size]:
+            discount_sensitivity, price_elasticity, stock_urgency = profile_scores(totals.get(customer_id))
+            batch.append(Customer(
+                pk=customer_id,
+                discount_sensitivity=discount_sensitivity,
+                price_elasticity=price_elasticity,
+                stock_urgency=stock_urgency,
+                last_profiled=now,
+                profile_watermark=watermark,
+            ))
+        Customer.objects.bulk_update(batch, fields)
+    return len(selected)
@@ -0,0 +1,172 @@
+"""
+Nightly recommendation run over all customers: profile update, then batch
+scoring with the global model, in customer-ID chunks.
+
+Chunks are rows of RecommendationRunChunk, so a run that is interrupted
+(still "running") resumes with the chunks that are not done yet. A chunk
+that fails is retried within the run up to MAX_CHUNK_ATTEMPTS times; a run
+left with failed chunks is closed as "failed" and never resumed, so the
+next run starts fresh and one bad chunk cannot hold back everyone else.
+With workers > 1 the chunks are processed by a process pool; each worker
+opens its own DB connection.
+"""
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.db import connections
+from django.utils import timezone
+from farmer_app.models import Customer, RecommendationRun, RecommendationRunChunk
+from services.profile_updater import update_customer_profiles
+from services.recommendations import refresh_recommendations_batch
+
+STAGES = ("profile", "scoring", "saving")
+
+MAX_CHUNK_ATTEMPTS = 3
+
+
+def start_or_resume_run(chunk_size, fresh=False):
+    """
+    The latest run if it was interrupted (still "running"), or a new one
+    with its chunks planned. A finished run, done or failed, is not resumed.
+
+    Returns:
+        tuple: (run, resumed)
+    """
+    if not fresh:
+        run = RecommendationRun.objects.order_by("-started_at", "-pk").first()
+        if run is not None and run.status == "running":
+            return run, True
+
+    customer_ids = list(Customer.objects.order_by("pk").values_list("pk", flat=True))
+    run = RecommendationRun.objects.create(chunk_size=chunk_size, total_customers=len(customer_ids))
+    RecommendationRunChunk.objects.bulk_create([
+        RecommendationRunChunk(
+            run=run,
+            first_customer_id=customer_ids[start],
+            last_customer_id=customer_ids[min(start + chunk_size, len(customer_ids)) - 1],
+        )
+        for start in range(0, len(customer_ids), chunk_size)
+    ])
+    return run, False
+
+
+def process_chunk(chunk_id):
+    """
+    Runs one chunk and checkpoints it. Executed in the worker processes.
+
+    Returns:
+        dict: chunk id, status, customers and per-stage seconds
+    """
+    chunk = RecommendationRunChunk.objects.get(pk=chunk_id)
+    customer_ids = list(
+        Customer.objects.filter(pk__gte=chunk.first_customer_id, pk__lte=chunk.last_customer_id)
+        .order_by("pk").values_list("pk", flat=True)
+    )
+
+    # Counted up front, so a chunk that kills its worker still uses up attempts
+    chunk.attempts += 1
+    chunk.save(update_fields=["attempts"])
+
+    timings = dict.fromkeys(STAGES, 0.0)
+    try:
+        started = time.perf_counter()
+        update_customer_profiles(customer_ids)
+        timings["profile"] = time.perf_counter() - started
+
+        refresh_recommendations_batch(customer_ids, timings=timings)
+        chunk.status = "done"
+        chunk.error = ""
+    except Exception as e:
+        chunk.status = "failed"
+        chunk.error = f"{type(e).__name__}: {e}"
+
+    chunk.customers = len(customer_ids)
+    chunk.profile_seconds = timings["profile"]
+    chunk.scoring_seconds = timings["scoring"]
+    chunk.saving_seconds = timings["saving"]
+    chunk.finished_at = timezone.now()
+    chunk.save()
+
+    return {
+        "chunk_id": chunk.pk,
+        "first": chunk.first_customer_id,
+        "last": chunk.last_customer_id,
+        "status": chunk.status,
+        "error": chunk.error,
+        "attempts": chunk.attempts,
+        "customers": chunk.customers,
+        **timings,
+    }
+
+
+def _init_worker():
+    # Forked workers must not reuse the parent's sockets; the parent closed
+    # them before forking, so each worker connects on first query
+    import django
+    django.setup()
+
+
+def _chunks_to_run(run, max_attempts):
+    return list(
+        run.chunks.exclude(status="done").filter(attempts__lt=max_attempts)
+        .order_by("first_customer_id").values_list("pk", flat=True)
+    )
+
+
+def run_chunks(run, workers=1, on_result=None, max_attempts=MAX_CHUNK_ATTEMPTS):
+    """
+    Processes every chunk of `run` that is not done yet, retrying failed
+    chunks until they succeed or reach `max_attempts`, then closes the run
+    ("done", or "failed" if any chunk gave up). `on_result(result)` is
+    called as each attempt finishes.
+
+    Returns:
+        dict: customers, chunks, retries, failed, elapsed seconds,
+        throughput and per-stage seconds
+    """
+    summary = {"customers": 0, "chunks": 0, "retries": 0, "failed": 0, **dict.fromkeys(STAGES, 0.0)}
+    started = time.perf_counter()
+
+    def collect(result):
+        if result["attempts"] > 1:
+            summary["retries"] += 1
+        if result["status"] == "done":
+            summary["chunks"] += 1
+            summary["customers"] += result["customers"]
+        for stage in STAGES:
+            summary[stage] += result[stage]
+        if on_result:
+            on_result(result)
+
+    chunk_ids = _chunks_to_run(run, max_attempts)
+    pool = None
+    try:
+        while chunk_ids:
+            if workers <= 1 or len(chunk_ids) <= 1:
+                for chunk_id in chunk_ids:
+                    collect(process_chunk(chunk_id))
+            else:
+                if pool is None:
+                    connections.close_all()
+                    methods = multiprocessing.get_all_start_methods()
+                    context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+                    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker)
+                futures = [pool.submit(process_chunk, chunk_id) for chunk_id in chunk_ids]
+                for future in as_completed(futures):
+                    collect(future.result())
+            # Next pass: the chunks that failed and have attempts left
+            chunk_ids = _chunks_to_run(run, max_attempts)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    elapsed = time.perf_counter() - started
+    summary["elapsed"] = elapsed
+    summary["throughput"] = summary["customers"] / elapsed if elapsed > 0 else 0.0
+
+    summary["failed"] = run.chunks.exclude(status="done").count()
+    run.status = "failed" if summary["failed"] else "done"
+    run.finished_at = timezone.now()
+    run.save(update_fields=["status", "finished_at"])
+    return summary
@@ -1,10 +1,22 @@
-from farmer_app.models import CustomerAction, CustomerRecommendation
+from farmer_app.models import CustomerAction, CustomerCropStats, CustomerRecommendation
 from farmer_app.models import Customer # <-- Ensure Customer is imported!
-from sklearn.preprocessing import MinMaxScaler
+from services.action_stats import ACTION_SCORES, INTEREST_DECAY_PER_DAY
+from services.crop_catalog import crop_name, resolve_crop_id
+from services.crop_neighbors import popular_crops, related_crops
+from services.customer_feed import refresh_feeds
+from services.profile_updater import COLD_START_PROFILE, profiles_from_actions
+from ml_model import recommendation_model
+import datetime
+import logging
+import time
 import pandas as pd
 import numpy as np
+from django.db import NotSupportedError, transaction
+from django.db.models import Avg, Case, Count, FloatField, Func, Q, Sum, Value, When
+from django.db.models.functions import Exp
 from django.utils import timezone
-from sklearn.ensemble import RandomForestClassifier
+
+logger = logging.getLogger(__name__)
 
 # Define the full list of features for scaling and training
 # NOTE: The order matters and must be consistent.
@@ -14,100 +26,361 @@ FEATURE_COLUMNS = [
     "discount_sensitivity", "price_elasticity", "stock_urgency" # <-- NEW PROFILE FEATURES
 ]
 
-ACTION_SCORES = {"ADD": 1, "REMOVE": -1, "PURCHASE": 3}
+PROFILE_COLUMNS = ["discount_sensitivity", "price_elasticity", "stock_urgency"]
+ACTION_FEATURE_COLUMNS = [column for column in FEATURE_COLUMNS if column not in PROFILE_COLUMNS]
+TOTAL_COLUMNS = ["add_count", "remove_count", "purchase_count", "price_sum", "discount_sum", "stock_sum"]
 
-def get_customer_recommendations(customer):
+
+# Candidate generation from CropNeighbor (services/crop_neighbors.py)
+COLD_START_CROPS = 5
+SEED_CROPS = 3
+RELATED_PER_SEED = 5
+
+# Stored probabilities that moved less than this are not rewritten
+RECOMMENDATION_EPSILON = 1e-3
+
+
+def cold_start_recommendations():
+    """Most purchased crops (share of customers who bought them) for customers with no actions."""
+    popular = popular_crops(COLD_START_CROPS)
+    if popular:
+        return [{"crop_id": crop_id, "purchase_prob": share} for crop_id, share in popular]
+
+    # build_crop_neighbors has not run yet
+    return [
+        {"crop_id": resolve_crop_id("Wheat"), "purchase_prob": 0.1},
+        {"crop_id": resolve_crop_id("Rice"), "purchase_prob": 0.05},
+    ]
+
+
+def add_related_crops(results):
+    """
+    Appends to each customer's ranked list the co-purchase neighbours of
+    their SEED_CROPS best crops that they have not touched yet, scored
+    seed purchase_prob * neighbour similarity. One query for the batch.
+    """
+    seeds = {customer_id: recs[:SEED_CROPS] for customer_id, recs in results.items()}
+    related = related_crops({rec["crop_id"] for recs in seeds.values() for rec in recs}, RELATED_PER_SEED)
+    if not related:
+        return results
+
+    for customer_id, recs in results.items():
+        touched = {rec["crop_id"] for rec in recs}
+        candidates = {}
+        for seed in seeds[customer_id]:
+            for neighbor_id, score in related.get(seed["crop_id"], []):
+                if neighbor_id not in touched:
+                    candidates[neighbor_id] = max(candidates.get(neighbor_id, 0.0), seed["purchase_prob"] * score)
+        if candidates:
+            recs.extend({"crop_id": crop_id, "purchase_prob": prob} for crop_id, prob in candidates.items())
+            recs.sort(key=lambda rec: rec["purchase_prob"], reverse=True)
+    return results
+
+
+# ---------------- Feature engineering ----------------
+class _EpochSeconds(Func):
+    """Seconds since 1970-01-01 UTC of a datetime expression, as a float."""
+    output_field = FloatField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f"_EpochSeconds is not implemented for {connection.vendor}")
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template="EXTRACT(EPOCH FROM %(expressions)s)::double precision", **extra_context
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # Datetimes are stored as UTC text; julianday() parses it with the microseconds
+        return super().as_sql(
+            compiler, connection, template="((julianday(%(expressions)s) - 2440587.5) * 86400.0)", **extra_context
+        )
+
+
+def action_feature_matrix(actions, now):
     """
-    Analyzes customer actions, integrates customer profile scores, 
-    scales data, and generates effective recommendations.
+    ACTION_FEATURE_COLUMNS per (customer, crop) of a CustomerAction
+    queryset, valued at `now`. Counts, averages and the recency-weighted
+    score are aggregated in SQL, so one row per pair leaves the database.
+
+    Returns:
+        tuple: (keys, X) NumPy arrays; keys holds (customer_id, crop_id)
+        per row (sorted), X the features in ACTION_FEATURE_COLUMNS order
     """
-    # FIX: We filter the actions using the primary key (pk) of the customer 
-    # instead of passing the object directly, which resolves the FieldError.
-    actions = CustomerAction.objects.filter(customer_id=customer.pk)
-    print(f"[DEBUG] Customer {customer.pk}: Found {actions.count()} actions")
+    score = Case(
+        *[When(action=action, then=Value(float(points))) for action, points in ACTION_SCORES.items()],
+        output_field=FloatField(),
+    )
+    age_days = (Value(now.timestamp()) - _EpochSeconds("timestamp")) / Value(60*60*24.0)
+
+    rows = actions.order_by().values("customer_id_id", "crop_id").annotate(
+        total_weighted_score=Sum(score * Exp(Value(-INTEREST_DECAY_PER_DAY) * age_days)),
+        add_count=Count("id", filter=Q(action="ADD")),
+        remove_count=Count("id", filter=Q(action="REMOVE")),
+        purchase_count=Count("id", filter=Q(action="PURCHASE")),
+        avg_price=Avg("price_at_action", output_field=FloatField()),
+        avg_discount=Avg("discount_at_action", output_field=FloatField()),
+        avg_stock=Avg("stock_at_action", output_field=FloatField()),
+    ).order_by("customer_id_id", "crop_id").values_list("customer_id_id", "crop_id", *ACTION_FEATURE_COLUMNS)
+
+    data = np.array(list(rows), dtype=float).reshape(-1, 2 + len(ACTION_FEATURE_COLUMNS))
+    return data[:, :2].astype(np.int64), data[:, 2:]
 
-    # 1. HANDLE NO DATA (Cold Start)
-    if not actions.exists():
-        # ... (Cold start logic remains the same)
-        recommendations = [{"crop": "Wheat", "purchase_prob": 0.1}, {"crop": "Rice", "purchase_prob": 0.05}]
+
+def _join_profiles(features, profiles):
+    """Broadcasts each customer's profile to all of their crops."""
+    features = features.join(profiles[PROFILE_COLUMNS], on="customer_id")
+    features[PROFILE_COLUMNS] = features[PROFILE_COLUMNS].fillna(0.0)
+    return features
+
+
+def build_features(totals, weighted, profiles):
+    """
+    One row per (customer, crop) with FEATURE_COLUMNS.
+
+    totals:   DataFrame of customer_id, crop_id and TOTAL_COLUMNS
+    weighted: Series of weighted scores on (customer_id, crop_id)
+    profiles: DataFrame of PROFILE_COLUMNS indexed by customer_id
+    """
+    features = totals.copy()
+    for column in TOTAL_COLUMNS:
+        features[column] = features[column].astype(float)
+
+    action_count = (features["add_count"] + features["remove_count"] + features["purchase_count"]).clip(lower=1)
+    features["avg_price"] = features["price_sum"] / action_count
+    features["avg_discount"] = features["discount_sum"] / action_count
+    features["avg_stock"] = features["stock_sum"] / action_count
+
+    keys = pd.MultiIndex.from_frame(features[["customer_id", "crop_id"]])
+    features["total_weighted_score"] = weighted.reindex(keys).fillna(0.0).to_numpy() if len(weighted) else 0.0
+    return _join_profiles(features, profiles)
+
+
+def serving_features(customers):
+    """Current features of a batch of customers: one rollup query, no action history."""
+    customer_ids = [customer.pk for customer in customers]
+
+    # Counts, sums and interest scores per crop come from the CustomerCropStats rollup
+    totals = pd.DataFrame(
+        list(CustomerCropStats.objects.filter(customer_id__in=customer_ids)
+             .exclude(add_count=0, remove_count=0, purchase_count=0)
+             .values("customer_id", "crop_id", *TOTAL_COLUMNS, "interest_score", "interest_at")),
+        columns=["customer_id", "crop_id", *TOTAL_COLUMNS, "interest_score", "interest_at"],
+    )
+    if totals.empty:
+        return totals
+
+    # Decay each stored interest score to now
+    age = (timezone.now() - pd.to_datetime(totals["interest_at"], utc=True)).dt.total_seconds() / (60*60*24)
+    weighted = pd.Series(
+        (totals["interest_score"] * np.exp(-INTEREST_DECAY_PER_DAY * age)).fillna(0.0).to_numpy(),
+        index=pd.MultiIndex.from_frame(totals[["customer_id", "crop_id"]]),
+    )
+
+    profiles = pd.DataFrame(
+        [[getattr(customer, column, 0.0) for column in PROFILE_COLUMNS] for customer in customers],
+        index=pd.Index(customer_ids, name="customer_id"),
+        columns=PROFILE_COLUMNS,
+    )
+    return build_features(totals, weighted, profiles)
+
+
+# ---------------- Scoring ----------------
+def score_customers(customers):
+    """
+    Scores a batch of customers with the global model in one predict call,
+    then adds related crops they have not touched yet.
+
+    Returns:
+        dict: {customer_id: [{"crop_id", "purchase_prob"}, ...] best first}
+    """
+    cold_start = cold_start_recommendations()
+    results = {customer.pk: [dict(rec) for rec in cold_start] for customer in customers}
+    features = serving_features(customers)
+    if features.empty:
+        return results
+
+    artifact = recommendation_model.load_model()
+    if artifact is not None and artifact["feature_columns"] == FEATURE_COLUMNS:
+        features["purchase_prob"] = recommendation_model.predict_proba(artifact, features[FEATURE_COLUMNS].to_numpy())
     else:
-        # 1.5. RETRIEVE CUSTOMER PROFILE SCORES (NEW)
-        # Use getattr() for safety if profile features haven't been calculated yet
-        customer_profile = {
-            "discount_sensitivity": getattr(customer, 'discount_sensitivity', 0.0),
-            "price_elasticity": getattr(customer, 'price_elasticity', 0.0),
-            "stock_urgency": getattr(customer, 'stock_urgency', 0.0)
-        }
-
-        # 2. PREPARE DATA & FEATURE ENGINEERING (Crop-Specific)
-        df = pd.DataFrame(list(actions.values(
-            "crop", "action", "timestamp", "price_at_action", "discount_at_action", "stock_at_action"
-        )))
-
-        # (Calculate weighted score and ensure numerical types - same as existing code)
-        df["score"] = df["action"].map(ACTION_SCORES)
-        df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
-        now = timezone.now()
-        df["recency"] = (now - df["timestamp"]).dt.total_seconds() / (60*60*24)
-        df["recency_weight"] = np.exp(-0.1 * df["recency"])
-        df["weighted_score"] = df["score"] * df["recency_weight"]
-        df['price_at_action'] = pd.to_numeric(df['price_at_action'], errors='coerce')
-        df['discount_at_action'] = pd.to_numeric(df['discount_at_action'], errors='coerce')
-        df['stock_at_action'] = pd.to_numeric(df['stock_at_action'], errors='coerce')
-
-        # Aggregation of Crop-Specific Features
-        features = df.groupby("crop").agg(
-            total_weighted_score=("weighted_score", "sum"), add_count=("score", lambda x: (x==1).sum()),
-            remove_count=("score", lambda x: (x==-1).sum()), purchase_count=("score", lambda x: (x==3).sum()),
-            avg_price=("price_at_action", "mean"), avg_discount=("discount_at_action", "mean"),
-            avg_stock=("stock_at_action", "mean"),
-        ).reset_index()
-
-        # 2.5. BROADCAST CUSTOMER PROFILE TO ALL CROPS (NEW)
-        for key, value in customer_profile.items():
-            features[key] = value
-
-        # 3. ML MODEL TRAINING & PREDICTION
-        features["label"] = (features["purchase_count"] > 0).astype(int)
-        y = features["label"]
-        X_raw = features[FEATURE_COLUMNS] # <-- Use the full feature list
-        
-        # 3a. SCALING (CRITICAL FOR PERFORMANCE)
-        scaler = MinMaxScaler()
-        X = scaler.fit_transform(X_raw)
-
-        # Safety Check (remains the same)
-        if len(features) < 2 or y.nunique() < 2:
-            print("[DEBUG] Not enough data/variance for ML. Using Weighted Score Fallback.")
-            # ... (Fallback logic)
-            max_score = features["total_weighted_score"].max()
-            if max_score <= 0: max_score = 1
-            features["purchase_prob"] = features["total_weighted_score"] / max_score
-            features["purchase_prob"] = features["purchase_prob"].clip(lower=0.01, upper=0.99)
-        else:
-            print("[DEBUG] Running Random Forest Classifier with full Feature set and scaling.")
-            clf = RandomForestClassifier(n_estimators=100, random_state=42)
-            clf.fit(X, y)
-            features["purchase_prob"] = clf.predict_proba(X)[:,1]
-
-        recommendations = features[["crop", "purchase_prob"]].sort_values(
-            "purchase_prob", ascending=False
-        ).to_dict(orient="records")
-
-    # 4. SAVE TO DB (Where Recommendations are Stored)
-    # Recommendations are stored in the CustomerRecommendation table.
-    print(f"[DEBUG] Saving {len(recommendations)} recommendations...")
-    CustomerRecommendation.objects.filter(customer=customer).delete()
-    
-    new_entries = []
-    for rec in recommendations:
-        new_entries.append(CustomerRecommendation(
-            customer=customer,
-            crop=rec["crop"],
-            purchase_prob=rec["purchase_prob"]
-        ))
-    
-    CustomerRecommendation.objects.bulk_create(new_entries)
-    print("[DEBUG] Database updated successfully.")
-
-    return recommendations
\ No newline at end of file
+        # No trained model yet: rank by weighted score, scaled per customer
+        logger.info("No global recommendation model found; ranking by weighted score")
+        max_score = features.groupby("customer_id")["total_weighted_score"].transform("max")
+        max_score = max_score.where(max_score > 0, 1.0)
+        features["purchase_prob"] = (features["total_weighted_score"] / max_score).clip(lower=0.01, upper=0.99)
+
+    ranked = features.sort_values(["customer_id", "purchase_prob"], ascending=[True, False])
+    for customer_id, group in ranked.groupby("customer_id", sort=False):
+        results[customer_id] = group[["crop_id", "purchase_prob"]].to_dict(orient="records")
+    return add_related_crops(results)
+
+
+def save_recommendations_batch(results, epsilon=RECOMMENDATION_EPSILON):
+    """
+    Stores {customer_id: recommendations} in CustomerRecommendation as a
+    diff against the stored rows: upserts new crops and probabilities that
+    moved by `epsilon` or more, deletes only the crops that dropped out.
+    The other rows are left untouched, so readers never see a customer
+    with no recommendations. Changed customers get their CustomerFeed
+    rewritten.
+
+    Returns:
+        dict: written, deleted, changed (customer ids whose rows changed)
+    """
+    stored = {}
+    for pk, customer_id, crop_id, prob in CustomerRecommendation.objects.filter(
+        customer_id__in=list(results)
+    ).values_list("pk", "customer_id", "crop_id", "purchase_prob"):
+        stored[(customer_id, crop_id)] = (pk, prob)
+
+    upserts = []
+    keep = set()
+    changed = set()
+    for customer_id, recommendations in results.items():
+        for rec in recommendations:
+            rec["crop"] = crop_name(rec["crop_id"])
+            key = (customer_id, rec["crop_id"])
+            if key in keep:
+                continue
+            keep.add(key)
+
+            prob = float(rec["purchase_prob"])
+            current = stored.get(key)
+            if current is None or abs(current[1] - prob) >= epsilon:
+                upserts.append(CustomerRecommendation(customer_id=customer_id, crop_id=rec["crop_id"], purchase_prob=prob))
+                changed.add(customer_id)
+
+    dropped = [(key, pk) for key, (pk, _) in stored.items() if key not in keep]
+    changed.update(customer_id for (customer_id, _), _ in dropped)
+
+    with transaction.atomic():
+        CustomerRecommendation.objects.bulk_create(
+            upserts,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["customer", "crop"],
+            update_fields=["purchase_prob"],
+        )
+        if dropped:
+            CustomerRecommendation.objects.filter(pk__in=[pk for _, pk in dropped]).delete()
+
+    # Re-rank the materialized feed of every customer whose rows changed
+    refresh_feeds(changed)
+    return {"written": len(upserts), "deleted": len(dropped), "changed": changed}
+
+
+def save_recommendations(customer_id, recommendations):
+    """Single-customer save_recommendations_batch."""
+    return save_recommendations_batch({customer_id: recommendations})
+
+
+def get_customer_recommendations(customer):
+    """
+    Scores the customer's crops with the global purchase-propensity model
+    and stores the result in CustomerRecommendation.
+    """
+    recommendations = score_customers([customer])[customer.pk]
+    save_recommendations(customer.pk, recommendations)
+    return recommendations
+
+
+def refresh_recommendations_batch(customer_ids, timings=None):
+    """
+    Recomputes and stores recommendations for a batch of customers, then
+    records the action watermark each was computed from. Watermarks are
+    read first, so actions arriving during the run leave a customer stale.
+
+    `timings`, if given, gets "scoring" and "saving" seconds added to it.
+
+    Returns:
+        dict: {customer_id: recommendations}
+    """
+    started = time.perf_counter()
+    customers = list(Customer.objects.filter(pk__in=customer_ids))
+    results = score_customers(customers)
+    scored = time.perf_counter()
+
+    save_recommendations_batch(results)
+    now = timezone.now()
+    for customer in customers:
+        customer.recommendations_watermark = customer.action_watermark
+        customer.recommendations_at = now
+    Customer.objects.bulk_update(customers, ["recommendations_watermark", "recommendations_at"])
+
+    if timings is not None:
+        timings["scoring"] = timings.get("scoring", 0.0) + scored - started
+        timings["saving"] = timings.get("saving", 0.0) + time.perf_counter() - scored
+    return results
+
+
+def refresh_recommendations(customer_id):
+    """Single-customer refresh_recommendations_batch (background recompute)."""
+    return refresh_recommendations_batch([customer_id]).get(customer_id, [])
+
+
+# ---------------- Offline training ----------------
+def training_frame(cutoff):
+    """
+    Labelled (customer, crop) rows for the global model: features as they
+    stood at `cutoff`, label = purchased that crop after `cutoff`.
+
+    The profile features are recomputed from the purchases before `cutoff`;
+    the stored Customer profile already includes the label window.
+    """
+    before = CustomerAction.objects.hot().filter(timestamp__lt=cutoff)
+    keys, X = action_feature_matrix(before, cutoff)
+    if not len(keys):
+        return pd.DataFrame(columns=["customer_id", "crop_id", *FEATURE_COLUMNS])
+
+    features = pd.DataFrame(X, columns=ACTION_FEATURE_COLUMNS)
+    features.insert(0, "customer_id", keys[:, 0])
+    features.insert(1, "crop_id", keys[:, 1])
+    as_of_cutoff = profiles_from_actions(before)
+    customer_ids = features["customer_id"].unique()
+    profiles = pd.DataFrame(
+        [as_of_cutoff.get(customer_id, COLD_START_PROFILE) for customer_id in customer_ids],
+        index=pd.Index(customer_ids, name="customer_id"),
+        columns=PROFILE_COLUMNS,
+    )
+    features = _join_profiles(features, profiles)
+
+    purchased_after = set(
+        CustomerAction.objects.filter(timestamp__gte=cutoff, action="PURCHASE")
+        .values_list("customer_id_id", "crop_id").distinct()
+    )
+    features["label"] = [
+        int((customer_id, crop_id) in purchased_after)
+        for customer_id, crop_id in zip(features["customer_id"], features["crop_id"])
+    ]
+    return features
+
+
+def train_global_model(label_days=30):
+    """Trains and saves the next model version; returns its metadata."""
+    cutoff = timezone.now() - datetime.timedelta(days=label_days)
+    features = training_frame(cutoff)
+    if features.empty:
+        raise ValueError("No customer actions before the label window")
+
+    return recommendation_model.train_model(
+        features[FEATURE_COLUMNS].to_numpy(), features["label"].to_numpy(), FEATURE_COLUMNS
+    )
+
+
+def recommendations_are_stale(customer):
+    return customer.recommendations_watermark != customer.action_watermark
+
+
+def queue_recommendation_refresh(customer):
+    """
+    Queues a background recompute if new actions arrived since the last one
+    (at most one per customer in flight). Returns True while a recompute is
+    queued or running; False when fresh, or when a failed recompute is
+    backing off.
+    """
+    if not recommendations_are_stale(customer):
+        return False
+    from services.background import is_pending, submit_once
+    key = ("recommendations", customer.pk)
+    return submit_once(key, refresh_recommendations, customer.pk) or is_pending(key)
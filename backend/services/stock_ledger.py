@@ -0,0 +1,84 @@
+"""
+Stock changes for Product.quantity (kg) and Market.stock (units).
+
+Every change is a single conditional UPDATE with an F() expression, e.g.
+    UPDATE product SET quantity = quantity - x WHERE id = ? AND quantity >= x
+so concurrent requests cannot lose updates or oversell, and no row or table
+locks are held beyond the statement itself. Each function returns the number
+of affected rows (0 means the stock was not there). The exception is
+deduct_product_quantities, which locks the products it reads so it can tell
+which of many deductions fit.
+"""
+from django.db.models import Case, F, FloatField, IntegerField, Value, When
+from farmer_app.models import Market, Product
+from services.change_counters import bump_on_commit, market_counters
+from services.customer_feed import listings_changed
+
+
+class InsufficientStock(Exception):
+    """Raised inside a transaction to roll it back when a deduction fails."""
+
+    def __init__(self, details):
+        super().__init__("Insufficient stock")
+        self.details = details
+
+
+def deduct_product_quantity(product_id, amount):
+    return Product.objects.filter(
+        pk=product_id, quantity__gte=amount
+    ).update(quantity=F("quantity") - amount)
+
+
+def deduct_product_quantities(amounts):
+    """
+    Deducts {product_id: kg} for many products (inside a transaction): one
+    locked SELECT and one UPDATE ... CASE for the products with enough
+    quantity, however many there are. Returns the ids that did not fit.
+    """
+    if not amounts:
+        return set()
+
+    available = dict(
+        Product.objects.select_for_update().filter(pk__in=list(amounts)).order_by("pk").values_list("pk", "quantity")
+    )
+    fits = {pk: amount for pk, amount in amounts.items() if pk in available and available[pk] >= amount}
+    if fits:
+        needed = Case(
+            *[When(pk=product_id, then=Value(amount)) for product_id, amount in fits.items()],
+            output_field=FloatField(),
+        )
+        Product.objects.filter(pk__in=list(fits)).update(quantity=F("quantity") - needed)
+    return set(amounts) - set(fits)
+
+
+def restore_product_quantity(product_id, amount):
+    return Product.objects.filter(pk=product_id).update(quantity=F("quantity") + amount)
+
+
+def deduct_market_stock_many(quantities):
+    """
+    Deducts {market_id: quantity} for many listings in ONE statement:
+        UPDATE market SET stock = stock - CASE id ... END
+        WHERE id IN (...) AND stock >= CASE id ... END
+    Returns the number of listings updated; anything less than
+    len(quantities) means some listing was short (roll back the transaction).
+    """
+    if not quantities:
+        return 0
+
+    needed = Case(
+        *[When(pk=market_id, then=Value(quantity)) for market_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    updated = Market.objects.filter(
+        pk__in=list(quantities), stock__gte=needed
+    ).update(stock=F("stock") - needed)
+    if updated:
+        # update() skips post_save, so bump the /market/ ETag here
+        bump_on_commit(*market_counters(quantities))
+
+        # ...and drop sold-out listings from the customer feeds
+        sold_out = list(Market.objects.filter(pk__in=list(quantities), stock__lte=0).only("pk", "crop_id", "stock"))
+        if sold_out:
+            listings_changed(sold_out)
+    return updated
@@ -0,0 +1,119 @@
+"""
+Concurrent weather ingestion for every active WeatherLocation.
+
+All locations are fetched from open-meteo on one asyncio event loop with a
+shared httpx.AsyncClient: at most WEATHER_CONCURRENCY requests in flight,
+keep-alive connections reused across requests, and a per-request timeout.
+The reading closest to each location's local time is bulk-upserted into
+LocationWeather (one row per location and day); a location that fails is
+reported and skipped, the rest are still saved.
+
+Settings (all optional):
+    WEATHER_API_URL      forecast endpoint (default open-meteo; the stub in
+                         services/weather_stub.py for offline runs)
+    WEATHER_CONCURRENCY  requests in flight (default 20)
+    WEATHER_TIMEOUT      seconds per request (default 10)
+"""
+import asyncio
+import datetime
+import time
+
+import httpx
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from farmer_app.models import LocationWeather, WeatherLocation
+from services.fetch_weather import closest_hour
+
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+HOURLY_FIELDS = "temperature_2m,cloudcover,precipitation"
+
+
+async def _fetch_location(client, semaphore, url, location):
+    async with semaphore:
+        response = await client.get(url, params={
+            "latitude": location.latitude,
+            "longitude": location.longitude,
+            "hourly": HOURLY_FIELDS,
+            "timezone": "auto",
+        })
+        response.raise_for_status()
+        return response.json()
+
+
+async def fetch_locations(locations, url, concurrency, timeout):
+    """Forecast JSON (or the exception raised) per location, in order."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(timeout), limits=limits) as client:
+        return await asyncio.gather(
+            *[_fetch_location(client, semaphore, url, location) for location in locations],
+            return_exceptions=True,
+        )
+
+
+def _reading(location, data, fetched_at):
+    # Hourly times are local to the location (timezone=auto)
+    utc_now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    local_now = utc_now + datetime.timedelta(seconds=data.get("utc_offset_seconds", 0))
+    date, temperature, cloudcover, precipitation = closest_hour(data["hourly"], local_now)
+    return LocationWeather(
+        location=location,
+        date=date,
+        temperature=temperature,
+        cloudcover=cloudcover,
+        precipitation=precipitation,
+        fetched_at=fetched_at,
+    )
+
+
+def ingest_weather(locations=None, url=None, concurrency=None, timeout=None):
+    """
+    Fetches every active location (or `locations`) concurrently and upserts
+    today's reading of each.
+
+    Returns:
+        dict: locations, saved, failed [(name, error)], elapsed seconds, locations_per_sec
+    """
+    if locations is None:
+        locations = list(WeatherLocation.objects.filter(active=True).order_by("pk"))
+    url = url or getattr(settings, "WEATHER_API_URL", OPEN_METEO_URL)
+    concurrency = concurrency or getattr(settings, "WEATHER_CONCURRENCY", 20)
+    timeout = timeout or getattr(settings, "WEATHER_TIMEOUT", 10)
+
+    started = time.perf_counter()
+    results = asyncio.run(fetch_locations(locations, url, concurrency, timeout)) if locations else []
+
+    fetched_at = timezone.now()
+    rows = []
+    fetched = []
+    failed = []
+    for location, result in zip(locations, results):
+        try:
+            if isinstance(result, Exception):
+                raise result
+            rows.append(_reading(location, result, fetched_at))
+        except Exception as e:
+            failed.append((location.name, f"{type(e).__name__}: {e}"))
+            continue
+        location.last_fetched_at = fetched_at
+        fetched.append(location)
+
+    with transaction.atomic():
+        LocationWeather.objects.bulk_create(
+            rows,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["location", "date"],
+            update_fields=["temperature", "cloudcover", "precipitation", "fetched_at"],
+        )
+        WeatherLocation.objects.bulk_update(fetched, ["last_fetched_at"], batch_size=500)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "locations": len(locations),
+        "saved": len(rows),
+        "failed": failed,
+        "elapsed": elapsed,
+        "locations_per_sec": len(locations) / elapsed if elapsed > 0 else 0.0,
+    }
@@ -0,0 +1,142 @@
+"""
+Weather refresh: fetch today's weather and re-run the 7-day prediction
+off the request path.
+
+`manage.py refresh_weather --interval N` refreshes every N seconds (or once,
+from cron). The weather endpoints only read WeatherData/WeatherPrediction;
+when the last refresh is older than WEATHER_REFRESH_INTERVAL they serve what
+is stored and queue one background refresh (stale-while-revalidate).
+
+The time of the last successful refresh is the "weather_refresh"
+ChangeCounter row (changed_at), which is also part of the endpoint ETag.
+
+Every gunicorn worker (and the command) may try to refresh, so a refresh
+first claims the "weather_refresh_claim" ChangeCounter row with a
+conditional UPDATE; its changed_at is the time until which it is claimed.
+Only the process whose UPDATE matched runs fetch + predict, the others
+return without touching the CSV or WeatherPrediction.
+
+Settings (all optional):
+    WEATHER_REFRESH_INTERVAL  seconds before the data counts as stale (default 3600)
+    WEATHER_RETRY_AFTER       seconds between refresh attempts while the
+                              upstream API keeps failing (default 60)
+    WEATHER_REFRESH_LEASE     seconds a claim holds off other refreshes while
+                              one runs (default 600)
+"""
+import datetime
+import functools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from farmer_app.models import ChangeCounter
+from services.change_counters import bump
+
+logger = logging.getLogger(__name__)
+
+COUNTER = "weather_refresh"
+CLAIM = "weather_refresh_claim"
+
+_lock = threading.Lock()
+_last_attempt = 0.0  # monotonic time of the last queued refresh in this process
+
+
+def claim_refresh():
+    """
+    Claims the refresh for WEATHER_REFRESH_LEASE seconds across all
+    processes. True if this caller won the claim.
+    """
+    now = timezone.now()
+    until = now + datetime.timedelta(seconds=getattr(settings, "WEATHER_REFRESH_LEASE", 600))
+    claimed = ChangeCounter.objects.filter(name=CLAIM, changed_at__lte=now).update(
+        version=F("version") + 1, changed_at=until
+    )
+    if claimed:
+        return True
+    # First refresh ever: whoever inserts the row holds the claim
+    _, created = ChangeCounter.objects.get_or_create(name=CLAIM, defaults={"version": 1, "changed_at": until})
+    return created
+
+
+def release_refresh(retry_after=0):
+    """Ends the claim; the next refresh may start `retry_after` seconds from now."""
+    ChangeCounter.objects.filter(name=CLAIM).update(
+        changed_at=timezone.now() + datetime.timedelta(seconds=retry_after)
+    )
+
+
+def refresh_weather():
+    """
+    Fetches today's weather, re-runs the prediction and stamps the refresh.
+    Returns False (and does nothing) if another process holds the claim.
+    """
+    from ml_model.weather_predictor import predict_next_7_days
+    from services.fetch_weather import fetch_and_save_weather
+
+    if not claim_refresh():
+        logger.info("Weather refresh already claimed by another process; skipping")
+        return False
+
+    try:
+        fetch_and_save_weather()
+        predict_next_7_days()
+    except Exception:
+        # Failing upstream: hold off every process for WEATHER_RETRY_AFTER
+        release_refresh(getattr(settings, "WEATHER_RETRY_AFTER", 60))
+        raise
+    bump(COUNTER)
+    release_refresh()
+    return True
+
+
+def refreshed_at():
+    """Time of the last successful refresh, or None."""
+    return ChangeCounter.objects.filter(name=COUNTER).values_list("changed_at", flat=True).first()
+
+
+def is_stale(at):
+    interval = getattr(settings, "WEATHER_REFRESH_INTERVAL", 3600)
+    return at is None or timezone.now() - at > datetime.timedelta(seconds=interval)
+
+
+def queue_weather_refresh(at):
+    """
+    Queues a background refresh if the data refreshed at `at` is stale (at
+    most one queued per WEATHER_RETRY_AFTER per process; the claim in
+    refresh_weather keeps it to one run across processes).
+    Returns True while stale.
+    """
+    global _last_attempt
+
+    if not is_stale(at):
+        return False
+
+    with _lock:
+        now = time.monotonic()
+        if now - _last_attempt < getattr(settings, "WEATHER_RETRY_AFTER", 60):
+            return True
+        _last_attempt = now
+
+    from services.background import submit_once
+    submit_once(COUNTER, refresh_weather)
+    return True
+
+
+def serve_stale_while_revalidate(view):
+    """
+    View decorator (outside conditional_on, so it also runs for 304s):
+    queues a refresh when stale and flags the response with
+    X-Weather-Refreshing.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.weather_refreshed_at = refreshed_at()
+        refreshing = queue_weather_refresh(request.weather_refreshed_at)
+        response = view(request, *args, **kwargs)
+        if refreshing:
+            response["X-Weather-Refreshing"] = "1"
+        return response
+    return wrapper
@@ -0,0 +1,93 @@
+"""
+Local stand-in for the open-meteo forecast endpoint, for offline runs and
+benchmarks of services/weather_ingest.py:
+
+    with StubWeatherServer(latency=0.05) as stub:
+        ingest_weather(url=stub.url)
+
+Answers every GET with 48 hourly values around the current time, in the
+location's approximate local time (longitude / 15 hours), after `latency`
+seconds. HTTP/1.1 keep-alive, one thread per connection. Locations whose
+latitude is in `fail_latitudes` get a 503 instead (partial failures).
+"""
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def forecast(latitude, longitude, now=None):
+    offset = round(longitude / 15) * 3600
+    now = now or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    start = (now + datetime.timedelta(seconds=offset)).replace(minute=0, second=0, microsecond=0)
+    times = [start + datetime.timedelta(hours=h) for h in range(-24, 24)]
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
+        "utc_offset_seconds": offset,
+        "hourly": {
+            "time": [t.strftime("%Y-%m-%dT%H:%M") for t in times],
+            "temperature_2m": [round(20 + latitude / 10 + (t.hour - 12) / 4, 1) for t in times],
+            "cloudcover": [(t.hour * 7) % 100 for t in times],
+            "precipitation": [round(((t.hour * 13) % 10) / 10, 1) for t in times],
+        },
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; don't let Nagle delay the body
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        try:
+            latitude, longitude = float(params["latitude"][0]), float(params["longitude"][0])
+            body = json.dumps(forecast(latitude, longitude)).encode()
+            status = 200
+        except (KeyError, ValueError):
+            body = b'{"error": true, "reason": "latitude and longitude are required"}'
+            status = 400
+        else:
+            if latitude in self.server.fail_latitudes:
+                body = b'{"error": true, "reason": "unavailable"}'
+                status = 503
+
+        time.sleep(self.server.latency)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for a burst of concurrent connects
+    request_queue_size = 1024
+
+
+class StubWeatherServer:
+    def __init__(self, latency=0.0, host="127.0.0.1", port=0, fail_latitudes=()):
+        self.server = _Server((host, port), _Handler)
+        self.server.latency = latency
+        self.server.fail_latitudes = set(fail_latitudes)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/forecast"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -61,9 +61,22 @@ const SellCrop = () => {
   // -------------------------------------------------
   useEffect(() => {
     if (!farmer_id) return;
-    fetch(`http://localhost:8000/market/?farmer_id=${farmer_id}`)
-      .then((res) => res.json())
-      .then((data) => setCropsInMarket(data))
+
+    // /market/ is cursor-paginated: follow `next` until every listing is loaded
+    const fetchAllListings = async () => {
+      let url = `http://localhost:8000/market/?farmer_id=${farmer_id}&page_size=200`;
+      const listings = [];
+      while (url) {
+        const res = await fetch(url);
+        const data = await res.json();
+        listings.push(...data.results);
+        url = data.next;
+      }
+      return listings;
+    };
+
+    fetchAllListings()
+      .then((listings) => setCropsInMarket(listings))
       .catch((err) =>
         console.error("Failed to fetch market listings:", err)
       );
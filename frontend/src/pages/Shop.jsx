@@ -9,7 +9,8 @@ import styles from "./Shop.module.css";
 
 function Shop() {
   const [items, setItems] = useState([]);
-  const [filteredItems, setFilteredItems] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
+  const [cropNames, setCropNames] = useState([]);
   const [farmers, setFarmers] = useState({});
   const [customer, setCustomer] = useState(null);
   const [cartId, setCartId] = useState(null);
@@ -42,28 +43,48 @@ function Shop() {
       .catch(console.log);
   }, []);
 
-  const fetchMarketItems = () => {
-    fetch("http://127.0.0.1:8000/market/")
+  // Crop names for the filter (the listings are only loaded a page at a time)
+  useEffect(() => {
+    fetch("http://127.0.0.1:8000/crop-prices/")
+      .then((res) => res.json())
+      .then((data) => setCropNames(Array.from(new Set(data.map((c) => c.crop))).sort()))
+      .catch(console.log);
+  }, []);
+
+  // Search, crop, price and sort run on the server (/market/ query params);
+  // further pages are cursor links followed by "Load more"
+  const marketUrl = () => {
+    const params = new URLSearchParams({ page_size: "50" });
+    const crop = search.trim() || (cropType !== "All" ? cropType : "");
+    if (crop) params.set("product_name", crop);
+    params.set("max_price", priceRange[1]);
+    params.set("ordering", { Cheapest: "price", Highest: "-price" }[sortType] || "-date_added");
+    return `http://127.0.0.1:8000/market/?${params}`;
+  };
+
+  const fetchMarketPage = (url, append) => {
+    fetch(url)
       .then((res) => res.json())
       .then((data) => {
-        const updated = data.map((item) => ({ ...item, qty: 1 }));
-        updated.sort((a, b) => new Date(b.date_added) - new Date(a.date_added));
-        setItems(updated);
-        setFilteredItems(updated);
-        updated.forEach((item) => item.stock <= 0 && deleteMarketItem(item.id));
+        const page = data.results.map((item) => ({ ...item, qty: 1 }));
+        setItems((prev) => (append ? [...prev, ...page] : page));
+        setNextPage(data.next);
+        page.forEach((item) => item.stock <= 0 && deleteMarketItem(item.id));
       })
       .catch(console.log);
   };
 
-  useEffect(() => fetchMarketItems(), []);
+  useEffect(() => {
+    const timer = setTimeout(() => fetchMarketPage(marketUrl(), false), 300);
+    return () => clearTimeout(timer);
+  }, [search, cropType, sortType, priceRange]);
+
+  const loadMore = () => nextPage && fetchMarketPage(nextPage, true);
 
   const deleteMarketItem = async (itemId) => {
     try {
       const res = await fetch(`http://127.0.0.1:8000/market/${itemId}/`, { method: "DELETE" });
-      if (res.ok) {
-        setItems((prev) => prev.filter((i) => i.id !== itemId));
-        setFilteredItems((prev) => prev.filter((i) => i.id !== itemId));
-      }
+      if (res.ok) setItems((prev) => prev.filter((i) => i.id !== itemId));
     } catch (err) { console.log(err); }
   };
 
@@ -93,19 +114,8 @@ function Shop() {
     items.forEach((item) => fetchFarmerName(item.farmer));
   }, [items, customer]);
 
-  useEffect(() => {
-    let updated = [...items];
-    if (search) updated = updated.filter((i) => i.product_name.toLowerCase().includes(search.toLowerCase()));
-    if (cropType !== "All") updated = updated.filter((i) => i.product_name === cropType);
-    updated = updated.filter((i) => i.price >= priceRange[0] && i.price <= priceRange[1]);
-    if (sortType === "Cheapest") updated.sort((a,b)=>a.price-b.price);
-    else if(sortType==="Highest") updated.sort((a,b)=>b.price-a.price);
-    else updated.sort((a,b)=>new Date(b.date_added)-new Date(a.date_added));
-    setFilteredItems(updated);
-  }, [search, cropType, sortType, priceRange, items]);
-
-  const increaseQty = (id) => setFilteredItems(prev => prev.map(i => i.id===id && i.qty<i.stock ? {...i, qty:i.qty+1} : i));
-  const decreaseQty = (id) => setFilteredItems(prev => prev.map(i => i.id===id && i.qty>1 ? {...i, qty:i.qty-1} : i));
+  const increaseQty = (id) => setItems(prev => prev.map(i => i.id===id && i.qty<i.stock ? {...i, qty:i.qty+1} : i));
+  const decreaseQty = (id) => setItems(prev => prev.map(i => i.id===id && i.qty>1 ? {...i, qty:i.qty-1} : i));
 
   const addToCart = async (item) => {
     if (!cartId) return alert("Cart not ready.");
@@ -131,11 +141,11 @@ function Shop() {
     <div className={styles.shopContainer}>
       <div className={styles.filterSidebar}>
         <h2>Filters</h2>
-        <input type="text" placeholder="Search crop..." value={search} onChange={(e)=>setSearch(e.target.value)} className={styles.searchBar}/>
+        <input type="text" placeholder="Search crop name..." value={search} onChange={(e)=>setSearch(e.target.value)} className={styles.searchBar}/>
         <label>Crop Type</label>
         <select value={cropType} onChange={(e)=>setCropType(e.target.value)}>
           <option value="All">All</option>
-          {Array.from(new Set(items.map(i=>i.product_name))).map(crop=><option key={crop} value={crop}>{crop}</option>)}
+          {cropNames.map(crop=><option key={crop} value={crop}>{crop}</option>)}
         </select>
         <label>Max Price</label>
         <input type="range" min="0" max="10000" value={priceRange[1]} onChange={e=>setPriceRange([0, Number(e.target.value)])}/>
@@ -175,8 +185,8 @@ function Shop() {
         <div className={styles.shopItems}>
           <h1>Available Crops</h1>
           <div className={styles.itemGrid}>
-            {filteredItems.length===0 ? <p>No items match your filters.</p> :
-              filteredItems.map(item=>(
+            {items.length===0 ? <p>No items match your filters.</p> :
+              items.map(item=>(
                 <div key={item.id} className={styles.itemCard}>
                   <img src={cropImages[item.product_name]||cropImages.Default} alt={item.product_name} className={styles.itemImg}/>
                   <h3>{item.product_name}</h3>
@@ -195,6 +205,7 @@ function Shop() {
                 </div>
               ))}
           </div>
+          {nextPage && <button className={styles.loadMore} onClick={loadMore}>Load more</button>}
         </div>
       </div>
     </div>